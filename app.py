@@ -5,9 +5,13 @@ import os
 os.environ["CUDA_VISIBLE_DEVICES"] = ""          # Desabilita GPU
 os.environ["ULTRALYTICS_FORCE_CPU"] = "1"        # Força CPU no Ultralytics
 os.environ["PYTORCH_ENABLE_MPS_FALLBACK"] = "1"  # Evita MPS em Macs sem suporte
-os.environ.setdefault("OMP_NUM_THREADS", "4")    # (opcional) limita threads
 
-import io, json, time, uuid, math, mimetypes, traceback
+# Threads/lote/workers medidos para esta CPU (autotune.py). Precisa vir antes de importar
+# torch/cv2; sem perfil salvo, valem os padrões das libs (todos os núcleos).
+import autotune
+autotune.apply_env()
+
+import io, json, time, math, mimetypes, traceback
 from datetime import datetime, timedelta
 from urllib.parse import quote
 from flask import Flask, render_template, request, jsonify, Response, send_file, abort
@@ -16,7 +20,17 @@ from werkzeug.utils import secure_filename
 
 # wrappers com o contrato exigido
 # (OBS: yolo_counter também deve respeitar device='cpu' e half=False, ver nota abaixo)
-from yolo_counter import process_video, process_stream
+from yolo_counter import (process_video, process_stream, YOLO_AVAILABLE, get_model_pool, model_pool_stats,
+                          counting_settings, clamp_workers)
+import crossings
+import detection_cache
+import result_cache
+import chunked_upload
+import video_meta
+import detector
+import zones
+import profiling
+from jobs import JobManager, JOB_WORKERS, JOB_INTERACTIVE_WORKERS, PRIORITY_BATCH, PRIORITY_INTERACTIVE, parse_priority
 
 # Configuração básica
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
@@ -29,11 +43,14 @@ os.makedirs(OUTPUTS_DIR, exist_ok=True)
 
 app = Flask(__name__)
 
+RESULTS_DIR = os.path.abspath(result_cache.RESULT_CACHE_DIR)
+
 def _cleanup_old_files(hours=48):
-    """Remove arquivos com mais de 'hours' horas em uploads/ e outputs/."""
+    """Remove arquivos com mais de 'hours' horas em uploads/ e outputs/ (menos o cache de resultados)."""
     cutoff = time.time() - hours * 3600
     for dirp in (UPLOADS_DIR, OUTPUTS_DIR):
-        for root, _, files in os.walk(dirp):
+        for root, dirs, files in os.walk(dirp):
+            dirs[:] = [d for d in dirs if os.path.join(root, d) != RESULTS_DIR]  # LRU próprio
             for f in files:
                 p = os.path.join(root, f)
                 try:
@@ -44,69 +61,356 @@ def _cleanup_old_files(hours=48):
 
 _cleanup_old_files()
 
+# Pool de modelos com uma instância por thread de job (um job pausado por prioridade segura
+# seu modelo; com menos instâncias o preview poderia esperar por ele).
+# Pré-carrega/aquece no boot (YOLO_PRELOAD=0 desliga) — evita pico no 1º request
+if YOLO_AVAILABLE:
+    try:
+        _pool = get_model_pool(size=max(int(os.environ.get("YOLO_POOL_SIZE", "0") or 0),
+                                        JOB_WORKERS + JOB_INTERACTIVE_WORKERS))
+        if os.environ.get("YOLO_PRELOAD", "1") != "0":
+            _pool.warmup(1)
+    except Exception:
+        app.logger.exception("Falha ao pré-carregar modelo YOLO")
+autotune.startup(YOLO_AVAILABLE, app.logger)
+
 @app.route("/")
 def index():
     # Renderiza templates/index.html
     return render_template("index.html")
 
+UPLOADS = chunked_upload.UploadStore(UPLOADS_DIR, ALLOWED_EXT)
+
+def _upload_response(done, status=200):
+    rel_path = os.path.relpath(done["path"], BASE_DIR).replace("\\", "/")
+    return jsonify({"ok": True, "video_path": rel_path, "sha256": done["sha256"], "size": done["size"],
+                    "dedup": done["dedup"], "meta": done["meta"]}), status
+
+def _upload_error(e):
+    return jsonify({"ok": False, "error": str(e), **e.extra}), e.status
+
 @app.route("/upload", methods=["POST"])
 def upload():
-    """Recebe o vídeo, valida extensão e grava em uploads/ com nome único."""
+    """Recebe o vídeo de uma vez (multipart), valida extensão e grava em uploads/ pelo hash."""
     if "video" not in request.files:
         return jsonify({"ok": False, "error": "Arquivo 'video' não encontrado."}), 400
     f = request.files["video"]
     if not f or f.filename == "":
         return jsonify({"ok": False, "error": "Nenhum arquivo selecionado."}), 400
+    try:
+        return _upload_response(UPLOADS.ingest(f.stream, secure_filename(f.filename)))
+    except chunked_upload.UploadError as e:
+        return _upload_error(e)
 
-    filename = secure_filename(f.filename)
-    ext = os.path.splitext(filename)[1].lower()
-    if ext not in ALLOWED_EXT:
-        return jsonify({"ok": False, "error": "Extensão inválida. Use mp4/avi/mkv/mov."}), 400
+# Upload em partes (arquivos grandes, retomável):
+#   POST   /uploads {filename, size?}         -> {upload_id, offset, chunk_size}
+#   PUT    /uploads/<id>?offset=N  (corpo = bytes do bloco; ou header Upload-Offset)
+#   GET    /uploads/<id>                      -> offset atual (para retomar)
+#   POST   /uploads/<id>/finalize {sha256?}   -> {video_path, sha256, meta}
+#   DELETE /uploads/<id>
+@app.route("/uploads", methods=["POST"])
+def upload_init():
+    data = request.get_json(silent=True) or {}
+    try:
+        size = data.get("size")
+        sess = UPLOADS.create(secure_filename(str(data.get("filename") or "")),
+                              int(size) if size is not None else None)
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "size inválido."}), 400
+    except chunked_upload.UploadError as e:
+        return _upload_error(e)
+    return jsonify({"ok": True, **sess.status()}), 201
 
-    uniq = f"{uuid.uuid4().hex}{ext}"
-    path = os.path.join(UPLOADS_DIR, uniq)
-    f.save(path)
-    rel_path = os.path.relpath(path, BASE_DIR).replace("\\", "/")
-    return jsonify({"ok": True, "video_path": rel_path})
+@app.route("/uploads/<upload_id>", methods=["GET", "PUT", "DELETE"])
+def upload_chunk(upload_id):
+    try:
+        if request.method == "GET":
+            return jsonify({"ok": True, **UPLOADS.get(upload_id).status()})
+        if request.method == "DELETE":
+            UPLOADS.abort(upload_id)
+            return jsonify({"ok": True})
+        sess = UPLOADS.get(upload_id)
+        try:
+            offset = int(request.headers.get("Upload-Offset", request.args.get("offset", sess.offset)))
+        except ValueError:
+            return jsonify({"ok": False, "error": "offset inválido."}), 400
+        # request.stream: lê o corpo direto do socket, bloco a bloco
+        new_offset = sess.write(request.stream, offset, request.content_length)
+        return jsonify({"ok": True, "upload_id": sess.id, "offset": new_offset, "size": sess.size})
+    except chunked_upload.UploadError as e:
+        return _upload_error(e)
 
-@app.route("/process", methods=["POST"])
-def process_batch():
-    """Processamento em lote: chama process_video e devolve payload completo."""
+@app.route("/uploads/<upload_id>/finalize", methods=["POST"])
+def upload_finalize(upload_id):
+    data = request.get_json(silent=True) or {}
     try:
-        data = request.get_json(force=True)
-        video_path = data.get("video_path")
-        if not video_path:
-            return jsonify({"ok": False, "error": "video_path ausente."}), 400
-
-        # Normaliza caminho relativo
-        abs_video = os.path.abspath(os.path.join(BASE_DIR, video_path))
-        if not abs_video.startswith(UPLOADS_DIR):
-            return jsonify({"ok": False, "error": "Caminho inválido."}), 400
-        if not os.path.exists(abs_video):
-            return jsonify({"ok": False, "error": "Arquivo não encontrado."}), 404
-
-        line = data.get("line", [])
-        if not (isinstance(line, list) and len(line) == 4):
-            return jsonify({"ok": False, "error": "Linha inválida (x1,y1,x2,y2)."}), 400
-
-        sample_fps = float(data.get("sample_fps", 5.0))
-        chunk_seconds = int(data.get("chunk_seconds", 60))
-        workers = int(data.get("workers", 0))
-        save_annotated = bool(data.get("save_annotated", True))
+        return _upload_response(UPLOADS.finalize(upload_id, data.get("sha256")))
+    except chunked_upload.UploadError as e:
+        return _upload_error(e)
 
+# ======= Metadados e prévias =======
+# Sondados uma vez (no finalize do upload) e lidos do sidecar: a tela da linha mostra o
+# frame sem carregar o vídeo no navegador.
+@app.route("/video/meta")
+def video_info():
+    """fps, frames, resolução, duração e hash; keyframes=1 inclui o índice de keyframes."""
+    abs_video, err = _resolve_video(request.args.get("video_path", ""))
+    if err:
+        return err
+    want_kf = request.args.get("keyframes", "0").lower() in ("1", "true", "on", "yes")
+    try:
+        meta = video_meta.get(abs_video, keyframes=want_kf)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 422
+    return jsonify({"ok": True, **video_meta.public(meta, keyframes=want_kf)})
+
+@app.route("/video/preview")
+def video_preview():
+    """JPEG reduzido do frame em t (s); snap=key usa o keyframe anterior (mais rápido)."""
+    abs_video, err = _resolve_video(request.args.get("video_path", ""))
+    if err:
+        return err
+    try:
+        t = float(request.args.get("t", 0) or 0)
+        width = int(request.args.get("width", video_meta.PREVIEW_WIDTH) or video_meta.PREVIEW_WIDTH)
+    except ValueError:
+        return jsonify({"ok": False, "error": "t/width inválidos."}), 400
+    try:
+        path = video_meta.preview(abs_video, t, width, snap=request.args.get("snap") == "key")
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 422
+    resp = send_file(os.path.abspath(path), mimetype="image/jpeg", max_age=24 * 3600)
+    resp.headers["Cache-Control"] = "private, max-age=86400"
+    return resp
+
+# ======= Fila de jobs =======
+# /process e /process/stream viram jobs: pedidos idênticos em andamento compartilham a mesma
+# execução (reconexão do EventSource ou 2º espectador não disparam nova inferência).
+JOBS = JobManager()
+
+# ======= Cache de resultados =======
+# Mesmo vídeo (por conteúdo) + mesmos parâmetros -> payload e artefatos já prontos.
+# 'workers' entra na chave: os trechos (e as costuras nas fronteiras) dependem dele, e o
+# modo por trechos pode contar diferente do serial.
+def _result_key(params):
+    """(chave, hash do vídeo) ou (None, None) quando o cache não se aplica."""
+    if not result_cache.RESULT_CACHE_ENABLED or params.get("profile") or not params.get("cache", True):
+        return None, None
+    try:
+        vhash = detection_cache.video_hash(params["video_path"])
+    except OSError:
+        return None, None
+    return result_cache.result_key(vhash, _result_params(params)), vhash
+
+def _result_params(params):
+    return {"line": [round(v, 6) for v in params["line"]], "sample_fps": params["sample_fps"],
+            "chunk_seconds": params["chunk_seconds"], "backend": params["backend"],
+            "lines": params["lines"], "zones": params["zones"], "workers": params["workers"],
+            **counting_settings()}
+
+def _result_need(kind, params):
+    """Artefatos que o pedido exige do resultado em cache."""
+    if kind == "stream":
+        return ("events_path",)
+    return ("csv_path",) + (("annotated_path",) if params["save_annotated"] else ())
+
+def _cached_result(kind, params):
+    key, _ = _result_key(params)
+    return result_cache.RESULTS.get(key, _result_need(kind, params)) if key else None
+
+def _store_result(params, payload):
+    key, vhash = _result_key(params)
+    if key is None:
+        return payload
+    return result_cache.RESULTS.put(key, payload, vhash, _result_params(params))
+
+def _batch_runner(params):
+    def run(job):
+        cached = _cached_result("batch", params)  # pedido enfileirado antes de um igual terminar
+        if cached is not None:
+            job.publish({"type": "done", **cached, "ok": True})
+            return
         payload = process_video(
-            abs_video,
-            line_norm=tuple(map(float, line)),
-            sample_fps=sample_fps,
-            chunk_seconds=chunk_seconds,
-            workers=workers,
-            save_annotated=save_annotated,
+            params["video_path"],
+            line_norm=tuple(params["line"]),
+            sample_fps=params["sample_fps"],
+            chunk_seconds=params["chunk_seconds"],
+            workers=params["workers"],
+            save_annotated=params["save_annotated"],
+            backend=params["backend"],
+            profile=params["profile"],
+            lines=params["lines"],
+            zones=params["zones"],
             # se o wrapper aceitar kwargs extras, garanta CPU
             device="cpu",
             half=False,
+            progress_cb=job.publish,
+            cancel=job.cancel_event,
+            should_yield=job.should_yield,
         )
+        if payload.get("cancelled"):
+            job.publish({"type": "cancelled"})
+            return
+        if payload.get("ok") is False:
+            job.publish({"type": "error", "message": payload.get("error") or "Erro no processamento."})
+            return
         payload["ok"] = True
-        return jsonify(payload)
+        job.publish({"type": "done", **_store_result(params, payload)})
+    return run
+
+def _stream_runner(params):
+    def run(job):
+        cached = _cached_result("stream", params)
+        if cached is not None:
+            job.publish({"type": "done", **cached})
+            return
+        for ev in process_stream(
+            params["video_path"],
+            line_norm=tuple(params["line"]),
+            sample_fps=params["sample_fps"],
+            chunk_seconds=params["chunk_seconds"],
+            workers=params["workers"],
+            save_annotated=False,
+            backend=params["backend"],
+            profile=params["profile"],
+            lines=params["lines"],
+            zones=params["zones"],
+            device="cpu",
+            half=False,
+            cancel=job.cancel_event,
+            should_yield=job.should_yield,
+        ):
+            if ev.get("type") == "done":
+                ev = {"type": "done", **_store_result(params, ev)}
+            job.publish(ev)
+    return run
+
+def _tune_runner(params):
+    def run(job):
+        profile = autotune.tune(params["backend"], progress=job.publish)
+        job.publish({"type": "done", "ok": True, "profile": profile})
+    return run
+
+def _submit_tune(backend=None):
+    """
+    Medição de CPU como job exclusivo: espera os jobs em execução terminarem e segura os
+    próximos até acabar (muda threads do processo e recria o pool de trechos).
+    """
+    params = {"backend": detector.parse_backend(backend)}
+    return JOBS.submit("tune", params, _tune_runner(params), priority=PRIORITY_BATCH, exclusive=True)
+
+# 1º boot neste host (ou AUTOTUNE=force): mede em background e aplica ao terminar
+if YOLO_AVAILABLE and autotune.needs_tuning():
+    _submit_tune()
+
+def _submit_job(kind, params, priority=None):
+    """stream = preview interativo (prioritário, cancelado sem assinantes); batch = lote."""
+    if kind == "batch":
+        return JOBS.submit(kind, params, _batch_runner(params),
+                           priority=parse_priority(priority, PRIORITY_BATCH))
+    return JOBS.submit(kind, params, _stream_runner(params),
+                       priority=parse_priority(priority, PRIORITY_INTERACTIVE),
+                       cancel_on_orphan=True)
+
+def _resolve_video(video_path):
+    """Valida video_path (relativo ao projeto, dentro de uploads/). Retorna (abs, erro)."""
+    if not video_path:
+        return None, (jsonify({"ok": False, "error": "video_path ausente."}), 400)
+    abs_video = os.path.abspath(os.path.join(BASE_DIR, video_path))
+    if not abs_video.startswith(UPLOADS_DIR):
+        return None, (jsonify({"ok": False, "error": "Caminho inválido."}), 400)
+    if not os.path.exists(abs_video):
+        return None, (jsonify({"ok": False, "error": "Arquivo não encontrado."}), 404)
+    return abs_video, None
+
+def _backend_param(val):
+    """Backend de detecção por request (torch | onnx | onnx-int8); padrão DETECTOR_BACKEND."""
+    try:
+        return detector.parse_backend(val), None
+    except ValueError as e:
+        return None, (jsonify({"ok": False, "error": str(e)}), 400)
+
+def _regions_param(lines, zones_):
+    """Linhas extras e zonas (listas ou JSON); validadas já no request."""
+    try:
+        spec = zones.parse_spec(lines, zones_)
+    except ValueError as e:
+        return None, (jsonify({"ok": False, "error": str(e)}), 400)
+    return spec or {"lines": [], "zones": []}, None
+
+def _batch_params(data):
+    abs_video, err = _resolve_video(data.get("video_path"))
+    if err:
+        return None, err
+    line = data.get("line", [])
+    if not (isinstance(line, list) and len(line) == 4):
+        return None, (jsonify({"ok": False, "error": "Linha inválida (x1,y1,x2,y2)."}), 400)
+    backend, err = _backend_param(data.get("backend"))
+    if err:
+        return None, err
+    regions, err = _regions_param(data.get("lines"), data.get("zones"))
+    if err:
+        return None, err
+    return {
+        "video_path": abs_video,
+        "line": [float(v) for v in line],
+        "sample_fps": float(data.get("sample_fps", 5.0)),
+        "chunk_seconds": int(data.get("chunk_seconds", 60)),
+        "workers": clamp_workers(data.get("workers", autotune.default_workers())),
+        "save_annotated": bool(data.get("save_annotated", True)),
+        "backend": backend,
+        "profile": bool(data.get("profile", False)),
+        "cache": bool(data.get("cache", True)),
+        **regions,
+    }, None
+
+def _stream_params(args):
+    abs_video, err = _resolve_video(args.get("video_path", ""))
+    if err:
+        return None, err
+    backend, err = _backend_param(args.get("backend"))
+    if err:
+        return None, err
+    regions, err = _regions_param(args.get("lines"), args.get("zones"))
+    if err:
+        return None, err
+    return {
+        "video_path": abs_video,
+        "line": [float(args.get("x1", "0")), float(args.get("y1", "0")),
+                 float(args.get("x2", "1")), float(args.get("y2", "1"))],
+        "sample_fps": float(args.get("sample_fps", "5.0")),
+        "chunk_seconds": int(args.get("chunk_seconds", "60")),
+        "workers": clamp_workers(args.get("workers", autotune.default_workers())),
+        "backend": backend,
+        "profile": str(args.get("profile", "0")).lower() in ("1", "true", "yes"),
+        "cache": str(args.get("cache", "1")).lower() not in ("0", "false", "no"),
+        **regions,
+    }, None
+
+def _job_result_response(job):
+    ev = job.wait()
+    if ev is None or ev.get("type") in ("error", "cancelled"):
+        msg = (ev or {}).get("message") or ("Processamento cancelado." if ev else "Erro no processamento.")
+        return jsonify({"ok": False, "error": msg[:300], "job_id": job.id}), 500
+    payload = {k: v for k, v in ev.items() if k != "type"}
+    payload["job_id"] = job.id
+    return jsonify(payload)
+
+@app.route("/process", methods=["POST"])
+def process_batch():
+    """Processamento em lote: enfileira process_video e devolve payload completo (ou job_id se async)."""
+    try:
+        data = request.get_json(force=True)
+        params, err = _batch_params(data)
+        if err:
+            return err
+        cached = _cached_result("batch", params)
+        if cached is not None:  # resposta imediata, sem job
+            return jsonify({**cached, "ok": True, "job_id": None})
+        job, coalesced = _submit_job("batch", params, data.get("priority"))
+        if data.get("async"):
+            return jsonify({"ok": True, "job_id": job.id, "coalesced": coalesced}), 202
+        return _job_result_response(job)
     except Exception as e:
         app.logger.exception("Erro em /process")
         # Mensagem curta para a UI (sem stacktrace gigante)
@@ -116,49 +420,77 @@ def _sse_format(d):
     """Formata dict -> linha SSE 'data:'."""
     return f"data: {json.dumps(d, ensure_ascii=False)}\n\n"
 
+def _sse_job_response(job):
+    def generate():
+        try:
+            for ev in job.subscribe(keepalive=5.0):
+                if ev is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield _sse_format(ev)
+        except Exception as e:
+            yield _sse_format({"type": "error", "message": _short_error(e)})
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Job-Id": job.id})
+
 @app.route("/process/stream")
 def process_stream_endpoint():
     """SSE: emite 'progress' e finaliza com 'done' com o mesmo payload do /process."""
     try:
-        video_path = request.args.get("video_path", "")
-        if not video_path:
-            return jsonify({"ok": False, "error": "video_path ausente."}), 400
-
-        abs_video = os.path.abspath(os.path.join(BASE_DIR, video_path))
-        if not abs_video.startswith(UPLOADS_DIR):
-            return jsonify({"ok": False, "error": "Caminho inválido."}), 400
-        if not os.path.exists(abs_video):
-            return jsonify({"ok": False, "error": "Arquivo não encontrado."}), 404
-
-        x1 = float(request.args.get("x1", "0"))
-        y1 = float(request.args.get("y1", "0"))
-        x2 = float(request.args.get("x2", "1"))
-        y2 = float(request.args.get("y2", "1"))
-        sample_fps = float(request.args.get("sample_fps", "5.0"))
-        chunk_seconds = int(request.args.get("chunk_seconds", "60"))
-        workers = int(request.args.get("workers", "0"))
-
-        def generate():
-            try:
-                for ev in process_stream(
-                    abs_video,
-                    line_norm=(x1, y1, x2, y2),
-                    sample_fps=sample_fps,
-                    chunk_seconds=chunk_seconds,
-                    workers=workers,
-                    save_annotated=False,
-                    device="cpu",
-                    half=False,
-                ):
-                    yield _sse_format(ev)
-            except Exception as e:
-                yield _sse_format({"type": "error", "message": _short_error(e)})
-
-        return Response(generate(), mimetype="text/event-stream")
+        params, err = _stream_params(request.args)
+        if err:
+            return err
+        cached = _cached_result("stream", params)
+        if cached is not None:
+            return Response(_sse_format({"type": "done", **cached}), mimetype="text/event-stream",
+                            headers={"Cache-Control": "no-cache"})
+        job, _ = _submit_job("stream", params)
+        return _sse_job_response(job)
     except Exception as e:
         app.logger.exception("Erro em /process/stream")
         return jsonify({"ok": False, "error": _short_error(e)}), 500
 
+@app.route("/jobs", methods=["GET", "POST"])
+def jobs_endpoint():
+    """POST {kind: batch|stream, priority?, ...params do /process}: enfileira. GET: lista jobs."""
+    if request.method == "GET":
+        return jsonify({"ok": True, "jobs": JOBS.list()})
+    data = request.get_json(force=True)
+    kind = data.get("kind", "batch")
+    if kind not in ("batch", "stream"):
+        return jsonify({"ok": False, "error": "kind inválido (batch|stream)."}), 400
+    if kind == "stream" and isinstance(data.get("line"), list) and len(data["line"]) == 4:
+        x1, y1, x2, y2 = data["line"]
+        data = {**data, "x1": x1, "y1": y1, "x2": x2, "y2": y2}
+    params, err = _batch_params(data) if kind == "batch" else _stream_params(data)
+    if err:
+        return err
+    job, coalesced = _submit_job(kind, params, data.get("priority"))
+    return jsonify({"ok": True, "job_id": job.id, "coalesced": coalesced}), 202
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"ok": False, "error": "Job não encontrado."}), 404
+    return jsonify({"ok": True, **job.snapshot()})
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def job_cancel(job_id):
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"ok": False, "error": "Job não encontrado."}), 404
+    job.cancel()
+    return jsonify({"ok": True, "job_id": job.id, "status": job.status})
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    """SSE de um job existente (quantos assinantes quiser)."""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"ok": False, "error": "Job não encontrado."}), 404
+    return _sse_job_response(job)
+
 @app.route("/download/<path:filepath>")
 def download(filepath):
     """Serve APENAS arquivos dentro de outputs/ (proteção contra path traversal)."""
@@ -173,20 +505,97 @@ def download(filepath):
 
 @app.route("/report/summary")
 def report_summary():
-    """Resumo rápido se resultados já existem (opcional)."""
-    video_path = request.args.get("video_path", "")
-    if not video_path:
-        return jsonify({"ok": False, "error": "video_path ausente."}), 400
-    abs_video = os.path.abspath(os.path.join(BASE_DIR, video_path))
-    if not abs_video.startswith(UPLOADS_DIR) or not os.path.exists(abs_video):
-        return jsonify({"ok": False, "error": "Vídeo inválido ou não encontrado."}), 400
-
-    # Convenção: procura por CSV com mesmo stem no outputs/
-    stem = os.path.splitext(os.path.basename(abs_video))[0]
-    csv_guess = os.path.join(OUTPUTS_DIR, f"{stem}_windows.csv")
-    if os.path.exists(csv_guess):
-        return jsonify({"ok": True, "csv_path": os.path.relpath(csv_guess, BASE_DIR).replace('\\','/')})
-    return jsonify({"ok": False, "error": "Resumo indisponível."}), 404
+    """
+    Resumo de um vídeo já processado, direto do cache de resultados. Com x1..y2 (e
+    opcionalmente sample_fps, chunk_seconds, backend, lines, zones) busca exatamente esse
+    pedido; sem linha, devolve o resultado mais recente do vídeo.
+    """
+    abs_video, err = _resolve_video(request.args.get("video_path", ""))
+    if err:
+        return err
+    if any(k in request.args for k in ("x1", "y1", "x2", "y2")):
+        params, err = _stream_params(request.args)
+        if err:
+            return err
+        key, _ = _result_key({**params, "profile": False, "cache": True})
+        entry = result_cache.RESULTS.entry(key) if key else None
+    else:
+        entry = result_cache.RESULTS.latest(detection_cache.video_hash(abs_video))
+    if entry is None:
+        return jsonify({"ok": False, "error": "Resumo indisponível (vídeo ainda não processado com esses parâmetros)."}), 404
+    payload = entry["payload"]
+    keys = ("in_total", "out_total", "net_total", "windows", "csv_path", "events_path",
+            "annotated_path", "lines", "zones", "backend")
+    return jsonify({"ok": True, "params": entry["params"], "created": entry.get("created"),
+                    **{k: payload[k] for k in keys if k in payload}})
+
+@app.route("/report/windows")
+def report_windows():
+    """Reagrega o log de cruzamentos (events.npz) em outra granularidade, sem reprocessar."""
+    events_path = request.args.get("events_path", "")
+    if not events_path:
+        return jsonify({"ok": False, "error": "events_path ausente."}), 400
+    # aceita "outputs/<job>/events.npz" (como devolvido pelo /process) ou relativo a outputs/
+    rel = events_path.replace("\\", "/").split("outputs/", 1)[-1]
+    abs_path = os.path.abspath(os.path.join(OUTPUTS_DIR, rel))
+    if not abs_path.startswith(OUTPUTS_DIR) or not abs_path.endswith(".npz"):
+        return jsonify({"ok": False, "error": "Caminho inválido."}), 400
+    if not os.path.exists(abs_path):
+        return jsonify({"ok": False, "error": "Log de eventos não encontrado."}), 404
+    try:
+        seconds = crossings.parse_granularity(
+            request.args.get("granularity") or request.args.get("chunk_seconds"), 60)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+    events, duration_s, _ = crossings.load_events(abs_path)
+    windows = crossings.aggregate_windows(events, seconds, duration_s)
+    if request.args.get("format") == "csv":
+        buf = io.StringIO()
+        buf.write("start;end;in;out\n")
+        for w in windows:
+            buf.write(f"{w['start']};{w['end']};{w['in']};{w['out']}\n")
+        return Response(buf.getvalue(), mimetype="text/csv",
+                        headers={"Content-Disposition": f"attachment; filename=janelas_{seconds}s.csv"})
+    in_total, out_total = crossings.totals(events)
+    return jsonify({"ok": True, "seconds": seconds, "in_total": in_total, "out_total": out_total,
+                    "net_total": in_total - out_total, "windows": windows})
+
+@app.route("/models/stats")
+def models_stats():
+    """Tempos de carga/aquecimento e ocupação dos pools de modelos deste processo."""
+    return jsonify({"ok": True, "yolo_available": YOLO_AVAILABLE, "pools": model_pool_stats()})
+
+# gauges lidos na hora da coleta
+profiling.REGISTRY.gauge_fn("jobs", lambda: {(("state", k),): v for k, v in JOBS.depth().items()},
+                            "Jobs na fila/em execução.")
+profiling.REGISTRY.gauge_fn("model_pool_idle", lambda: {
+    (("backend", p["backend"]), ("weights", p["weights"])): p["idle"] for p in model_pool_stats()},
+    "Instâncias de modelo livres por pool.")
+profiling.REGISTRY.gauge_fn("result_cache", lambda: {
+    (("stat", k),): v for k, v in result_cache.RESULTS.stats().items()},
+    "Cache de resultados: entradas, bytes, limites e acertos/faltas.")
+
+@app.route("/metrics")
+def metrics():
+    """Métricas do processo no formato texto do Prometheus."""
+    return Response(profiling.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/models/tune", methods=["GET", "POST"])
+def models_tune():
+    """GET: perfil de CPU ativo e o salvo para este host. POST {backend?}: mede de novo (job)."""
+    if request.method == "GET":
+        saved = autotune.load_profile()
+        return jsonify({"ok": True, "host": autotune.host_key(), "active": autotune.active_profile(),
+                        "saved": saved})
+    if not YOLO_AVAILABLE:
+        return jsonify({"ok": False, "error": "YOLO indisponível: nada para medir."}), 409
+    data = request.get_json(silent=True) or {}
+    backend, err = _backend_param(data.get("backend"))
+    if err:
+        return err
+    job, coalesced = _submit_tune(backend)
+    return jsonify({"ok": True, "job_id": job.id, "coalesced": coalesced}), 202
 
 # ======= Tratador global de erros (mensagem curta na UI) =======
 @app.errorhandler(Exception)
@@ -0,0 +1,302 @@
+# autotune.py
+# Ajuste automático de threads/lote/workers para a CPU desta máquina. Mede a vazão
+# (frames amostrados por segundo) num clipe sintético curto variando threads intra-op do
+# torch, threads do OpenCV, tamanho do lote de inferência e nº de workers de trechos; o
+# melhor perfil é gravado por host em AUTOTUNE_FILE e aplicado nos boots seguintes.
+#
+# Uso:
+#   - app.py chama apply_env() ANTES de importar torch/cv2 (threads de MKL/OMP só valem
+#     se definidas antes da carga das libs) e startup() depois do pool de modelos.
+#   - Sob demanda: python autotune.py [--force] [--backend onnx] ou POST /models/tune.
+# Variáveis definidas explicitamente no ambiente sempre vencem o perfil salvo.
+import os, sys, json, time, socket, platform, tempfile, threading
+from typing import Callable, Dict, List, Optional
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+AUTOTUNE = os.environ.get("AUTOTUNE", "auto")  # auto (mede no 1º boot) | load | force | 0
+AUTOTUNE_FILE = os.environ.get("AUTOTUNE_FILE", os.path.join(BASE_DIR, "cpu_profile.json"))
+AUTOTUNE_SECONDS = float(os.environ.get("AUTOTUNE_SECONDS", "8"))   # duração do clipe sintético
+AUTOTUNE_FPS = float(os.environ.get("AUTOTUNE_FPS", "10"))
+AUTOTUNE_BATCHES = os.environ.get("AUTOTUNE_BATCHES", "1,2,4,8")
+AUTOTUNE_MIN_GAIN = float(os.environ.get("AUTOTUNE_MIN_GAIN", "0.05"))  # ganho mínimo p/ trocar
+
+# variável de ambiente -> campo do perfil
+_ENV_FIELDS = {
+    "OMP_NUM_THREADS": "torch_threads",
+    "MKL_NUM_THREADS": "torch_threads",
+    "OPENBLAS_NUM_THREADS": "torch_threads",
+    "NUMEXPR_NUM_THREADS": "torch_threads",
+    "OPENCV_THREADS": "opencv_threads",
+    "YOLO_BATCH_SIZE": "batch_size",
+    "CHUNK_WORKERS": "workers",
+}
+# o que o operador fixou à mão (capturado antes de apply_env escrever no ambiente)
+_USER_ENV = {k for k in _ENV_FIELDS if k in os.environ}
+
+_ACTIVE: Dict = {}
+_LOCK = threading.Lock()
+
+def host_key() -> str:
+    """Identifica a máquina: o mesmo disco montado em outra CPU gera outro perfil."""
+    return f"{socket.gethostname()}/{platform.machine()}/{os.cpu_count() or 1}cpu"
+
+def _default_backend() -> str:
+    return (os.environ.get("DETECTOR_BACKEND") or "torch").lower()
+
+def _read_all(path: str = AUTOTUNE_FILE) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def load_profile(backend: Optional[str] = None, path: str = AUTOTUNE_FILE) -> Optional[dict]:
+    return _read_all(path).get(host_key(), {}).get(backend or _default_backend())
+
+def save_profile(profile: dict, path: str = AUTOTUNE_FILE):
+    """Grava atômico (tmp + replace), preservando perfis de outros hosts/backends."""
+    with _LOCK:
+        data = _read_all(path)
+        data.setdefault(host_key(), {})[profile["backend"]] = profile
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+
+def active_profile() -> dict:
+    return dict(_ACTIVE)
+
+def default_workers() -> int:
+    """Workers padrão quando o request não informa: CHUNK_WORKERS ou o perfil ativo."""
+    val = os.environ.get("CHUNK_WORKERS") if "CHUNK_WORKERS" in _USER_ENV else None
+    if val is None:
+        val = _ACTIVE.get("workers", 0)
+    try:
+        return max(0, int(val))
+    except (TypeError, ValueError):
+        return 0
+
+def apply_env(profile: Optional[dict] = None) -> Optional[dict]:
+    """
+    Exporta o perfil (o salvo para este host, se não for passado) como variáveis de
+    ambiente. Deve rodar antes de importar torch/cv2/yolo_counter.
+    """
+    if profile is None:
+        if AUTOTUNE == "0":
+            return None
+        profile = load_profile()
+    if not profile:
+        return None
+    for env, field in _ENV_FIELDS.items():
+        if env not in _USER_ENV and profile.get(field) is not None:
+            os.environ[env] = str(profile[field])
+    _ACTIVE.clear()
+    _ACTIVE.update(profile)
+    return profile
+
+def apply_runtime(profile: dict):
+    """Aplica um perfil no processo já carregado (após medir sem reiniciar o servidor)."""
+    import yolo_counter
+    apply_env(profile)
+    threads = None if _USER_ENV & {"OMP_NUM_THREADS", "MKL_NUM_THREADS"} else profile.get("torch_threads")
+    cv_threads = None if "OPENCV_THREADS" in _USER_ENV else int(profile.get("opencv_threads") or 0)
+    _set_threads(int(threads) if threads else None, cv_threads)
+    if "YOLO_BATCH_SIZE" not in _USER_ENV and profile.get("batch_size"):
+        yolo_counter.YOLO_BATCH_SIZE = int(profile["batch_size"])
+
+def _set_threads(torch_threads: Optional[int], opencv_threads: Optional[int]):
+    if torch_threads is not None:
+        try:
+            from cpu_tunning import tune_cpu_threads
+            tune_cpu_threads(num_infer_threads=torch_threads, num_interop_threads=1)
+        except ImportError:
+            pass  # sem torch (backend ONNX puro): nada a ajustar
+    if opencv_threads is not None:
+        import cv2
+        # 0 = padrão do OpenCV (-1 restaura o padrão do sistema); 1 = sem paralelismo interno
+        cv2.setNumThreads(opencv_threads if opencv_threads > 0 else -1)
+
+def _get_threads() -> tuple:
+    """(threads do torch ou None sem torch, threads do OpenCV) atuais do processo."""
+    import cv2
+    try:
+        import torch
+        torch_threads = torch.get_num_threads()
+    except ImportError:
+        torch_threads = None
+    return torch_threads, cv2.getNumThreads()
+
+def _restore_threads(saved: tuple):
+    import cv2
+    torch_threads, cv_threads = saved
+    if torch_threads is not None:
+        import torch
+        torch.set_num_threads(torch_threads)
+    cv2.setNumThreads(cv_threads)
+
+# ---------- medição ----------
+def make_clip(path: str, seconds: float = AUTOTUNE_SECONDS, fps: float = AUTOTUNE_FPS,
+              size=(960, 540)) -> str:
+    """Clipe sintético: fundo texturizado + vultos atravessando a linha horizontal central."""
+    import cv2
+    import numpy as np
+    w, h = size
+    rng = np.random.default_rng(0)
+    bg = cv2.GaussianBlur(rng.integers(0, 255, (h, w, 3), dtype=np.uint8), (0, 0), 3)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+    n = max(1, int(seconds * fps))
+    walkers = [(int(rng.integers(40, w - 80)), float(rng.uniform(-1, 1)) * h / fps / 2.0, k * h / 6.0)
+               for k in range(6)]
+    for i in range(n):
+        frame = bg.copy()
+        for x, v, y0 in walkers:
+            y = int((y0 + v * i) % h)
+            cv2.rectangle(frame, (x, y), (x + 40, min(h - 1, y + 110)), (60, 60, 160), -1)
+            cv2.circle(frame, (x + 20, max(0, y - 18)), 16, (150, 170, 200), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+def _measure(clip: str, backend: str, batch_size: int, workers: int, weights=None) -> float:
+    """Frames amostrados por segundo numa passada completa (sem gate/ROI/cache)."""
+    import cv2
+    import yolo_counter as yc
+    cap = cv2.VideoCapture(clip)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    fps = float(cap.get(cv2.CAP_PROP_FPS) or AUTOTUNE_FPS)
+    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
+    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
+    cap.release()
+    line = (0.0, 0.5, 1.0, 0.5)
+    t0 = time.perf_counter()
+    if workers <= 1:
+        done = None
+        for ev in yc.process_stream(clip, line_norm=line, sample_fps=fps, workers=0,
+                                    batch_size=batch_size, backend=backend, weights=weights,
+                                    motion_gate=False, roi_crop=False, pipeline=False,
+                                    use_cache=False):
+            if ev.get("type") in ("done", "error"):
+                done = ev
+        if done is None or done.get("type") != "done":
+            raise RuntimeError((done or {}).get("message") or "medição sem resultado")
+    else:
+        # faixas iguais, sem sobreposição: o clipe é curto demais para _plan_ranges dividir
+        strategy = yc._choose_sampling_strategy(1, total, "auto")
+        line_px, w, h = yc._frame_geometry(strategy, line, w, h)
+        n = workers * 2
+        size = -(-total // n)
+        ranges = [(s, s, min(total, s + size)) for s in range(0, total, size)]
+        yc._drain(yc._iter_chunked(clip, line_px, 1, strategy, total, fps, w, h, ranges, workers,
+                                   weights=weights, backend=backend, batch_size=batch_size,
+                                   record=False, motion_gate=False, roi_crop=False))
+    return total / max(1e-6, time.perf_counter() - t0)
+
+def _thread_candidates(cores: int) -> List[int]:
+    return sorted({t for t in (1, 2, 4, cores // 2, cores) if 1 <= t <= cores})
+
+def _worker_candidates(cores: int) -> List[int]:
+    return [n for n in (2, 3, 4, 6, 8) if n <= cores]
+
+def tune(backend: Optional[str] = None, seconds: float = AUTOTUNE_SECONDS, weights=None,
+         progress: Optional[Callable[[dict], None]] = None, save: bool = True) -> dict:
+    """
+    Busca coordenada (threads -> lote -> threads OpenCV -> workers), cada eixo com os
+    melhores valores dos anteriores. Um valor só substitui o atual se ganhar mais que
+    AUTOTUNE_MIN_GAIN, para não trocar configuração por ruído de medição.
+    Workers de trechos fixam as próprias threads (núcleos/workers, OpenCV em 1): nesses
+    ensaios o eixo de threads não vale, e o ensaio registra as threads que de fato rodaram;
+    torch_threads/opencv_threads do perfil são as dos jobs seriais, e 'chunk_threads' as
+    de cada worker quando o vencedor usa trechos.
+    Mexe em threads do processo e no pool de trechos: o app roda como job exclusivo
+    (nenhum outro job em paralelo). Ao sair, com sucesso ou não, volta às threads de antes
+    e encerra o pool das medições; só então o perfil vencedor é aplicado.
+    """
+    import yolo_counter as yc
+    import detector
+    backend = detector.parse_backend(backend)
+    cores = os.cpu_count() or 1
+    batches = [int(b) for b in AUTOTUNE_BATCHES.split(",") if b.strip()]
+    trials: List[dict] = []
+    best = {"torch_threads": cores, "opencv_threads": 0, "batch_size": yc.YOLO_BATCH_SIZE, "workers": 0}
+    # threads intra-op só se aplicam ao torch; sessões ONNX usam ORT_THREADS na criação
+    axes = [("torch_threads", _thread_candidates(cores) if backend == "torch" else [cores]),
+            ("batch_size", batches),
+            ("opencv_threads", [0, 1]),
+            ("workers", [0] + _worker_candidates(cores))]
+    total_trials = 1 + sum(len(v) for _, v in axes)
+    saved = _get_threads()
+    try:
+        with tempfile.TemporaryDirectory(prefix="autotune-") as tmp:
+            clip = make_clip(os.path.join(tmp, "clip.mp4"), seconds)
+            _set_threads(best["torch_threads"], 0)
+            _measure(clip, backend, best["batch_size"], 0, weights)  # carrega/aquece o modelo
+            best_fps = _measure(clip, backend, best["batch_size"], 0, weights)
+            trials.append({**best, "fps": round(best_fps, 2)})
+            for field, values in axes:
+                for val in values:
+                    cfg = {**best, field: val}
+                    if cfg == best:
+                        continue
+                    _set_threads(cfg["torch_threads"], cfg["opencv_threads"])
+                    fps = _measure(clip, backend, cfg["batch_size"], cfg["workers"], weights)
+                    if cfg["workers"] > 1:
+                        # 1ª passada inclui subir processos e carregar modelos nos workers
+                        fps = _measure(clip, backend, cfg["batch_size"], cfg["workers"], weights)
+                    ran = cfg if cfg["workers"] <= 1 else \
+                        {**cfg, "torch_threads": yc.chunk_threads(cfg["workers"]), "opencv_threads": 1}
+                    trials.append({**ran, "fps": round(fps, 2)})
+                    if progress is not None:
+                        progress({"type": "progress", "pct": int(100 * len(trials) / total_trials),
+                                  "trial": trials[-1]})
+                    if fps > best_fps * (1 + AUTOTUNE_MIN_GAIN):
+                        best, best_fps = cfg, fps
+    finally:
+        _restore_threads(saved)
+        yc.shutdown_chunk_executor()  # workers das medições, com modelos carregados
+    profile = {**best, "backend": backend, "fps": round(best_fps, 2), "host": host_key(),
+               "cores": cores, "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "chunk_threads": yc.chunk_threads(best["workers"]) if best["workers"] > 1 else None,
+               "clip_seconds": seconds, "trials": trials}
+    if save:
+        save_profile(profile)
+    apply_runtime(profile)
+    return profile
+
+def needs_tuning(backend: Optional[str] = None) -> bool:
+    if AUTOTUNE == "force":
+        return True
+    return AUTOTUNE == "auto" and load_profile(backend) is None
+
+def startup(yolo_available: bool, logger=None) -> Optional[dict]:
+    """Chamado após carregar o pool: aplica o perfil salvo ao processo já iniciado."""
+    if AUTOTUNE == "0" or not yolo_available:
+        return None
+    profile = load_profile()
+    if profile:
+        apply_runtime(profile)
+        if logger is not None:
+            logger.info("Perfil de CPU aplicado: threads=%s opencv=%s lote=%s workers=%s",
+                        profile.get("torch_threads"), profile.get("opencv_threads"),
+                        profile.get("batch_size"), profile.get("workers"))
+    return profile
+
+def _main(argv: List[str]) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="Mede e grava o melhor perfil de CPU deste host.")
+    ap.add_argument("--backend", default=None, help="torch | onnx | onnx-int8 (padrão DETECTOR_BACKEND)")
+    ap.add_argument("--weights", default=None)
+    ap.add_argument("--seconds", type=float, default=AUTOTUNE_SECONDS)
+    ap.add_argument("--force", action="store_true", help="mede mesmo se já houver perfil salvo")
+    args = ap.parse_args(argv)
+    if not args.force and load_profile(args.backend):
+        print(json.dumps(load_profile(args.backend), indent=2))
+        return 0
+    profile = tune(args.backend, args.seconds, args.weights,
+                   progress=lambda ev: print(json.dumps(ev["trial"]), file=sys.stderr))
+    print(json.dumps({k: v for k, v in profile.items() if k != "trials"}, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
@@ -0,0 +1,347 @@
+# batch.py
+# Processamento em lote (sem HTTP) de diretórios de gravações: cada vídeo vira uma chamada
+# de process_video num pool de processos, com threads por worker limitadas via cpu_tunning
+# (N workers x T threads ~ núcleos da máquina). O paralelismo é entre arquivos: cada vídeo
+# roda serial dentro do seu worker, e o modelo fica carregado no worker entre um arquivo e
+# outro. Arquivos concluídos ficam em '<saída>/state.jsonl'; rodar de novo (após queda ou
+# Ctrl-C) pula o que já terminou com os mesmos parâmetros e refaz só o resto.
+#
+#   python batch.py run gravacoes/ --cameras cameras.json --out lote/2024-05-01
+#   python batch.py run manifesto.json --jobs 6 --threads 2
+#   python batch.py summary lote/2024-05-01
+#
+# Manifesto JSON:
+#   {"defaults": {"sample_fps": 5},
+#    "cameras": {"cam01": {"line": [0, 0.5, 1, 0.5]}, "cam02": {"line": "0.5,0,0.5,1", "zones": [...]}},
+#    "videos": ["cam01/0800.mp4", {"path": "x.mp4", "camera": "cam02", "sample_fps": 2}]}
+# Manifesto CSV: colunas path, camera e opcionais x1, y1, x2, y2, sample_fps, chunk_seconds.
+# Diretório: a câmera é a 1ª subpasta (gravacoes/cam01/...) ou, na raiz, o prefixo do nome
+# antes de '_' (cam01_0800.mp4); config em --cameras (chave "*" = padrão).
+import os, sys, csv, json, time, hashlib, argparse
+import multiprocessing as mp
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional
+
+VIDEO_EXTS = {".mp4", ".avi", ".mkv", ".mov"}
+BATCH_JOBS = int(os.environ.get("BATCH_JOBS", "0") or 0)            # 0 = núcleos / BATCH_THREADS
+BATCH_THREADS = int(os.environ.get("BATCH_THREADS", "4") or 4)      # threads de inferência por worker
+BATCH_MP_START = os.environ.get("BATCH_MP_START", "spawn")
+STATE_FILE = "state.jsonl"
+CONFIG_KEYS = ("line", "lines", "zones", "sample_fps", "chunk_seconds", "backend", "weights")
+DEFAULTS = {"line": None, "lines": None, "zones": None, "sample_fps": 5.0, "chunk_seconds": 60,
+            "backend": None, "weights": None}
+
+# ---------- entrada ----------
+def _camera_of(path: str, root: str) -> str:
+    rel = os.path.relpath(path, root)
+    parts = rel.replace("\\", "/").split("/")
+    if len(parts) > 1:
+        return parts[0]
+    return os.path.splitext(parts[0])[0].split("_", 1)[0]
+
+def _line_value(val):
+    """Linha do manifesto: lista [x1,y1,x2,y2] ou string "x1,y1,x2,y2" -> tupla (ou None)."""
+    if val is None or val == "":
+        return None
+    if isinstance(val, str):
+        val = val.split(",")
+    vals = [float(v) for v in val]
+    if len(vals) != 4:
+        raise ValueError(f"Linha inválida: {val!r} (esperado x1,y1,x2,y2).")
+    return tuple(vals)
+
+def _config(camera: str, cameras: Dict[str, dict], defaults: dict, entry: Optional[dict] = None) -> dict:
+    """Padrões < câmera "*" < câmera < entrada do manifesto."""
+    cfg = dict(DEFAULTS)
+    for layer in (defaults, cameras.get("*"), cameras.get(camera), entry):
+        for k in CONFIG_KEYS:
+            if layer and layer.get(k) is not None:
+                cfg[k] = layer[k]
+    cfg["line"] = _line_value(cfg["line"])
+    return cfg
+
+def _scan_dir(root: str, cameras: Dict[str, dict], defaults: dict) -> List[dict]:
+    tasks = []
+    for dirpath, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for f in sorted(files):
+            if os.path.splitext(f)[1].lower() in VIDEO_EXTS:
+                path = os.path.join(dirpath, f)
+                cam = _camera_of(path, root)
+                tasks.append({"path": path, "camera": cam, **_config(cam, cameras, defaults)})
+    return tasks
+
+def _read_manifest(path: str, cameras: Dict[str, dict], defaults: dict) -> List[dict]:
+    base = os.path.dirname(os.path.abspath(path))
+    if path.lower().endswith(".csv"):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+        entries = []
+        for row in rows:
+            row = {k.strip(): (v or "").strip() for k, v in row.items() if k}
+            entry = {"path": row["path"], "camera": row.get("camera") or None}
+            if all(row.get(k) for k in ("x1", "y1", "x2", "y2")):
+                entry["line"] = [row[k] for k in ("x1", "y1", "x2", "y2")]
+            for k, cast in (("sample_fps", float), ("chunk_seconds", int)):
+                if row.get(k):
+                    entry[k] = cast(row[k])
+            entries.append(entry)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            data = {"videos": data}
+        cameras = {**cameras, **(data.get("cameras") or {})}
+        defaults = {**defaults, **(data.get("defaults") or {})}
+        entries = [e if isinstance(e, dict) else {"path": e} for e in data.get("videos") or []]
+    tasks = []
+    for e in entries:
+        vpath = e["path"] if os.path.isabs(e["path"]) else os.path.join(base, e["path"])
+        if os.path.isdir(vpath):
+            tasks.extend(_scan_dir(vpath, cameras, defaults))
+            continue
+        cam = e.get("camera") or _camera_of(vpath, base)
+        tasks.append({"path": vpath, "camera": cam, **_config(cam, cameras, defaults, e)})
+    return tasks
+
+def task_key(task: dict, save_annotated: bool) -> str:
+    """Arquivo (caminho + tamanho + mtime) + parâmetros: muda qualquer um -> reprocessa."""
+    st = os.stat(task["path"])
+    raw = json.dumps({"path": os.path.abspath(task["path"]), "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                      "annotated": bool(save_annotated), **{k: task.get(k) for k in CONFIG_KEYS}},
+                     sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:24]
+
+# ---------- estado ----------
+def load_state(out_dir: str) -> Dict[str, dict]:
+    """Último registro por chave (linhas truncadas por queda são ignoradas)."""
+    state: Dict[str, dict] = {}
+    try:
+        with open(os.path.join(out_dir, STATE_FILE), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                state[rec["key"]] = rec
+    except OSError:
+        pass
+    return state
+
+def _append_state(out_dir: str, rec: dict):
+    with open(os.path.join(out_dir, STATE_FILE), "a", encoding="utf-8") as f:
+        f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+# ---------- worker ----------
+def _worker_init(threads: int):
+    # antes de importar torch/onnxruntime no worker: limita threads para N workers não
+    # disputarem os mesmos núcleos
+    for k in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS"):
+        os.environ[k] = str(threads)
+    try:
+        from cpu_tunning import tune_cpu_threads
+        tune_cpu_threads(num_infer_threads=threads, num_interop_threads=1, opencv_threads=1)
+    except ImportError:
+        import cv2  # sem torch (backend ONNX puro): limita só o OpenCV
+        cv2.setNumThreads(1)
+
+def _run_one(task: dict, save_annotated: bool) -> dict:
+    """Um vídeo no worker: process_video serial (o paralelismo do lote é entre arquivos)."""
+    from yolo_counter import process_video
+    t0 = time.perf_counter()
+    try:
+        res = process_video(task["path"], line=task["line"], sample_fps=task["sample_fps"],
+                            chunk_seconds=task["chunk_seconds"], workers=0, save_annotated=save_annotated,
+                            lines=task.get("lines"), zones=task.get("zones"), backend=task.get("backend"),
+                            weights=task.get("weights"), pipeline=False)
+        if res.get("ok"):
+            import video_meta
+            res["duration_s"] = video_meta.get(task["path"]).get("duration_s")
+    except Exception as e:
+        res = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    res["elapsed_s"] = round(time.perf_counter() - t0, 2)
+    return res
+
+# ---------- execução ----------
+def run(tasks: List[dict], out_dir: str, jobs: int = 0, threads: int = 0, save_annotated: bool = False,
+        retry_failed: bool = True, progress=None) -> dict:
+    """
+    Processa 'tasks' no pool, pulando chaves já concluídas em out_dir/state.jsonl; grava cada
+    resultado assim que sai e, no fim, o resumo consolidado (também com os de execuções
+    anteriores). Retorna o resumo.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    cpus = os.cpu_count() or 1
+    threads = threads or BATCH_THREADS
+    jobs = jobs or BATCH_JOBS or max(1, cpus // threads)
+    threads = max(1, min(threads, cpus // jobs or 1))
+    state = load_state(out_dir)
+    todo, seen = [], set()
+    for t in tasks:
+        try:
+            t["key"] = task_key(t, save_annotated)
+        except OSError as e:
+            _append_state(out_dir, {"key": hashlib.sha256(t["path"].encode()).hexdigest()[:24],
+                                    "path": t["path"], "camera": t["camera"], "status": "error",
+                                    "error": str(e), "finished": time.time()})
+            continue
+        done = state.get(t["key"])
+        if t["key"] in seen or (done and (done["status"] == "done" or not retry_failed)):
+            continue
+        seen.add(t["key"])
+        todo.append(t)
+    # maiores primeiro: o último arquivo longo não fica rodando sozinho no fim do lote
+    todo.sort(key=lambda t: os.path.getsize(t["path"]), reverse=True)
+    skipped = len(tasks) - len(todo)
+    if progress:
+        progress({"type": "start", "total": len(tasks), "todo": len(todo), "skipped": skipped,
+                  "jobs": jobs, "threads": threads})
+    t0 = time.perf_counter()
+    if todo:
+        ex = ProcessPoolExecutor(max_workers=min(jobs, len(todo)), mp_context=mp.get_context(BATCH_MP_START),
+                                 initializer=_worker_init, initargs=(threads,))
+        pending = {ex.submit(_run_one, t, save_annotated): t for t in todo}
+        n_done = 0
+        try:
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    t = pending.pop(fut)
+                    try:
+                        res = fut.result()
+                    except Exception as e:  # worker morto (OOM etc.)
+                        res = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                    rec = _record(t, res)
+                    _append_state(out_dir, rec)
+                    n_done += 1
+                    if progress:
+                        progress({"type": "file", "n": n_done, "of": len(todo),
+                                  **{k: rec.get(k) for k in ("camera", "path", "status", "in_total",
+                                                             "out_total", "elapsed_s", "error")
+                                     if rec.get(k) is not None}})
+        except KeyboardInterrupt:
+            for fut in pending:
+                fut.cancel()
+            ex.shutdown(wait=False, cancel_futures=True)
+            raise
+        ex.shutdown()
+    return write_summary(out_dir, keys={t["key"] for t in tasks if "key" in t},
+                         run={"processed": len(todo), "skipped": skipped, "jobs": jobs, "threads": threads,
+                              "wall_s": round(time.perf_counter() - t0, 1)})
+
+def _record(task: dict, res: dict) -> dict:
+    rec = {"key": task["key"], "path": task["path"], "camera": task["camera"],
+           "status": "done" if res.get("ok") else "error", "finished": time.time(),
+           "elapsed_s": res.get("elapsed_s"),
+           "params": {k: task.get(k) for k in CONFIG_KEYS if task.get(k) is not None}}
+    if res.get("ok"):
+        rec.update({k: res.get(k) for k in ("in_total", "out_total", "net_total", "csv_path",
+                                            "events_path", "annotated_path", "duration_s")
+                    if res.get(k) is not None})
+        for k in ("lines", "zones"):
+            if res.get(k):
+                rec[k] = res[k]
+    else:
+        rec["error"] = res.get("error")
+    return rec
+
+# ---------- resumo ----------
+def _write_json(path: str, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def write_summary(out_dir: str, keys=None, run: Optional[dict] = None) -> dict:
+    """
+    summary.json (totais gerais, por câmera e por arquivo) + summary.csv (um arquivo por
+    linha) a partir do state.jsonl. 'keys' restringe aos arquivos do lote atual.
+    """
+    recs = [r for r in load_state(out_dir).values() if keys is None or r["key"] in keys]
+    recs.sort(key=lambda r: (r["camera"], r["path"]))
+    cams: Dict[str, dict] = {}
+    for r in recs:
+        c = cams.setdefault(r["camera"], {"files": 0, "failed": 0, "in_total": 0, "out_total": 0,
+                                          "net_total": 0, "duration_s": 0.0, "processing_s": 0.0})
+        c["files"] += 1
+        if r["status"] != "done":
+            c["failed"] += 1
+            continue
+        for k in ("in_total", "out_total", "net_total"):
+            c[k] += int(r.get(k) or 0)
+        c["duration_s"] = round(c["duration_s"] + float(r.get("duration_s") or 0.0), 3)
+        c["processing_s"] = round(c["processing_s"] + float(r.get("elapsed_s") or 0.0), 2)
+    total = {k: sum(c[k] for c in cams.values()) for k in ("files", "failed", "in_total", "out_total", "net_total")}
+    total["duration_s"] = round(sum(c["duration_s"] for c in cams.values()), 3)
+    total["processing_s"] = round(sum(c["processing_s"] for c in cams.values()), 2)
+    summary = {"generated": time.strftime("%Y-%m-%d %H:%M:%S"), "totals": total, "cameras": cams,
+               "files": recs, "errors": [{"path": r["path"], "error": r.get("error")}
+                                         for r in recs if r["status"] != "done"]}
+    if run is not None:
+        summary["run"] = run
+    _write_json(os.path.join(out_dir, "summary.json"), summary)
+    with open(os.path.join(out_dir, "summary.csv"), "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, delimiter=";")
+        w.writerow(["camera", "path", "status", "in", "out", "net", "duration_s", "elapsed_s", "csv_path", "error"])
+        for r in recs:
+            w.writerow([r["camera"], r["path"], r["status"], r.get("in_total", ""), r.get("out_total", ""),
+                        r.get("net_total", ""), r.get("duration_s", ""), r.get("elapsed_s", ""),
+                        r.get("csv_path", ""), r.get("error", "")])
+    return summary
+
+# ---------- CLI ----------
+def _main(argv: List[str]) -> int:
+    ap = argparse.ArgumentParser(description="Contagem em lote de diretórios/manifestos de vídeos.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run", help="processa (retomando) e grava o resumo consolidado")
+    r.add_argument("source", help="diretório de vídeos ou manifesto .json/.csv")
+    r.add_argument("--out", default=None, help="pasta de estado/resumo (padrão outputs/batch/<fonte>)")
+    r.add_argument("--cameras", default=None, help="JSON {câmera: {line, lines, zones, sample_fps, ...}}")
+    r.add_argument("--line", default=None, help="linha padrão x1,y1,x2,y2 (normalizada)")
+    r.add_argument("--sample-fps", type=float, default=None)
+    r.add_argument("--chunk-seconds", type=int, default=None)
+    r.add_argument("--backend", default=None)
+    r.add_argument("--weights", default=None)
+    r.add_argument("--jobs", type=int, default=0, help="processos (padrão núcleos / threads)")
+    r.add_argument("--threads", type=int, default=0, help=f"threads por processo (padrão {BATCH_THREADS})")
+    r.add_argument("--annotated", action="store_true", help="grava também o vídeo anotado")
+    r.add_argument("--no-retry", action="store_true", help="não refaz arquivos que falharam antes")
+    s = sub.add_parser("summary", help="regrava o resumo a partir do state.jsonl")
+    s.add_argument("out")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "summary":
+        summary = write_summary(args.out)
+        print(json.dumps(summary["totals"], indent=2))
+        return 0
+
+    cameras: Dict[str, dict] = {}
+    if args.cameras:
+        with open(args.cameras, "r", encoding="utf-8") as f:
+            cameras = json.load(f)
+    defaults = {"line": args.line, "sample_fps": args.sample_fps, "chunk_seconds": args.chunk_seconds,
+                "backend": args.backend, "weights": args.weights}
+    try:
+        if os.path.isdir(args.source):
+            tasks = _scan_dir(args.source, cameras, defaults)
+        else:
+            tasks = _read_manifest(args.source, cameras, defaults)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Entrada inválida: {e}", file=sys.stderr)
+        return 2
+    missing = [t["path"] for t in tasks if t["line"] is None]
+    if missing:
+        print(f"Sem linha configurada para {len(missing)} arquivo(s), ex.: {missing[0]} "
+              "(use --line, --cameras ou o manifesto).", file=sys.stderr)
+        return 2
+    name = os.path.splitext(os.path.basename(os.path.normpath(args.source)))[0]
+    out = args.out or os.path.join("outputs", "batch", name)
+    summary = run(tasks, out, args.jobs, args.threads, args.annotated, retry_failed=not args.no_retry,
+                  progress=lambda ev: print(json.dumps(ev, ensure_ascii=False, default=str), file=sys.stderr))
+    print(json.dumps({"out": out, "totals": summary["totals"], "run": summary["run"]}, indent=2))
+    return 1 if summary["totals"]["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
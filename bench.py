@@ -0,0 +1,443 @@
+# bench.py
+# Benchmark reprodutível do yolo_counter. Gera (uma vez, em cache) vídeos sintéticos
+# determinísticos com "pessoas" (sprites claros) atravessando a linha horizontal central
+# em instantes conhecidos, roda process_video/process_stream numa grade de resoluções,
+# durações e taxas de amostragem e grava um JSON com vazão, tempos por estágio, pico de
+# RSS e acerto das contagens contra o gabarito — para comparar execuções ao longo do tempo.
+#
+#   python bench.py run [--quick] [--detector sprite|model] [--out bench/resultado.json]
+#   python bench.py compare bench/antes.json bench/depois.json
+#   python bench.py parity [--variants gate] [--full]
+#
+# Detectores:
+#   sprite = detector por limiar de brilho que enxerga exatamente os sprites do clipe:
+#            isola decode/rastreamento/contagem e dá contagens exatas esperadas (gabarito);
+#   model  = o backend real (pesos YOLO/ONNX); mede a inferência de verdade, mas os sprites
+#            não são pessoas, então o acerto das contagens não é significativo.
+import os, sys, json, time, argparse, platform, subprocess, threading
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+BENCH_DIR = os.environ.get("BENCH_DIR", "bench")
+LINE = (0.0, 0.5, 1.0, 0.5)
+TRAVERSE_S = 8.0        # tempo para um sprite atravessar o quadro inteiro
+SPRITE_H_FRAC = 0.2     # altura do sprite em relação ao quadro
+BG_MAX = 150            # fundo nunca passa deste brilho; sprites ficam acima de SPRITE_THR
+SPRITE_THR = 200
+
+GRID_FULL = {"resolutions": ["640x360", "1280x720"], "seconds": [20, 60],
+             "sample_fps": [2.0, 5.0], "apis": ["video", "stream"]}
+GRID_QUICK = {"resolutions": ["640x360"], "seconds": [20], "sample_fps": [5.0], "apis": ["video"]}
+
+# ---------- vídeos sintéticos ----------
+def plan_walkers(w: int, h: int, n_frames: int, fps: float, seed: int) -> List[dict]:
+    """
+    Sprites por faixa vertical: cada faixa tem um sentido fixo (descendo = OUT, subindo = IN)
+    e espaçamento mínimo entre sprites, para que o rastreador IoU nunca troque identidades.
+    """
+    rng = np.random.default_rng(seed)
+    sh = max(24, int(h * SPRITE_H_FRAC))
+    sw = max(10, sh // 3)
+    speed = (h + sh) / (TRAVERSE_S * fps)          # px por frame
+    traverse = int(np.ceil((h + sh) / speed))
+    min_gap = int(np.ceil(3 * sh / speed))
+    lanes = max(1, w // (sw * 3))
+    walkers = []
+    for lane in range(lanes):
+        direction = -1 if lane % 2 == 0 else 1     # -1 desce (OUT), +1 sobe (IN)
+        x = int(lane * w / lanes + (w / lanes - sw) / 2)
+        f = int(rng.integers(0, max(1, int(2 * fps))))
+        while f + traverse < n_frames:
+            walkers.append({"x": x, "start": f, "dir": direction, "w": sw, "h": sh, "speed": speed})
+            f += min_gap + int(rng.integers(0, max(1, int(4 * fps))))
+    return walkers
+
+def _sprite_top(wk: dict, f: int, h: int) -> float:
+    t = (f - wk["start"]) * wk["speed"]
+    return -wk["h"] + t if wk["dir"] < 0 else h - t
+
+def ground_truth(walkers: List[dict], h: int, fps: float) -> dict:
+    """Frame em que o centro de cada sprite cruza a linha y = h/2."""
+    crossings = []
+    for wk in walkers:
+        # nos dois sentidos o centro chega a h/2 após percorrer (h + h_sprite) / 2
+        frame = wk["start"] + (h + wk["h"]) / 2.0 / wk["speed"]
+        crossings.append([round(frame / fps, 3), 1 if wk["dir"] > 0 else -1])
+    crossings.sort()
+    return {"in": sum(1 for _, d in crossings if d > 0),
+            "out": sum(1 for _, d in crossings if d < 0),
+            "crossings": crossings}
+
+def make_video(path: str, w: int, h: int, seconds: float, fps: float = 25.0, seed: int = 0) -> dict:
+    """Escreve o vídeo (se ainda não existir) e devolve o gabarito, salvo ao lado em .json."""
+    meta_path = os.path.splitext(path)[0] + ".json"
+    if os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    n_frames = int(round(seconds * fps))
+    walkers = plan_walkers(w, h, n_frames, fps, seed)
+    rng = np.random.default_rng(seed + 1)
+    bg = cv2.GaussianBlur(rng.integers(0, BG_MAX, (h, w, 3), dtype=np.uint8), (0, 0), 2)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+    try:
+        for f in range(n_frames):
+            frame = bg.copy()
+            for wk in walkers:
+                if f < wk["start"]:
+                    continue
+                top = int(round(_sprite_top(wk, f, h)))
+                if top >= h or top + wk["h"] <= 0:
+                    continue
+                x = wk["x"]
+                cv2.rectangle(frame, (x, max(0, top)), (x + wk["w"] - 1, min(h - 1, top + wk["h"] - 1)),
+                              (235, 235, 235), -1)
+            writer.write(frame)
+    finally:
+        writer.release()
+    meta = {"w": w, "h": h, "seconds": seconds, "fps": fps, "seed": seed, "line": list(LINE),
+            **ground_truth(walkers, h, fps)}
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+# ---------- detector de sprites ----------
+class _Arr:
+    def __init__(self, a):
+        self.a = a
+    def cpu(self):
+        return self
+    def numpy(self):
+        return self.a
+
+class _Boxes:
+    def __init__(self, xyxy: np.ndarray):
+        self.xyxy = _Arr(xyxy)
+        self.conf = _Arr(np.full(len(xyxy), 0.99, dtype=np.float32))
+        self.cls = _Arr(np.zeros(len(xyxy), dtype=np.float32))
+
+class _Result:
+    def __init__(self, xyxy):
+        self.boxes = _Boxes(xyxy)
+
+class SpriteModel:
+    """Mesma interface de predict() do Ultralytics, detectando componentes claros."""
+    def __init__(self, weights=None):
+        self.weights = weights
+
+    @staticmethod
+    def _detect(frame: np.ndarray) -> _Result:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        n, _, st, _ = cv2.connectedComponentsWithStats((gray > SPRITE_THR).astype(np.uint8))
+        boxes = [[x, y, x + bw, y + bh] for x, y, bw, bh, area in st[1:n] if area >= 30]
+        return _Result(np.asarray(boxes, dtype=np.float32).reshape(-1, 4))
+
+    def predict(self, source=None, **kw):
+        frames = source if isinstance(source, list) else [source]
+        return [self._detect(f) for f in frames]
+
+def use_sprite_detector():
+    """Troca a classe YOLO do yolo_counter pelo detector de sprites (backend 'torch')."""
+    # workers de trechos/pipeline precisam herdar a troca: fork em vez de spawn
+    os.environ.setdefault("CHUNK_MP_START", "fork")
+    import yolo_counter
+    yolo_counter.YOLO = SpriteModel
+    yolo_counter.YOLO_AVAILABLE = True
+    return yolo_counter
+
+# ---------- medição ----------
+def _proc_rss(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for ln in f:
+                if ln.startswith("VmRSS:"):
+                    return int(ln.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+class RssSampler:
+    """Pico de RSS (processo + filhos do multiprocessing) durante um trecho de código."""
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> int:
+        import multiprocessing as mp
+        return _proc_rss(os.getpid()) + sum(_proc_rss(p.pid) for p in mp.active_children())
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._sample())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if sys.platform.startswith("linux"):
+            self._thread = threading.Thread(target=self._loop, name="rss-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            import resource  # sem /proc: pico do processo inteiro (não só deste trecho)
+            scale = 1 if sys.platform == "darwin" else 1024
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        return False
+
+def _stages(payload: dict) -> Dict[str, float]:
+    """Tempo total por estágio (perfil do job) + o que os resumos do payload reportam."""
+    out: Dict[str, float] = {}
+    for name, st in ((payload.get("profile") or {}).get("stages") or {}).items():
+        out[f"{name}_s"] = st["total_s"]
+    s = payload.get("sampling") or {}
+    if "skip_s" in s:
+        out["skip_s"] = s["skip_s"]
+    if payload.get("motion"):
+        out["motion_skipped"] = payload["motion"].get("skipped")
+    for st in (payload.get("pipeline") or {}).get("stages", []):
+        out[f"{st['stage']}_busy_s"] = st.get("busy_s")
+        out[f"{st['stage']}_stall_s"] = st.get("stall_s")
+    ann = payload.get("annotated") or {}
+    if "encode_s" in ann:
+        out["encode_s"] = ann["encode_s"]
+        out["encode_stall_s"] = ann.get("stall_s")
+    return out
+
+def _accuracy(gt: dict, got_in: int, got_out: int) -> dict:
+    err = abs(got_in - gt["in"]) + abs(got_out - gt["out"])
+    return {"gt_in": gt["in"], "gt_out": gt["out"], "in": got_in, "out": got_out,
+            "exact": err == 0, "accuracy": round(1.0 - err / max(1, gt["in"] + gt["out"]), 4)}
+
+def run_case(yc, video: str, gt: dict, api: str, sample_fps: float, **opts) -> dict:
+    """Uma execução cronometrada (sem cache de detecções) de process_video ou process_stream."""
+    t0 = time.perf_counter()
+    with RssSampler() as rss:
+        if api == "stream":
+            payload = {"ok": False, "error": "sem evento final"}
+            for ev in yc.process_stream(video, line_norm=LINE, sample_fps=sample_fps,
+                                        use_cache=False, profile=True, **opts):
+                if ev.get("type") == "done":
+                    payload = {"ok": True, **ev}
+                elif ev.get("type") == "error":
+                    payload = {"ok": False, "error": ev.get("message")}
+        else:
+            payload = yc.process_video(video, line_norm=LINE, sample_fps=sample_fps,
+                                       use_cache=False, profile=True, **opts)
+    elapsed = time.perf_counter() - t0
+    row = {"api": api, "sample_fps": sample_fps, "elapsed_s": round(elapsed, 4),
+           "peak_rss_mb": round(rss.peak / 2**20, 1), "ok": bool(payload.get("ok"))}
+    if not payload.get("ok"):
+        row["error"] = payload.get("error")
+        return row
+    sampling = payload.get("sampling") or {}
+    n_frames = int(round(gt["seconds"] * gt["fps"]))
+    frames = sampling.get("decoded") or max(1, n_frames // max(1, sampling.get("step", 1)))
+    row.update({
+        "frames": frames,
+        "fps": round(frames / max(1e-9, elapsed), 2),             # frames amostrados/s
+        "video_x_realtime": round(gt["seconds"] / max(1e-9, elapsed), 2),
+        "stages": _stages(payload),
+        "strategy": sampling.get("strategy"),
+        **_accuracy(gt, int(payload["in_total"]), int(payload["out_total"])),
+    })
+    return row
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+def run(grid: dict, detector_mode: str = "sprite", workers: int = 0, repeat: int = 1,
+        seed: int = 0, **opts) -> dict:
+    yc = use_sprite_detector() if detector_mode == "sprite" else __import__("yolo_counter")
+    if not yc.YOLO_AVAILABLE:
+        raise SystemExit("YOLO indisponível: use --detector sprite")
+    videos_dir = os.path.join(BENCH_DIR, "videos")
+    # aquecimento fora da medição (carga do modelo / pools de processos)
+    warm = os.path.join(videos_dir, f"warm_320x180_4s_seed{seed}.mp4")
+    make_video(warm, 320, 180, 4, seed=seed)
+    yc.process_video(warm, line_norm=LINE, sample_fps=5.0, workers=workers, use_cache=False, **opts)
+    runs = []
+    for res in grid["resolutions"]:
+        w, h = (int(v) for v in res.lower().split("x"))
+        for seconds in grid["seconds"]:
+            video = os.path.join(videos_dir, f"{w}x{h}_{seconds}s_seed{seed}.mp4")
+            gt = make_video(video, w, h, seconds, seed=seed)
+            for sample_fps in grid["sample_fps"]:
+                for api in grid["apis"]:
+                    for rep in range(max(1, repeat)):
+                        row = run_case(yc, video, gt, api, float(sample_fps), workers=workers, **opts)
+                        row.update({"case": f"{api}/{w}x{h}/{seconds}s/{sample_fps:g}fps",
+                                    "resolution": f"{w}x{h}", "seconds": seconds, "repeat": rep})
+                        runs.append(row)
+                        print(json.dumps({k: row.get(k) for k in ("case", "elapsed_s", "fps", "in", "out",
+                                                                   "gt_in", "gt_out", "peak_rss_mb")}),
+                              file=sys.stderr)
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git": _git_rev(),
+            "host": platform.node(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "detector": detector_mode,
+            "workers": workers,
+            "seed": seed,
+            "opts": opts,
+        },
+        "runs": runs,
+    }
+
+# ---------- paridade ----------
+# Configuração de referência (o caminho mais simples) e variantes que só podem virar padrão
+# se contarem igual a ela: mesmos totais, mesmas janelas e o gabarito dos clipes.
+# Otimizações que mudam o que o contador vê (MOTION_GATE, ROI_CROP) ficam opt-in até
+# 'python bench.py parity --full' passar para elas.
+PARITY_BASE = {"motion_gate": False, "roi_crop": False, "workers": 1, "batch_size": 1, "pipeline": False}
+PARITY_VARIANTS = {
+    "gate": {"motion_gate": True},
+    "roi": {"roi_crop": True},
+    "chunked": {"workers": 2},
+}
+
+def _counts(payload: dict) -> dict:
+    return {"in": payload.get("in_total"), "out": payload.get("out_total"),
+            "windows": [(w["in"], w["out"]) for w in payload.get("windows") or []]}
+
+def parity(grid: dict, variants: List[str], detector_mode: str = "sprite", seed: int = 0) -> List[dict]:
+    """Roda cada clipe da grade na referência e em cada variante; uma linha por (caso, variante)."""
+    yc = use_sprite_detector() if detector_mode == "sprite" else __import__("yolo_counter")
+    if not yc.YOLO_AVAILABLE:
+        raise SystemExit("YOLO indisponível: use --detector sprite")
+    videos_dir = os.path.join(BENCH_DIR, "videos")
+    rows = []
+    for res in grid["resolutions"]:
+        w, h = (int(v) for v in res.lower().split("x"))
+        for seconds in grid["seconds"]:
+            video = os.path.join(videos_dir, f"{w}x{h}_{seconds}s_seed{seed}.mp4")
+            gt = make_video(video, w, h, seconds, seed=seed)
+            for sample_fps in grid["sample_fps"]:
+                case = f"{w}x{h}/{seconds}s/{sample_fps:g}fps"
+                run_opts = {"line_norm": LINE, "sample_fps": float(sample_fps), "use_cache": False}
+                ref = yc.process_video(video, **run_opts, **PARITY_BASE)
+                if not ref.get("ok"):
+                    rows.append({"case": case, "variant": "base", "ok": False, "error": ref.get("error")})
+                    continue
+                base = _counts(ref)
+                for name in variants:
+                    got = yc.process_video(video, **run_opts, **{**PARITY_BASE, **PARITY_VARIANTS[name]})
+                    row = {"case": case, "variant": name, "ok": bool(got.get("ok"))}
+                    if not got.get("ok"):
+                        row["error"] = got.get("error")
+                    else:
+                        counts = _counts(got)
+                        row.update({"same_as_base": counts == base,
+                                    **_accuracy(gt, int(counts["in"]), int(counts["out"]))})
+                    rows.append(row)
+                    print(json.dumps(row), file=sys.stderr)
+    return rows
+
+def compare(old: dict, new: dict) -> List[dict]:
+    """Casa execuções pelo 'case' (média das repetições) e reporta razão de vazão e contagens."""
+    def by_case(doc):
+        acc: Dict[str, List[dict]] = {}
+        for r in doc.get("runs", []):
+            if r.get("ok"):
+                acc.setdefault(r["case"], []).append(r)
+        return {k: {"fps": float(np.mean([r["fps"] for r in v])),
+                    "rss": float(np.max([r["peak_rss_mb"] for r in v])),
+                    "exact": all(r["exact"] for r in v),
+                    "counts": (v[-1]["in"], v[-1]["out"])} for k, v in acc.items()}
+    a, b = by_case(old), by_case(new)
+    rows = []
+    for case in sorted(set(a) | set(b)):
+        ra, rb = a.get(case), b.get(case)
+        row = {"case": case}
+        if ra and rb:
+            row.update({"fps_old": round(ra["fps"], 2), "fps_new": round(rb["fps"], 2),
+                        "speedup": round(rb["fps"] / max(1e-9, ra["fps"]), 3),
+                        "rss_delta_mb": round(rb["rss"] - ra["rss"], 1),
+                        "counts_changed": ra["counts"] != rb["counts"], "exact_new": rb["exact"]})
+        else:
+            row["only_in"] = "old" if ra else "new"
+        rows.append(row)
+    return rows
+
+def _csv(val: str, cast=str) -> list:
+    return [cast(v) for v in val.split(",") if v.strip()]
+
+def _main(argv: List[str]) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark reprodutível do yolo_counter.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run", help="gera os vídeos (se preciso), mede e grava JSON")
+    r.add_argument("--quick", action="store_true", help="grade mínima (1 caso)")
+    r.add_argument("--detector", choices=("sprite", "model"), default="sprite")
+    r.add_argument("--resolutions", type=_csv)
+    r.add_argument("--seconds", type=lambda v: _csv(v, int))
+    r.add_argument("--sample-fps", type=lambda v: _csv(v, float))
+    r.add_argument("--apis", type=_csv, help="video,stream")
+    r.add_argument("--workers", type=int, default=0)
+    r.add_argument("--backend", default=None)
+    r.add_argument("--repeat", type=int, default=1)
+    r.add_argument("--seed", type=int, default=0)
+    r.add_argument("--annotated", action="store_true", help="inclui o vídeo anotado (process_video)")
+    r.add_argument("--out", default=None)
+    c = sub.add_parser("compare", help="compara dois JSONs de resultado")
+    c.add_argument("old")
+    c.add_argument("new")
+    p = sub.add_parser("parity", help="contagens de cada variante contra a referência e o gabarito")
+    p.add_argument("--variants", type=_csv, default=sorted(PARITY_VARIANTS),
+                   help=",".join(sorted(PARITY_VARIANTS)))
+    p.add_argument("--full", action="store_true", help="grade completa (padrão: mínima)")
+    p.add_argument("--detector", choices=("sprite", "model"), default="sprite")
+    p.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "compare":
+        with open(args.old, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        with open(args.new, "r", encoding="utf-8") as f:
+            new = json.load(f)
+        print(json.dumps(compare(old, new), indent=2))
+        return 0
+    if args.cmd == "parity":
+        unknown = [v for v in args.variants if v not in PARITY_VARIANTS]
+        if unknown:
+            ap.error(f"variantes desconhecidas: {','.join(unknown)}")
+        rows = parity(GRID_FULL if args.full else GRID_QUICK, args.variants, args.detector, args.seed)
+        bad = [f"{r['case']}:{r['variant']}" for r in rows if not r.get("ok") or not r.get("same_as_base", True)
+               or (args.detector == "sprite" and not r.get("exact", True))]
+        print(json.dumps({"runs": len(rows), "mismatches": bad}, indent=2))
+        return 1 if bad else 0
+
+    grid = dict(GRID_QUICK if args.quick else GRID_FULL)
+    for key, val in (("resolutions", args.resolutions), ("seconds", args.seconds),
+                     ("sample_fps", args.sample_fps), ("apis", args.apis)):
+        if val:
+            grid[key] = val
+    opts = {"save_annotated": args.annotated}
+    if args.backend:
+        opts["backend"] = args.backend
+    result = run(grid, args.detector, args.workers, args.repeat, args.seed, **opts)
+    out = args.out or os.path.join(BENCH_DIR, f"results-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    bad = [r["case"] for r in result["runs"] if not r.get("ok") or
+           (args.detector == "sprite" and not r.get("exact"))]
+    print(json.dumps({"out": out, "runs": len(result["runs"]), "mismatches": bad}, indent=2))
+    return 1 if bad and args.detector == "sprite" else 0
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
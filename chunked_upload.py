@@ -0,0 +1,205 @@
+# chunked_upload.py
+# Upload em partes com retomada: init -> PUT de blocos no offset -> finalize.
+# Cada bloco vai direto do corpo do request para o arquivo parcial (sem buffer do
+# Werkzeug) e alimenta o sha256 incremental; no finalize o arquivo ganha nome pelo
+# conteúdo (dedup de reenvios), o hash fica registrado para os caches e o contêiner é
+# sondado uma única vez, com índice de keyframes (video_meta).
+import os, json, time, uuid, hashlib, threading
+from typing import BinaryIO, Dict, Optional
+
+import detection_cache
+import video_meta
+
+UPLOAD_CHUNK_MAX_MB = float(os.environ.get("UPLOAD_CHUNK_MAX_MB", "64"))   # por PUT
+UPLOAD_CHUNK_MB = float(os.environ.get("UPLOAD_CHUNK_MB", "8"))            # sugerido ao cliente
+UPLOAD_MAX_GB = float(os.environ.get("UPLOAD_MAX_GB", "50"))
+PARTIAL_DIRNAME = ".partial"
+IO_BLOCK = 1 << 20
+
+class UploadError(Exception):
+    """Erro do protocolo com status HTTP e campos extras para a resposta (ex.: offset)."""
+    def __init__(self, message: str, status: int = 400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+class UploadSession:
+    """
+    Um upload em andamento: '<id>.part' (bytes contíguos recebidos) + '<id>.json'.
+    O offset é sempre o tamanho do .part; o hash cobre exatamente esses bytes.
+    """
+    def __init__(self, root: str, upload_id: str, filename: str, ext: str,
+                 size: Optional[int], created: float):
+        self.root = root
+        self.id = upload_id
+        self.filename = filename
+        self.ext = ext
+        self.size = size
+        self.created = created
+        self.lock = threading.Lock()
+        self.part_path = os.path.join(root, f"{upload_id}.part")
+        self.state_path = os.path.join(root, f"{upload_id}.json")
+        self.offset = os.path.getsize(self.part_path) if os.path.exists(self.part_path) else 0
+        self._hash = hashlib.sha256()
+        if self.offset:
+            # retomada depois de reiniciar o servidor: única releitura do prefixo
+            with open(self.part_path, "rb") as f:
+                for buf in iter(lambda: f.read(IO_BLOCK), b""):
+                    self._hash.update(buf)
+
+    def save_state(self):
+        with open(self.state_path, "w", encoding="utf-8") as f:
+            json.dump({"id": self.id, "filename": self.filename, "ext": self.ext,
+                       "size": self.size, "created": self.created}, f)
+
+    def status(self) -> dict:
+        return {"upload_id": self.id, "filename": self.filename, "size": self.size,
+                "offset": self.offset, "chunk_size": int(UPLOAD_CHUNK_MB * 1024 * 1024)}
+
+    def write(self, stream: BinaryIO, offset: int, length: Optional[int] = None) -> int:
+        """
+        Grava o corpo a partir de 'offset'. Offset atrás do recebido (bloco reenviado após
+        queda) descarta a parte já gravada; à frente -> 409 com o offset esperado.
+        """
+        max_chunk = int(UPLOAD_CHUNK_MAX_MB * 1024 * 1024)
+        if length is not None and length > max_chunk:
+            raise UploadError(f"Bloco maior que {UPLOAD_CHUNK_MAX_MB:g} MB.", 413)
+        with self.lock:
+            if offset > self.offset or offset < 0:
+                raise UploadError("Offset fora de ordem.", 409, offset=self.offset)
+            skip = self.offset - offset
+            received = 0
+            with open(self.part_path, "ab") as f:
+                while True:
+                    want = IO_BLOCK if length is None else min(IO_BLOCK, length - received)
+                    if want <= 0:
+                        break
+                    buf = stream.read(want)
+                    if not buf:
+                        break
+                    received += len(buf)
+                    if received > max_chunk:
+                        raise UploadError(f"Bloco maior que {UPLOAD_CHUNK_MAX_MB:g} MB.", 413,
+                                          offset=self.offset)
+                    if skip:
+                        cut = min(skip, len(buf))
+                        buf, skip = buf[cut:], skip - cut
+                        if not buf:
+                            continue
+                    if self.size is not None and self.offset + len(buf) > self.size:
+                        raise UploadError("Mais bytes que o tamanho declarado.", 400, offset=self.offset)
+                    f.write(buf)
+                    self._hash.update(buf)
+                    self.offset += len(buf)  # bloco a bloco: queda no meio ainda retoma daqui
+            return self.offset
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+class UploadStore:
+    """Sessões de upload em '<uploads>/.partial' (sobrevivem a reinício do servidor)."""
+    def __init__(self, uploads_dir: str, allowed_ext):
+        self.uploads_dir = uploads_dir
+        self.allowed_ext = set(allowed_ext)
+        self.root = os.path.join(uploads_dir, PARTIAL_DIRNAME)
+        self._sessions: Dict[str, UploadSession] = {}
+        self._lock = threading.Lock()
+
+    def _ext(self, filename: str) -> str:
+        ext = os.path.splitext(filename or "")[1].lower()
+        if ext not in self.allowed_ext:
+            raise UploadError("Extensão inválida. Use mp4/avi/mkv/mov.", 400)
+        return ext
+
+    def create(self, filename: str, size: Optional[int] = None) -> UploadSession:
+        ext = self._ext(filename)
+        if size is not None:
+            size = int(size)
+            if size < 0 or size > UPLOAD_MAX_GB * 1024 ** 3:
+                raise UploadError(f"Tamanho inválido (máximo {UPLOAD_MAX_GB:g} GB).", 413)
+        os.makedirs(self.root, exist_ok=True)
+        sess = UploadSession(self.root, uuid.uuid4().hex, os.path.basename(filename), ext, size, time.time())
+        open(sess.part_path, "wb").close()
+        sess.save_state()
+        with self._lock:
+            self._sessions[sess.id] = sess
+        return sess
+
+    def get(self, upload_id: str) -> UploadSession:
+        if not upload_id or not all(c in "0123456789abcdef" for c in upload_id):
+            raise UploadError("Upload não encontrado.", 404)
+        with self._lock:
+            sess = self._sessions.get(upload_id)
+            if sess is not None and os.path.exists(sess.part_path):
+                return sess
+            state_path = os.path.join(self.root, f"{upload_id}.json")
+            try:
+                with open(state_path, "r", encoding="utf-8") as f:
+                    st = json.load(f)
+            except (OSError, ValueError):
+                self._sessions.pop(upload_id, None)
+                raise UploadError("Upload não encontrado (expirado?).", 404)
+            sess = UploadSession(self.root, upload_id, st["filename"], st["ext"], st.get("size"), st["created"])
+            self._sessions[upload_id] = sess
+            return sess
+
+    def abort(self, upload_id: str):
+        sess = self.get(upload_id)
+        with self._lock:
+            self._sessions.pop(upload_id, None)
+        for p in (sess.part_path, sess.state_path):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+    def finalize(self, upload_id: str, sha256: Optional[str] = None) -> dict:
+        """
+        Fecha o upload: confere tamanho/hash, dá nome pelo conteúdo (reenvio do mesmo
+        arquivo reaproveita o existente), registra o hash e sonda o contêiner.
+        """
+        sess = self.get(upload_id)
+        with sess.lock:
+            if sess.size is not None and sess.offset != sess.size:
+                raise UploadError("Upload incompleto.", 409, offset=sess.offset)
+            digest = sess.hexdigest()
+            if sha256 and sha256.lower() != digest:
+                raise UploadError("Hash não confere com o conteúdo recebido.", 422, sha256=digest)
+            final = os.path.join(self.uploads_dir, f"{digest[:32]}{sess.ext}")
+            dedup = os.path.exists(final) and os.path.getsize(final) == sess.offset
+            if dedup:
+                os.remove(sess.part_path)
+                video_meta.touch(final)
+            else:
+                os.replace(sess.part_path, final)
+            try:
+                os.remove(sess.state_path)
+            except OSError:
+                pass
+        with self._lock:
+            self._sessions.pop(upload_id, None)
+        try:
+            meta = video_meta.register(final, digest, sess.filename)
+        except ValueError:
+            os.remove(final)
+            raise UploadError("Arquivo não é um vídeo legível.", 422)
+        detection_cache.remember_hash(final, digest)
+        return {"path": final, "sha256": digest, "size": sess.offset, "dedup": dedup,
+                "meta": video_meta.public(meta)}
+
+    def ingest(self, stream: BinaryIO, filename: str) -> dict:
+        """Upload de uma vez (rota /upload antiga) pelo mesmo caminho: hash sem releitura."""
+        sess = self.create(filename)
+        try:
+            while True:
+                before = sess.offset
+                sess.write(stream, sess.offset, int(UPLOAD_CHUNK_MAX_MB * 1024 * 1024))
+                if sess.offset == before:
+                    break
+            return self.finalize(sess.id)
+        except Exception:
+            try:
+                self.abort(sess.id)
+            except UploadError:
+                pass
+            raise
@@ -1,7 +1,23 @@
+# chunker.py
+# Segmentação de vídeo em trechos de ~chunk_seconds. Corta com '-c copy' nos keyframes
+# (índice do video_meta), sem reencodar: custa leitura de disco, não CPU. Reencode
+# (H.264 + AAC com keyframes forçados) fica só como fallback para contêineres/codecs que
+# não aceitam cópia. Cada segmento volta com início exato (s) e offset de frames no
+# vídeo original, para mapear índices locais para o tempo global.
 import os
+import csv
+import math
+import bisect
+import shutil
 import subprocess
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+
+import video_meta
+
+SEGMENT_MODE = os.environ.get("SEGMENT_MODE", "auto")  # auto | copy | reencode
+FFMPEG_BIN = video_meta.FFMPEG_BIN
+COPY_EXTS = {".mp4", ".mov", ".mkv", ".avi"}
 
 def run_ffmpeg(cmd: list):
     proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
@@ -9,49 +25,156 @@ def run_ffmpeg(cmd: list):
         raise RuntimeError(proc.stderr.decode("utf-8", errors="ignore"))
     return proc
 
-def split_into_chunks(input_video: str, out_dir: str, chunk_seconds: int = 60) -> List[str]:
+def plan_cuts(keyframes: List[float], duration_s: float, chunk_seconds: float) -> List[float]:
     """
-    Corta o vídeo em segmentos de 'chunk_seconds' usando o segment muxer.
-    - Reencode para H.264 + AAC para garantir concat posterior (parâmetros idênticos).
+    Instantes de corte: para cada múltiplo de chunk_seconds, o keyframe mais próximo.
+    Sem keyframes intermediários o vídeo fica num segmento só (cópia não corta no meio de GOP).
     """
-    outp = Path(out_dir)
-    outp.mkdir(parents=True, exist_ok=True)
-    pattern = outp / "seg_%03d.mp4"
+    if not keyframes or chunk_seconds <= 0:
+        return []
+    t0 = keyframes[0]
+    cuts: List[float] = []
+    target = t0 + chunk_seconds
+    while target < t0 + duration_s:
+        i = bisect.bisect_left(keyframes, target)
+        kf = min(keyframes[max(0, i - 1):i + 1], key=lambda k: abs(k - target))
+        if kf > (cuts[-1] if cuts else t0):
+            cuts.append(kf)
+        target += chunk_seconds
+    return cuts
+
+def _read_segment_list(list_path: Path, out_dir: Path) -> List[Tuple[str, float, float]]:
+    """(arquivo, início, fim) de cada segmento como o muxer realmente cortou."""
+    rows = []
+    with list_path.open("r", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) >= 3:
+                rows.append((str(out_dir / row[0]), float(row[1]), float(row[2])))
+    return rows
 
+def _segment(input_video: str, out_dir: Path, ext: str, codec_args: list, split_args: list):
+    list_path = out_dir / "_segments.csv"
+    for p in out_dir.glob("seg_*"):
+        p.unlink()
     cmd = [
-        "ffmpeg", "-y", "-i", input_video,
-        "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
-        "-c:a", "aac", "-ar", "48000", "-ac", "2",
-        "-force_key_frames", f"expr:gte(t,n_forced*{chunk_seconds})",
-        "-f", "segment",
-        "-segment_time", str(chunk_seconds),
+        FFMPEG_BIN, "-y", "-hide_banner", "-loglevel", "error", "-nostdin",
+        "-i", input_video,
+        "-map", "0:v:0", "-map", "0:a?",
+        *codec_args,
+        "-f", "segment", *split_args,
         "-reset_timestamps", "1",
-        str(pattern)
+        "-segment_list", str(list_path), "-segment_list_type", "csv",
+        str(out_dir / f"seg_%03d{ext}"),
     ]
     run_ffmpeg(cmd)
+    rows = _read_segment_list(list_path, out_dir)
+    try:
+        list_path.unlink()
+    except OSError:
+        pass
+    return rows
 
-    segs = sorted([str(p) for p in outp.glob("seg_*.mp4")])
-    if not segs:
+def _split_args(cuts: List[float], fps: float) -> list:
+    """Cortes explícitos; a tolerância de meio frame cobre o arredondamento dos instantes."""
+    if not cuts:
+        return ["-segment_time", str(10 ** 9)]
+    return ["-segment_times", ",".join(f"{t:.6f}" for t in cuts),
+            "-segment_time_delta", f"{0.5 / fps:.6f}"]
+
+def split_into_chunks(input_video: str, out_dir: str, chunk_seconds: int = 60,
+                      mode: Optional[str] = None) -> List[dict]:
+    """
+    Corta o vídeo em segmentos de ~chunk_seconds. Retorna, em ordem:
+      {index, path, start_s, end_s, start_frame, frames, copied}
+    start_s/end_s são relativos ao início do vídeo; start_frame é o índice global do
+    1º frame do segmento (frame local i -> start_frame + i). mode: auto | copy | reencode.
+    """
+    mode = (mode or SEGMENT_MODE).lower()
+    if mode not in ("auto", "copy", "reencode"):
+        raise ValueError("mode inválido (auto | copy | reencode).")
+    if not shutil.which(FFMPEG_BIN):
+        raise RuntimeError("ffmpeg não encontrado.")
+    outp = Path(out_dir)
+    outp.mkdir(parents=True, exist_ok=True)
+    meta = video_meta.get(input_video, keyframes=(mode != "reencode"))
+    fps = float(meta.get("fps") or 0.0) or 25.0
+    duration = float(meta.get("duration_s") or 0.0)
+    ext = os.path.splitext(input_video)[1].lower()
+
+    rows = None
+    copied = False
+    t0 = 0.0
+    if mode != "reencode" and meta.get("keyframes") and ext in COPY_EXTS:
+        t0 = meta["keyframes"][0]
+        cuts = plan_cuts(meta["keyframes"], duration, chunk_seconds)
+        try:
+            rows = _segment(input_video, outp, ext, ["-c", "copy"], _split_args(cuts, fps))
+            copied = True
+        except RuntimeError:
+            if mode == "copy":
+                raise
+            rows, t0 = None, 0.0
+    elif mode == "copy":
+        raise RuntimeError("Sem índice de keyframes ou contêiner sem suporte a cópia.")
+    if rows is None:
+        cuts = [k * float(chunk_seconds) for k in range(1, int(math.ceil(duration / chunk_seconds)))] \
+            if chunk_seconds > 0 else []
+        forced = ",".join(f"{t:.6f}" for t in [0.0] + cuts)
+        rows = _segment(input_video, outp, ".mp4", [
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
+            "-c:a", "aac", "-ar", "48000", "-ac", "2",
+            "-force_key_frames", forced,
+        ], _split_args(cuts, fps))
+    if not rows:
         raise RuntimeError("Segmentação FFmpeg não gerou arquivos.")
+
+    # o segment_list traz o pts do 1º pacote (com atraso de B-frames no meio do vídeo):
+    # cada início é ajustado ao corte planejado mais próximo, que é o instante exato
+    bounds = [t0] + cuts
+    starts_s = [min(bounds, key=lambda c: abs(c - start)) - t0 for _, start, _ in rows]
+    total = int(meta.get("frames") or 0) or int(round(duration * fps))
+    starts = [int(round(t * fps)) for t in starts_s]
+    segs = []
+    for i, (path, _, _) in enumerate(rows):
+        last = i + 1 == len(rows)
+        nxt = max(total, starts[i]) if last else starts[i + 1]
+        segs.append({
+            "index": i,
+            "path": path,
+            "start_s": round(starts_s[i], 6),
+            "end_s": round(duration if last else starts_s[i + 1], 6),
+            "start_frame": starts[i],
+            "frames": nxt - starts[i],
+            "copied": copied,
+        })
     return segs
 
-def concat_videos_mp4(segments: List[str], output_path: str):
+def to_global(segment: dict, local_frame: int, fps: float) -> Tuple[int, float]:
+    """Frame local de um segmento -> (frame global, tempo global em s)."""
+    g = segment["start_frame"] + int(local_frame)
+    return g, g / (fps or 25.0)
+
+def concat_videos_mp4(segments: List, output_path: str):
     """
-    Concatena segmentos mp4 com o demuxer 'concat' (sem recodificar).
-    Exige todos com os mesmos codecs/parâmetros (garantimos acima).
+    Concatena segmentos (caminhos ou dicts de split_into_chunks) com o demuxer 'concat'
+    (sem recodificar). Exige todos com os mesmos codecs/parâmetros (mesma origem).
     """
     outp = Path(output_path)
     outp.parent.mkdir(parents=True, exist_ok=True)
     list_file = outp.parent / "_concat_list.txt"
     with list_file.open("w", encoding="utf-8") as f:
         for s in segments:
-            f.write(f"file '{Path(s).as_posix()}'\n")
+            path = s["path"] if isinstance(s, dict) else s
+            f.write(f"file '{Path(path).resolve().as_posix()}'\n")
     cmd = [
-        "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", str(list_file),
+        FFMPEG_BIN, "-y", "-hide_banner", "-loglevel", "error", "-nostdin",
+        "-f", "concat", "-safe", "0", "-i", str(list_file),
         "-c", "copy", str(outp)
     ]
-    run_ffmpeg(cmd)
     try:
-        list_file.unlink()
-    except:
-        pass
+        run_ffmpeg(cmd)
+    finally:
+        try:
+            list_file.unlink()
+        except OSError:
+            pass
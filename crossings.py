@@ -0,0 +1,73 @@
+# crossings.py
+# Log compacto de cruzamentos (t, track_id, direção) e agregação vetorizada em janelas.
+# Com o log salvo, qualquer granularidade (chunk_seconds, 15 min, 1 h...) é recalculada
+# sem reprocessar o vídeo.
+import math
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# t em segundos do vídeo; dir = +1 (IN) / -1 (OUT)
+EVENT_DTYPE = np.dtype([("t", "<f8"), ("track", "<i8"), ("dir", "i1")])
+
+GRANULARITIES = {"15min": 900, "30min": 1800, "hour": 3600, "1h": 3600, "day": 86400}
+
+def fmt_hms(s) -> str:
+    s = int(max(0, s))
+    h = s // 3600
+    m = (s % 3600) // 60
+    sec = s % 60
+    return f"{h:02d}:{m:02d}:{sec:02d}"
+
+def to_event_array(rows: Iterable[Tuple[int, int, int]], fps: float) -> np.ndarray:
+    """rows = (frame_idx, track_id, dir) -> array estruturado EVENT_DTYPE ordenado por t."""
+    rows = list(rows)
+    ev = np.zeros(len(rows), dtype=EVENT_DTYPE)
+    if rows:
+        arr = np.asarray(rows, dtype=np.int64).reshape(-1, 3)
+        ev["t"] = arr[:, 0] / float(fps or 1.0)
+        ev["track"] = arr[:, 1]
+        ev["dir"] = arr[:, 2]
+        ev = ev[np.argsort(ev["t"], kind="stable")]
+    return ev
+
+def totals(events: np.ndarray) -> Tuple[int, int]:
+    return int(np.count_nonzero(events["dir"] > 0)), int(np.count_nonzero(events["dir"] < 0))
+
+def parse_granularity(val, default: int = 60) -> int:
+    """Aceita segundos ('300') ou apelidos ('15min', 'hour', 'day')."""
+    if val is None or val == "":
+        return int(default)
+    key = str(val).strip().lower()
+    if key in GRANULARITIES:
+        return GRANULARITIES[key]
+    try:
+        return max(1, int(float(key)))
+    except ValueError:
+        raise ValueError(f"Granularidade inválida: {val}")
+
+def aggregate_windows(events: np.ndarray, seconds: int, duration_s: Optional[float] = None) -> List[dict]:
+    """Janelas [k*seconds, (k+1)*seconds) com IN/OUT via bincount (sem laço por evento)."""
+    seconds = max(1, int(seconds))
+    t = events["t"]
+    dur = float(duration_s) if duration_s else (float(t.max()) if len(t) else 0.0)
+    n = max(1, int(math.ceil(dur / seconds)))
+    b = (t // seconds).astype(np.int64)
+    if len(b):
+        n = max(n, int(b.max()) + 1)
+    ins = np.bincount(b[events["dir"] > 0], minlength=n)
+    outs = np.bincount(b[events["dir"] < 0], minlength=n)
+    end_cap = max(dur, (n - 1) * seconds)
+    return [{
+        "start": fmt_hms(k * seconds),
+        "end": fmt_hms(min((k + 1) * seconds, end_cap)),
+        "in": int(ins[k]),
+        "out": int(outs[k]),
+    } for k in range(n)]
+
+def save_events(path: str, events: np.ndarray, duration_s: float, fps: float):
+    np.savez_compressed(path, events=events, duration_s=np.float64(duration_s), fps=np.float64(fps))
+
+def load_events(path: str) -> Tuple[np.ndarray, float, float]:
+    with np.load(path, allow_pickle=False) as z:
+        return z["events"], float(z["duration_s"]), float(z["fps"])
@@ -0,0 +1,142 @@
+# detection_cache.py
+# Cache em disco das detecções por frame amostrado (formato colunar .npz).
+# Chave: hash do conteúdo do vídeo + modelo + passo de amostragem (+ parâmetros do
+# rastreador). Com o cache, trocar a linha ou o chunk_seconds só re-executa o
+# LineCounter sobre os arrays, sem decodificar nem inferir de novo.
+import os, json, hashlib, threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import video_meta
+
+CACHE_DIR = os.environ.get("DETECTION_CACHE_DIR", os.path.join("cache", "detections"))
+CACHE_ENABLED = os.environ.get("DETECTION_CACHE", "1") != "0"
+FORMAT_VERSION = 1
+
+_HASH_MEMO: Dict[Tuple[str, int, int], str] = {}
+_HASH_LOCK = threading.Lock()
+
+def video_hash(path: str, block: int = 1 << 20) -> str:
+    """sha256 do conteúdo; memoizado por (caminho, tamanho, mtime) e pelo sidecar do upload."""
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _HASH_LOCK:
+        if memo_key in _HASH_MEMO:
+            return _HASH_MEMO[memo_key]
+    digest = video_meta.cached_hash(path)  # calculado no upload (sem reler o arquivo)
+    if digest:
+        remember_hash(path, digest)
+        return digest
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for buf in iter(lambda: f.read(block), b""):
+            h.update(buf)
+    digest = h.hexdigest()
+    with _HASH_LOCK:
+        _HASH_MEMO[memo_key] = digest
+    return digest
+
+def remember_hash(path: str, digest: str):
+    """Registra um hash já conhecido (ex.: calculado durante o upload)."""
+    st = os.stat(path)
+    with _HASH_LOCK:
+        _HASH_MEMO[(os.path.abspath(path), st.st_size, st.st_mtime_ns)] = digest
+
+def cache_key(vhash: str, weights: str, step: int, **params) -> str:
+    extra = json.dumps(params, sort_keys=True)
+    raw = f"v{FORMAT_VERSION}|{vhash}|{weights}|{int(step)}|{extra}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+def cache_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, key[:2], f"{key}.npz")
+
+class DetectionRecorder:
+    """Acumula (frame, caixas, conf, track ids) de um trecho; vira arrays colunares."""
+    def __init__(self):
+        self.frame_idx: List[int] = []
+        self.counts: List[int] = []
+        self.boxes: List[np.ndarray] = []
+        self.conf: List[np.ndarray] = []
+        self.ids: List[np.ndarray] = []
+
+    def add(self, idx: int, boxes: np.ndarray, conf: np.ndarray, ids: np.ndarray):
+        self.frame_idx.append(int(idx))
+        self.counts.append(len(boxes))
+        if len(boxes):
+            self.boxes.append(np.asarray(boxes, dtype=np.float32).reshape(-1, 4))
+            self.conf.append(np.asarray(conf, dtype=np.float16).reshape(-1))
+            self.ids.append(np.asarray(ids, dtype=np.int32).reshape(-1))
+
+    def to_arrays(self) -> dict:
+        return {
+            "frame_idx": np.asarray(self.frame_idx, dtype=np.int32),
+            "counts": np.asarray(self.counts, dtype=np.int32),
+            "boxes": np.concatenate(self.boxes) if self.boxes else np.zeros((0, 4), np.float32),
+            "conf": np.concatenate(self.conf) if self.conf else np.zeros(0, np.float16),
+            "track_id": np.concatenate(self.ids) if self.ids else np.zeros(0, np.int32),
+        }
+
+def save(key: str, segments: List[Tuple[Tuple[int, int, int], dict]], meta: dict) -> str:
+    """
+    segments: [((warm_start, start, end), arrays)] — um por trecho processado (1 no modo
+    serial). Grava de forma atômica (tmp + replace).
+    """
+    cols = {k: [] for k in ("frame_idx", "counts", "boxes", "conf", "track_id")}
+    seg_bounds, seg_frames = [], []
+    for bounds, arr in segments:
+        seg_bounds.append(bounds)
+        seg_frames.append(len(arr["frame_idx"]))
+        for k in cols:
+            cols[k].append(arr[k])
+    out = {k: np.concatenate(v) if v else np.zeros(0) for k, v in cols.items()}
+    out["seg_bounds"] = np.asarray(seg_bounds, dtype=np.int64).reshape(-1, 3)
+    out["seg_frames"] = np.asarray(seg_frames, dtype=np.int64)
+    out["meta"] = np.array(json.dumps(meta))
+
+    path = cache_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+    np.savez_compressed(tmp, **out)
+    os.replace(tmp, path)
+    return path
+
+def load(key: str) -> Optional[dict]:
+    path = cache_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as z:
+            data = {k: z[k] for k in z.files}
+        data["meta"] = json.loads(str(data["meta"]))
+        return data
+    except Exception:
+        return None  # arquivo corrompido/versão antiga -> trata como miss
+
+def iter_segments(data: dict) -> Iterator[Tuple[int, int, int, Iterator[Tuple[int, np.ndarray, np.ndarray]]]]:
+    """Gera (warm_start, start, end, frames) com frames = iter de (idx, boxes, track_ids)."""
+    frame_idx, counts = data["frame_idx"], data["counts"]
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    f0 = 0
+    for (warm, start, end), nf in zip(data["seg_bounds"].tolist(), data["seg_frames"].tolist()):
+        def frames(a=f0, b=f0 + nf):
+            for i in range(a, b):
+                lo, hi = offsets[i], offsets[i + 1]
+                yield int(frame_idx[i]), data["boxes"][lo:hi], data["track_id"][lo:hi]
+        yield warm, start, end, frames()
+        f0 += nf
+
+def segment_arrays(data: dict) -> Iterator[Tuple[int, int, int, np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Gera (warm_start, start, end, frames, det_frame, boxes, track_ids): um trecho inteiro
+    por vez, com o frame de cada detecção (para contadores que aceitam lotes de frames).
+    """
+    frame_idx, counts = data["frame_idx"], data["counts"]
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    f0 = 0
+    for (warm, start, end), nf in zip(data["seg_bounds"].tolist(), data["seg_frames"].tolist()):
+        lo, hi = offsets[f0], offsets[f0 + nf]
+        det_frame = np.repeat(frame_idx[f0:f0 + nf].astype(np.int64), counts[f0:f0 + nf])
+        yield (warm, start, end, frame_idx[f0:f0 + nf], det_frame,
+               data["boxes"][lo:hi], data["track_id"][lo:hi])
+        f0 += nf
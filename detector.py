@@ -0,0 +1,290 @@
+# detector.py
+# Backends de detecção de pessoas atrás de uma interface única:
+#   detect(frames, imgsz=None) -> [(caixas xyxy (N,4) float32, conf (N,) float32)] por frame
+# 'torch'     = Ultralytics/PyTorch eager (model.predict), o caminho original;
+# 'onnx'      = pesos exportados para ONNX (lote e imgsz dinâmicos) rodando no ONNX
+#               Runtime (CPU), com NMS feito aqui sobre a saída crua;
+# 'onnx-int8' = o mesmo grafo com quantização estática INT8, calibrada em imagens locais.
+# Uso pela linha de comando (exportar/quantizar/comparar com o PyTorch):
+#   python detector.py export --weights yolov8n.pt
+#   python detector.py quantize --weights yolov8n.pt --calib calib/
+#   python detector.py compare video.mp4 --line 0,0.5,1,0.5 --backends torch,onnx,onnx-int8
+import os, sys, json, glob, time, argparse
+from typing import Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+DETECTOR_BACKEND = os.environ.get("DETECTOR_BACKEND", "torch")
+ONNX_DIR = os.environ.get("ONNX_DIR", "models")
+ONNX_IMGSZ = int(os.environ.get("ONNX_IMGSZ", "640"))
+ONNX_CALIB_DIR = os.environ.get("ONNX_CALIB_DIR", "calib")
+ONNX_CALIB_MAX = int(os.environ.get("ONNX_CALIB_MAX", "64"))
+ORT_THREADS = int(os.environ.get("ORT_THREADS", "0"))  # 0 = padrão do ONNX Runtime
+
+CONF_THR = 0.25
+NMS_IOU = 0.45
+MAX_DET = 300  # mesmo teto do predict do Ultralytics (max_det)
+PERSON = 0
+
+def parse_backend(val, default: str = DETECTOR_BACKEND) -> str:
+    val = (val or default or "torch").strip().lower()
+    if val not in BACKENDS:
+        raise ValueError(f"Backend inválido: {val} (use {', '.join(BACKENDS)})")
+    return val
+
+def _empty() -> Tuple[np.ndarray, np.ndarray]:
+    return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32)
+
+# ---------- PyTorch (Ultralytics) ----------
+def dets_from_result(r) -> Tuple[np.ndarray, np.ndarray]:
+    """(caixas xyxy (N,4), conf (N,)) de um resultado do Ultralytics."""
+    if getattr(r, "boxes", None) is None:
+        return _empty()
+    boxes = np.asarray(r.boxes.xyxy.cpu().numpy(), dtype=np.float32).reshape(-1, 4)
+    conf = getattr(r.boxes, "conf", None)
+    conf = (np.asarray(conf.cpu().numpy(), dtype=np.float32).reshape(-1) if conf is not None
+            else np.ones(len(boxes), dtype=np.float32))
+    return boxes, conf
+
+class TorchDetector:
+    backend = "torch"
+
+    def __init__(self, model):
+        self.model = model
+
+    def detect(self, frames: List[np.ndarray], imgsz: Optional[int] = None):
+        pred = {"imgsz": imgsz} if imgsz else {}
+        # Pessoas (classe 0); um único predict por micro-lote
+        source = frames[0] if len(frames) == 1 else list(frames)
+        res = self.model.predict(source=source, classes=[PERSON], conf=CONF_THR, max_det=MAX_DET,
+                                 verbose=False, **pred) or []
+        out = [dets_from_result(r) for r in res]
+        return out + [_empty() for _ in range(len(frames) - len(out))]
+
+# ---------- ONNX Runtime ----------
+def letterbox(frame: np.ndarray, size: Tuple[int, int]) -> Tuple[np.ndarray, float, Tuple[float, float]]:
+    """Redimensiona mantendo o aspecto e completa com cinza 114 (como no Ultralytics)."""
+    th, tw = size
+    h, w = frame.shape[:2]
+    r = min(th / float(h), tw / float(w))
+    nw, nh = int(round(w * r)), int(round(h * r))
+    img = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_LINEAR) if (nw, nh) != (w, h) else frame
+    px, py = (tw - nw) / 2.0, (th - nh) / 2.0
+    top, left = int(round(py - 0.1)), int(round(px - 0.1))
+    out = cv2.copyMakeBorder(img, top, th - nh - top, left, tw - nw - left,
+                             cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return out, r, (left, top)
+
+def to_tensor(imgs: List[np.ndarray]) -> np.ndarray:
+    """BGR HWC uint8 -> RGB NCHW float32 [0,1]."""
+    x = np.stack(imgs)[..., ::-1].transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(x, dtype=np.float32) / 255.0
+
+class OnnxDetector:
+    """
+    Sessão ONNX Runtime CPU. Aceita as duas saídas do export do Ultralytics:
+    (B, K, 6) = [x1, y1, x2, y2, score, cls] já com NMS (export nms=True) ou
+    (B, 4+nc, A) = [cx, cy, w, h, scores...] cru, com NMS feito aqui (cv2.dnn).
+    Entrada fixa (B=1, 640x640) roda frame a frame; entrada dinâmica aceita lote e imgsz.
+    """
+    backend = "onnx"
+
+    def __init__(self, path: str, imgsz: int = ONNX_IMGSZ, threads: int = ORT_THREADS):
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            opts.intra_op_num_threads = threads
+            opts.inter_op_num_threads = 1
+        self.path = path
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        shape = list(inp.shape)
+        self.static_batch = isinstance(shape[0], int)
+        self.static_hw = (shape[2], shape[3]) if all(isinstance(v, int) for v in shape[2:4]) else None
+        self.imgsz = int(imgsz)
+
+    def _size(self, imgsz: Optional[int]) -> Tuple[int, int]:
+        if self.static_hw is not None:
+            return self.static_hw
+        s = int(np.ceil((imgsz or self.imgsz) / 32.0) * 32)
+        return s, s
+
+    def detect(self, frames: List[np.ndarray], imgsz: Optional[int] = None):
+        size = self._size(imgsz)
+        boxed = [letterbox(f, size) for f in frames]
+        if self.static_batch:
+            outs = [self.session.run(None, {self.input_name: to_tensor([b[0]])})[0][0] for b in boxed]
+        else:
+            outs = list(self.session.run(None, {self.input_name: to_tensor([b[0] for b in boxed])})[0])
+        return [self._post(o, r, pad, f.shape) for o, (_, r, pad), f in zip(outs, boxed, frames)]
+
+    def _post(self, out: np.ndarray, r: float, pad: Tuple[float, float], shape) -> Tuple[np.ndarray, np.ndarray]:
+        if out.ndim == 2 and out.shape[1] == 6:  # NMS fundido
+            keep = (out[:, 4] >= CONF_THR) & (out[:, 5].astype(np.int64) == PERSON)
+            boxes, conf = out[keep, :4].astype(np.float32), out[keep, 4].astype(np.float32)
+            top = np.argsort(-conf, kind="stable")[:MAX_DET]
+            boxes, conf = boxes[top], conf[top]
+        else:
+            pred = out.T if out.shape[0] < out.shape[1] else out  # (A, 4+nc)
+            conf = pred[:, 4 + PERSON]
+            keep = conf >= CONF_THR
+            if not np.any(keep):
+                return _empty()
+            xywh, conf = pred[keep, :4], conf[keep].astype(np.float32)
+            xyxy = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1)
+            tl_wh = np.concatenate([xyxy[:, :2], xywh[:, 2:]], axis=1)
+            idx = cv2.dnn.NMSBoxes(tl_wh.tolist(), conf.tolist(), CONF_THR, NMS_IOU)
+            idx = np.asarray(idx, dtype=np.int64).reshape(-1)[:MAX_DET]  # já em score decrescente
+            boxes, conf = xyxy[idx].astype(np.float32), conf[idx]
+        if not len(boxes):
+            return _empty()
+        boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad[0]) / r
+        boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad[1]) / r
+        h, w = shape[:2]
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, w)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, h)
+        return boxes, conf
+
+# ---------- Export / quantização ----------
+def onnx_path_for(weights: str, imgsz: int = ONNX_IMGSZ) -> str:
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    # '-dyn': exports antigos (B=1 fixo) no mesmo diretório não são reaproveitados
+    return os.path.join(ONNX_DIR, f"{stem}-{int(imgsz)}-dyn.onnx")
+
+def export_onnx(weights: str, yolo_cls=None, imgsz: int = ONNX_IMGSZ, force: bool = False) -> str:
+    """
+    Exporta os pesos .pt para ONNX (uma vez; reaproveita o arquivo em ONNX_DIR). Eixos
+    dinâmicos de lote e tamanho: micro-lotes e o imgsz adaptativo do recorte de ROI valem
+    também para ONNX/INT8. 'imgsz' é só o tamanho de referência (calibração).
+    """
+    if weights.endswith(".onnx"):
+        return weights
+    dst = onnx_path_for(weights, imgsz)
+    if os.path.exists(dst) and not force:
+        return dst
+    if yolo_cls is None:
+        from ultralytics import YOLO as yolo_cls
+    model = yolo_cls(weights)
+    # sem nms=True: no Ultralytics fixado ele só vale para CoreML (NMS fica no OnnxDetector)
+    src = model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    os.replace(str(src), dst)
+    return dst
+
+def iter_calibration_images(calib_dir: str, max_images: int = ONNX_CALIB_MAX) -> Iterator[np.ndarray]:
+    """Imagens (jpg/png) do diretório; vídeos contribuem com frames espaçados."""
+    files = sorted(glob.glob(os.path.join(calib_dir, "**", "*"), recursive=True))
+    n = 0
+    for f in files:
+        ext = os.path.splitext(f)[1].lower()
+        if ext in (".jpg", ".jpeg", ".png", ".bmp"):
+            img = cv2.imread(f)
+            if img is not None:
+                n += 1
+                yield img
+        elif ext in (".mp4", ".avi", ".mov", ".mkv"):
+            cap = cv2.VideoCapture(f)
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+            for k in range(8):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, int(total * k / 8))
+                ok, img = cap.read()
+                if ok:
+                    n += 1
+                    yield img
+                if n >= max_images:
+                    break
+            cap.release()
+        if n >= max_images:
+            return
+
+def quantize_int8(onnx_path: str, calib_dir: str = ONNX_CALIB_DIR, imgsz: int = ONNX_IMGSZ,
+                  max_images: int = ONNX_CALIB_MAX, force: bool = False) -> str:
+    """Quantização estática INT8 (QDQ, pesos por canal) calibrada com imagens locais."""
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_static)
+    dst = onnx_path[:-len(".onnx")] + "-int8.onnx"
+    if os.path.exists(dst) and not force:
+        return dst
+    probe = OnnxDetector(onnx_path, imgsz)
+    size = probe._size(imgsz)
+    imgs = [letterbox(im, size)[0] for im in iter_calibration_images(calib_dir, max_images)]
+    if not imgs:
+        raise RuntimeError(f"Sem imagens de calibração em {calib_dir}.")
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self):
+            self._it = iter(imgs)
+
+        def get_next(self):
+            img = next(self._it, None)
+            return None if img is None else {probe.input_name: to_tensor([img])}
+
+    quantize_static(onnx_path, dst, _Reader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    return dst
+
+def load_detector(backend: str, weights: str, yolo_cls=None):
+    """Instancia o backend para os pesos (exporta/quantiza na primeira vez)."""
+    backend = parse_backend(backend)
+    if backend == "torch":
+        if yolo_cls is None:
+            from ultralytics import YOLO as yolo_cls
+        return TorchDetector(yolo_cls(weights))
+    path = export_onnx(weights, yolo_cls)
+    if backend == "onnx-int8":
+        path = quantize_int8(path)
+    det = OnnxDetector(path)
+    det.backend = backend
+    return det
+
+# ---------- CLI ----------
+def compare(video_path: str, line, backends=BACKENDS, **kw) -> dict:
+    """Roda process_video por backend (sem cache) e compara tempo e contagens com o 1º."""
+    import yolo_counter  # import tardio: yolo_counter importa este módulo
+    rows = []
+    for b in backends:
+        t0 = time.perf_counter()
+        r = yolo_counter.process_video(video_path, line=line, backend=b, use_cache=False,
+                                       save_annotated=False, **kw)
+        rows.append({"backend": b, "ok": r.get("ok"), "elapsed_s": round(time.perf_counter() - t0, 3),
+                     "in": r.get("in_total"), "out": r.get("out_total"), "error": r.get("error")})
+    ref = rows[0]
+    for row in rows:
+        row["speedup"] = round(ref["elapsed_s"] / row["elapsed_s"], 3) if row["elapsed_s"] else None
+        row["count_parity"] = (row["in"], row["out"]) == (ref["in"], ref["out"])
+    return {"video": video_path, "reference": ref["backend"], "results": rows}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Backends de detecção (ONNX Runtime/INT8).")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ex = sub.add_parser("export")
+    ex.add_argument("--weights", default=os.environ.get("YOLO_WEIGHTS", "yolov8n.pt"))
+    ex.add_argument("--imgsz", type=int, default=ONNX_IMGSZ)
+    qz = sub.add_parser("quantize")
+    qz.add_argument("--weights", default=os.environ.get("YOLO_WEIGHTS", "yolov8n.pt"))
+    qz.add_argument("--calib", default=ONNX_CALIB_DIR)
+    qz.add_argument("--max-images", type=int, default=ONNX_CALIB_MAX)
+    cp = sub.add_parser("compare")
+    cp.add_argument("video")
+    cp.add_argument("--line", default="0,0.5,1,0.5")
+    cp.add_argument("--backends", default=",".join(BACKENDS))
+    cp.add_argument("--sample-fps", type=float, default=5.0)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "export":
+        out = {"onnx": export_onnx(args.weights, imgsz=args.imgsz, force=True)}
+    elif args.cmd == "quantize":
+        src = export_onnx(args.weights)
+        out = {"onnx": src, "int8": quantize_int8(src, args.calib, max_images=args.max_images, force=True)}
+    else:
+        line = tuple(float(v) for v in args.line.split(","))
+        out = compare(args.video, line, [parse_backend(b) for b in args.backends.split(",")],
+                      sample_fps=args.sample_fps)
+    print(json.dumps(out, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+# frame_ring.py
+# Anel de slots de frames em memória compartilhada (multiprocessing.shared_memory) para o
+# modo em pipeline: o processo decodificador copia cada frame amostrado para um slot livre
+# e só o índice do slot trafega pelas filas; inferência e contagem leem o mesmo buffer,
+# sem serializar frames. Inclui os contadores de ocupado/espera por estágio.
+import time
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Iterable, Tuple
+
+import numpy as np
+
+class FrameRing:
+    """'n_slots' frames uint8 de formato 'shape' (h, w, 3) num único bloco compartilhado."""
+    def __init__(self, n_slots: int, shape: Tuple[int, int, int], name: str = None,
+                 create: bool = True):
+        self.n_slots = int(n_slots)
+        self.shape = tuple(int(v) for v in shape)
+        nbytes = self.n_slots * int(np.prod(self.shape))
+        self.owner = create
+        # filhos compartilham o resource_tracker do criador (anexar re-registra o mesmo
+        # nome, sem duplicar); só o dono faz unlink, uma única vez, em close()
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=max(1, nbytes))
+        self.frames = np.ndarray((self.n_slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf)
+
+    def spec(self) -> dict:
+        """Descrição picklable para anexar o anel em outro processo."""
+        return {"name": self.shm.name, "n_slots": self.n_slots, "shape": self.shape}
+
+    @classmethod
+    def attach(cls, spec: dict) -> "FrameRing":
+        return cls(spec["n_slots"], spec["shape"], spec["name"], create=False)
+
+    def put(self, slot: int, frame: np.ndarray):
+        dst = self.frames[slot]
+        if frame.shape != dst.shape:
+            import cv2  # frame fora do tamanho anunciado (ex.: rotação) -> ajusta ao slot
+            frame = cv2.resize(frame, (dst.shape[1], dst.shape[0]), interpolation=cv2.INTER_AREA)
+        np.copyto(dst, frame)
+
+    def close(self):
+        self.frames = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+class StageClock:
+    """Tempo ocupado vs. parado (esperando fila/slot) de um estágio do pipeline."""
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy_s = 0.0
+        self.stall_s = 0.0
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def stall(self):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stall_s += time.perf_counter() - t0
+
+    def summary(self) -> dict:
+        wall = time.perf_counter() - self._t0
+        self.busy_s = max(0.0, wall - self.stall_s)
+        return {
+            "stage": self.name,
+            "items": self.items,
+            "busy_s": round(self.busy_s, 4),
+            "stall_s": round(self.stall_s, 4),
+            "busy_frac": round(self.busy_s / wall, 3) if wall > 0 else 0.0,
+        }
+
+def merge_stages(parts: Iterable[dict], name: str) -> dict:
+    """Soma estágios paralelos (ex.: vários workers de inferência) num só resumo."""
+    parts = list(parts)
+    out = {"stage": name, "workers": len(parts), "items": 0, "busy_s": 0.0, "stall_s": 0.0}
+    for p in parts:
+        out["items"] += p.get("items", 0)
+        out["busy_s"] += p.get("busy_s", 0.0)
+        out["stall_s"] += p.get("stall_s", 0.0)
+    tot = out["busy_s"] + out["stall_s"]
+    out["busy_frac"] = round(out["busy_s"] / tot, 3) if tot > 0 else 0.0
+    out["busy_s"] = round(out["busy_s"], 4)
+    out["stall_s"] = round(out["stall_s"], 4)
+    return out
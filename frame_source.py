@@ -0,0 +1,172 @@
+# frame_source.py
+# Fonte de frames via subprocesso ffmpeg (rawvideo BGR num pipe). O próprio ffmpeg
+# seleciona só os frames da grade de amostragem e reduz a resolução, então apenas os
+# frames necessários cruzam para o Python. Decodificação roda em outro processo e uma
+# thread leitora preenche buffers NumPy pré-alocados (readinto, sem cópias), de modo que
+# decode e inferência se sobrepõem.
+import os, time, queue, shutil, threading, subprocess
+from collections import deque
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+FRAME_SOURCE = os.environ.get("FRAME_SOURCE", "opencv")            # padrão do modo 'auto'
+FFMPEG_BIN = os.environ.get("FFMPEG_BIN", "ffmpeg")
+FFMPEG_MAX_WIDTH = int(os.environ.get("FFMPEG_MAX_WIDTH", "1280"))  # 0 = resolução nativa
+FFMPEG_THREADS = int(os.environ.get("FFMPEG_THREADS", "0"))         # 0 = automático
+FFMPEG_PREFETCH = int(os.environ.get("FFMPEG_PREFETCH", "4"))       # frames decodificados à frente
+FFMPEG_STDERR_TAIL = 20                                             # linhas guardadas p/ erro
+
+def ffmpeg_available() -> bool:
+    return shutil.which(FFMPEG_BIN) is not None
+
+def scaled_size(w: int, h: int, max_width: int = FFMPEG_MAX_WIDTH) -> Tuple[int, int]:
+    """Tamanho de saída (pares, p/ yuv) limitado a 'max_width' mantendo o aspecto."""
+    if max_width <= 0 or w <= max_width:
+        return w - (w % 2), h - (h % 2)
+    oh = int(round(h * max_width / float(w)))
+    return max_width - (max_width % 2), max(2, oh - (oh % 2))
+
+class FfmpegFrameSource:
+    """
+    Itera (idx, frame) para os frames start_frame, start_frame+step, ... < end_frame.
+    'start_frame' deve estar na grade de 'step' (como em _iterate_frames). O frame entregue
+    é um buffer reutilizado: continua válido até o consumidor pedir mais 'hold' frames.
+    """
+    def __init__(self, video_path: str, fps: float, step: int, size: Tuple[int, int],
+                 start_frame: int = 0, end_frame: Optional[int] = None, hold: int = 8,
+                 prefetch: int = FFMPEG_PREFETCH, stats: Optional[dict] = None,
+                 threads: int = FFMPEG_THREADS):
+        self.video_path = video_path
+        self.fps = float(fps or 25.0)
+        self.step = max(1, int(step))
+        self.width, self.height = int(size[0]), int(size[1])
+        self.start = max(0, int(start_frame))
+        self.end = end_frame
+        self.hold = max(1, int(hold))
+        self.stats = stats if stats is not None else {"decoded": 0, "frames_covered": 0, "decode_s": 0.0}
+        self.threads = int(threads)
+        self.frame_bytes = self.width * self.height * 3
+        n_bufs = self.hold + max(1, int(prefetch)) + 1
+        self._bufs = [np.empty((self.height, self.width, 3), dtype=np.uint8) for _ in range(n_bufs)]
+        self._free: "queue.Queue[Optional[int]]" = queue.Queue()
+        self._filled: "queue.Queue[Optional[int]]" = queue.Queue()
+        for k in range(n_bufs):
+            self._free.put(k)
+        self._proc: Optional[subprocess.Popen] = None
+        self._reader: Optional[threading.Thread] = None
+        self._err_reader: Optional[threading.Thread] = None
+        self._err_tail: deque = deque(maxlen=FFMPEG_STDERR_TAIL)
+        self._stop = threading.Event()
+
+    def command(self) -> list:
+        cmd = [FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-nostdin"]
+        if self.threads > 0:
+            cmd += ["-threads", str(self.threads)]
+        if self.start > 0:
+            # seek preciso na entrada: meio frame antes para não perder o frame 'start'
+            cmd += ["-ss", f"{(self.start - 0.5) / self.fps:.6f}"]
+        cmd += ["-i", self.video_path, "-map", "0:v:0", "-an", "-sn"]
+        # select por índice mantém a mesma grade do modo OpenCV (fps= arredonda por tempo)
+        filters = [f"select='not(mod(n,{self.step}))'"] if self.step > 1 else []
+        filters.append(f"scale={self.width}:{self.height}:flags=area")
+        cmd += ["-vf", ",".join(filters), "-vsync", "passthrough"]
+        if self.end is not None:
+            n = max(0, -(-(int(self.end) - self.start) // self.step))
+            cmd += ["-frames:v", str(n)]
+        cmd += ["-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1"]
+        return cmd
+
+    def _read_loop(self):
+        out = self._proc.stdout
+        try:
+            while not self._stop.is_set():
+                k = self._free.get()
+                if k is None:
+                    break
+                mv = memoryview(self._bufs[k].reshape(-1))
+                n = 0
+                while n < self.frame_bytes:
+                    r = out.readinto(mv[n:])
+                    if not r:
+                        break
+                    n += r
+                if n < self.frame_bytes:
+                    break  # fim do vídeo (ou ffmpeg encerrado)
+                self._filled.put(k)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._filled.put(None)
+
+    def _drain_stderr(self):
+        # stream danificado loga a cada frame: sem drenar, o pipe enche e trava o rawvideo
+        try:
+            for line in iter(self._proc.stderr.readline, b""):
+                self._err_tail.append(line)
+        except (OSError, ValueError):
+            pass
+
+    def _start(self):
+        self._proc = subprocess.Popen(self.command(), stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE, bufsize=0)
+        self._reader = threading.Thread(target=self._read_loop, name="ffmpeg-reader", daemon=True)
+        self._reader.start()
+        self._err_reader = threading.Thread(target=self._drain_stderr, name="ffmpeg-stderr", daemon=True)
+        self._err_reader.start()
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        if self.end is not None and self.end <= self.start:
+            return
+        self._start()
+        held: deque = deque()
+        idx = self.start
+        try:
+            while True:
+                t0 = time.perf_counter()
+                k = self._filled.get()
+                self.stats["decode_s"] += time.perf_counter() - t0  # espera pelo decoder
+                if k is None:
+                    break
+                held.append(k)
+                if len(held) > self.hold:
+                    self._free.put(held.popleft())
+                self.stats["decoded"] += 1
+                self.stats["frames_covered"] += self.step
+                yield idx, self._bufs[k]
+                idx += self.step
+            if self.stats["decoded"] == 0:
+                err = self._wait_error()
+                if err:
+                    raise RuntimeError(f"ffmpeg: {err}")
+        finally:
+            self.close()
+
+    def _wait_error(self) -> str:
+        try:
+            self._proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            return ""
+        if self._proc.returncode == 0:
+            return ""
+        self._err_reader.join(timeout=5)
+        return b"".join(self._err_tail).decode("utf-8", errors="ignore").strip()[-300:]
+
+    def close(self):
+        if self._proc is None:
+            return
+        self._stop.set()
+        if self._proc.poll() is None:
+            self._proc.kill()
+        self._free.put(None)
+        if self._reader is not None:
+            self._reader.join(timeout=5)
+        if self._err_reader is not None:
+            self._err_reader.join(timeout=5)
+        for f in (self._proc.stdout, self._proc.stderr):
+            try:
+                f.close()
+            except Exception:
+                pass
+        self._proc.wait()
+        self._proc = None
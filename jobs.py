@@ -0,0 +1,288 @@
+# jobs.py
+# Fila de jobs em background: ids, pool limitado de workers, progresso compartilhado
+# entre vários assinantes SSE e coalescência de pedidos idênticos em andamento.
+# Prioridades: jobs interativos (preview via SSE) passam na frente e pausam, no próximo
+# lote, os jobs de lote em execução; jobs interativos sem assinantes são cancelados.
+# Jobs exclusivos (medição de CPU) só começam com a fila de execução vazia e seguram os
+# demais até terminar: mexem em threads do processo e no pool de trechos.
+import os, json, time, uuid, heapq, hashlib, itertools, threading
+from typing import Callable, Dict, Iterator, List, Optional
+
+JOB_WORKERS = max(1, int(os.environ.get("JOB_WORKERS", "2") or 2))
+JOB_INTERACTIVE_WORKERS = max(0, int(os.environ.get("JOB_INTERACTIVE_WORKERS", "1") or 0))
+JOB_TTL_SECONDS = float(os.environ.get("JOB_TTL_SECONDS", "3600"))
+JOB_MAX_FINISHED = int(os.environ.get("JOB_MAX_FINISHED", "200"))
+JOB_ORPHAN_GRACE_SECONDS = float(os.environ.get("JOB_ORPHAN_GRACE_SECONDS", "3"))
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+PRIORITIES = {"interactive": PRIORITY_INTERACTIVE, "batch": PRIORITY_BATCH}
+
+TERMINAL = ("done", "error", "cancelled")
+
+def parse_priority(val, default: int = PRIORITY_BATCH) -> int:
+    """Nome ou número -> um dos dois níveis (<= 0 interativo, > 0 lote)."""
+    if val is None or val == "":
+        return default
+    if isinstance(val, str) and val.lower() in PRIORITIES:
+        return PRIORITIES[val.lower()]
+    try:
+        return PRIORITY_INTERACTIVE if int(val) <= PRIORITY_INTERACTIVE else PRIORITY_BATCH
+    except (TypeError, ValueError):
+        return default
+
+def job_key(kind: str, params: dict) -> str:
+    raw = json.dumps({"kind": kind, **params}, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class Job:
+    """
+    Estado de um job. Progresso é "último valor" (assinantes lentos pulam parciais
+    intermediários); o evento terminal ('done'/'error'/'cancelled') fica guardado para consulta.
+    """
+    def __init__(self, kind: str, key: str, params: dict, priority: int = PRIORITY_BATCH,
+                 cancel_on_orphan: bool = False, exclusive: bool = False):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.params = params
+        self.priority = int(priority)
+        self.cancel_on_orphan = cancel_on_orphan
+        self.exclusive = exclusive
+        self.cancel_event = threading.Event()
+        self._manager: Optional["JobManager"] = None
+        self.status = "queued"
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.progress: Optional[dict] = None
+        self.terminal: Optional[dict] = None
+        self.subscribers = 0
+        self._seq = 0
+        self._cond = threading.Condition()
+
+    def publish(self, ev: dict):
+        with self._cond:
+            if ev.get("type") in TERMINAL:
+                if self.terminal is not None:
+                    return
+                self.terminal = ev
+                self.status = ev["type"]
+                self.finished = time.time()
+            elif ev.get("type") == "progress":
+                self.progress = ev
+            self._seq += 1
+            self._cond.notify_all()
+
+    def _mark_running(self):
+        with self._cond:
+            self.status = "running"
+            self.started = time.time()
+            self._seq += 1
+            self._cond.notify_all()
+
+    @property
+    def is_finished(self) -> bool:
+        return self.terminal is not None
+
+    def cancel(self):
+        """Pede cancelamento; o pipeline para no próximo lote (ou já, se ainda na fila)."""
+        self.cancel_event.set()
+        if self.status == "queued":
+            self.publish({"type": "cancelled"})
+
+    def should_yield(self) -> bool:
+        """True se há job mais prioritário esperando/rodando (usado como ponto de pausa)."""
+        return self._manager is not None and self._manager.has_higher_priority(self)
+
+    def _cancel_if_orphan(self):
+        with self._cond:
+            orphan = self.subscribers == 0 and self.terminal is None
+        if orphan:
+            self.cancel()
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[dict]:
+        with self._cond:
+            self._cond.wait_for(lambda: self.terminal is not None, timeout=timeout)
+            return self.terminal
+
+    def _status_event(self) -> dict:
+        return {"type": "status", "status": self.status, "job_id": self.id}
+
+    def subscribe(self, keepalive: float = 15.0) -> Iterator[Optional[dict]]:
+        """
+        Gera eventos para um assinante: status inicial, progresso mais recente a cada
+        mudança e o terminal. Gera None a cada 'keepalive' s sem novidade (ping SSE).
+        """
+        seen = -1
+        with self._cond:
+            self.subscribers += 1
+        try:
+            while True:
+                with self._cond:
+                    if self._seq == seen and self.terminal is None:
+                        self._cond.wait(keepalive)
+                    if self._seq == seen and self.terminal is None:
+                        ev = None
+                    else:
+                        seen = self._seq
+                        ev = self.terminal or self.progress or self._status_event()
+                yield ev
+                if ev is not None and ev.get("type") in TERMINAL:
+                    return
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+                orphan = self.subscribers == 0 and self.terminal is None and self.cancel_on_orphan
+            if orphan:
+                # tolera reconexão do EventSource antes de cancelar
+                t = threading.Timer(JOB_ORPHAN_GRACE_SECONDS, self._cancel_if_orphan)
+                t.daemon = True
+                t.start()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "priority": self.priority,
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+                "progress": self.progress,
+                "result": self.terminal,
+                "subscribers": self.subscribers,
+            }
+
+class JobManager:
+    """
+    Executa jobs em 'max_workers' threads por ordem de prioridade (menor = mais urgente),
+    mais 'interactive_workers' threads reservadas a jobs interativos, para que um preview
+    nunca fique atrás de lotes longos. Pedidos idênticos em andamento viram o mesmo job.
+    """
+    def __init__(self, max_workers: int = JOB_WORKERS,
+                 interactive_workers: int = JOB_INTERACTIVE_WORKERS):
+        self.max_workers = max_workers
+        self.interactive_workers = interactive_workers
+        self._lock = threading.Lock()
+        self._work = threading.Condition(self._lock)
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._jobs: Dict[str, Job] = {}
+        self._inflight: Dict[str, Job] = {}  # key -> job em fila/execução
+        self._running: Dict[str, Job] = {}
+        self._interactive_busy = 0  # workers interativos ocupados
+        for i in range(max_workers + interactive_workers):
+            t = threading.Thread(target=self._worker, args=(i >= max_workers,),
+                                 name=f"job-{i}", daemon=True)
+            t.start()
+
+    def submit(self, kind: str, params: dict, fn: Callable[[Job], None],
+               priority: int = PRIORITY_BATCH, cancel_on_orphan: bool = False,
+               exclusive: bool = False):
+        """
+        Retorna (job, coalesced). 'fn(job)' executa e publica eventos no job. 'exclusive':
+        espera os jobs em execução terminarem e roda sozinho.
+        """
+        key = job_key(kind, params)
+        with self._work:
+            self._prune()
+            job = self._inflight.get(key)
+            if job is not None and not job.is_finished:
+                return job, True
+            job = Job(kind, key, params, priority, cancel_on_orphan, exclusive)
+            job._manager = self
+            self._jobs[job.id] = job
+            self._inflight[key] = job
+            heapq.heappush(self._heap, (job.priority, next(self._seq), job, fn))
+            self._work.notify_all()
+        return job, False
+
+    def _pop(self, interactive_only: bool):
+        while self._heap and self._heap[0][2].is_finished:
+            heapq.heappop(self._heap)  # cancelado ainda na fila
+        if not self._heap or any(j.exclusive for j in self._running.values()):
+            return None
+        if interactive_only and self._heap[0][0] > PRIORITY_INTERACTIVE:
+            return None
+        if self._heap[0][2].exclusive and self._running:
+            return None  # acorda quando o último job em execução terminar (notify_all)
+        return heapq.heappop(self._heap)
+
+    def _worker(self, interactive_only: bool):
+        while True:
+            with self._work:
+                item = self._pop(interactive_only)
+                while item is None:
+                    self._work.wait()
+                    item = self._pop(interactive_only)
+                _, _, job, fn = item
+                self._running[job.id] = job
+                self._interactive_busy += int(interactive_only)
+            try:
+                self._run(job, fn)
+            finally:
+                with self._work:
+                    self._running.pop(job.id, None)
+                    self._interactive_busy -= int(interactive_only)
+                    if self._inflight.get(job.key) is job:
+                        del self._inflight[job.key]
+                    self._work.notify_all()
+
+    def _run(self, job: Job, fn: Callable[[Job], None]):
+        if job.cancel_event.is_set():
+            job.publish({"type": "cancelled"})
+            return
+        job._mark_running()
+        try:
+            fn(job)
+        except Exception as e:
+            if job.cancel_event.is_set():
+                job.publish({"type": "cancelled"})
+            else:
+                job.publish({"type": "error", "message": f"{type(e).__name__}: {e}"})
+        finally:
+            if not job.is_finished:
+                job.publish({"type": "cancelled"} if job.cancel_event.is_set()
+                            else {"type": "error", "message": "Job terminou sem resultado."})
+
+    def has_higher_priority(self, job: Job) -> bool:
+        """
+        Job mais prioritário rodando, ou na fila e com worker interativo livre para ele.
+        Os demais workers estão ocupados (senão já o teriam tirado da fila): pausar por
+        ele só travaria o job atual sem liberar ninguém.
+        """
+        with self._lock:
+            if any(j.priority < job.priority for j in self._running.values()):
+                return True
+            if self._interactive_busy >= self.interactive_workers:
+                return False
+            return any(p < job.priority and p <= PRIORITY_INTERACTIVE and not j.is_finished
+                       for p, _, j, _ in self._heap)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def depth(self) -> Dict[str, int]:
+        """Jobs na fila e em execução (para o /metrics)."""
+        with self._lock:
+            queued = sum(1 for _, _, j, _ in self._heap if not j.is_finished)
+            return {"queued": queued, "running": len(self._running)}
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [j.snapshot() for j in jobs]
+
+    def _prune(self):
+        now = time.time()
+        finished = sorted((j for j in self._jobs.values() if j.is_finished),
+                          key=lambda j: j.finished or 0)
+        drop = [j for j in finished if now - (j.finished or now) > JOB_TTL_SECONDS]
+        extra = len(finished) - len(drop) - JOB_MAX_FINISHED
+        if extra > 0:
+            drop += [j for j in finished if j not in drop][:extra]
+        for j in drop:
+            self._jobs.pop(j.id, None)
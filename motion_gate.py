@@ -0,0 +1,106 @@
+# motion_gate.py
+# Pré-filtro barato antes do YOLO: diferença de quadros em escala reduzida numa região em
+# torno da linha de contagem. Sem atividade perto da linha não há cruzamento possível,
+# então o frame pode pular a inferência (o estado do rastreador fica congelado, o que
+# pode envelhecer ou trocar IDs de quem anda devagar). Opt-in: MOTION_GATE=1.
+import os, time
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+MOTION_GATE = os.environ.get("MOTION_GATE", "0") == "1"
+MOTION_DIFF_THR = int(os.environ.get("MOTION_DIFF_THR", "25"))          # nível de cinza
+MOTION_MIN_AREA = float(os.environ.get("MOTION_MIN_AREA", "0.002"))     # fração da ROI
+MOTION_HANGOVER = int(os.environ.get("MOTION_HANGOVER", "2"))           # frames após movimento
+MOTION_MAX_SKIP = int(os.environ.get("MOTION_MAX_SKIP", "50"))          # força 1 inferência
+MOTION_PAD_FRAC = float(os.environ.get("MOTION_PAD_FRAC", "0.15"))      # margem em torno da linha
+
+def line_roi(x1: int, y1: int, x2: int, y2: int, w: int, h: int,
+             pad_frac: float = MOTION_PAD_FRAC) -> Tuple[int, int, int, int]:
+    """Retângulo (x0, y0, x1, y1) que envolve a linha com margem proporcional ao frame."""
+    pad = int(pad_frac * max(w, h))
+    rx0 = max(0, min(x1, x2) - pad)
+    ry0 = max(0, min(y1, y2) - pad)
+    rx1 = min(w, max(x1, x2) + pad)
+    ry1 = min(h, max(y1, y2) + pad)
+    if rx1 <= rx0 or ry1 <= ry0:
+        return 0, 0, w, h
+    return rx0, ry0, rx1, ry1
+
+class MotionGate:
+    """
+    Compara a ROI (cinza, reduzida, suavizada) com a ROI do último frame inferido.
+    Usar o último inferido como referência acumula movimentos lentos até passarem do
+    limiar, em vez de perdê-los entre amostras consecutivas.
+    """
+    def __init__(self, roi: Tuple[int, int, int, int], diff_thr: int = MOTION_DIFF_THR,
+                 min_area: float = MOTION_MIN_AREA, hangover: int = MOTION_HANGOVER,
+                 max_skip: int = MOTION_MAX_SKIP, work_width: int = 160):
+        self.roi = roi
+        self.diff_thr = int(diff_thr)
+        self.min_area = float(min_area)
+        self.hangover = int(hangover)
+        self.max_skip = int(max_skip)
+        rw = max(1, roi[2] - roi[0])
+        rh = max(1, roi[3] - roi[1])
+        scale = min(1.0, work_width / float(rw))
+        self.size = (max(1, int(rw * scale)), max(1, int(rh * scale)))
+        self.ref = None
+        self._hang = 0
+        self._skipped_run = 0
+        self.stats = {"checked": 0, "inferred": 0, "skipped": 0, "forced": 0, "check_s": 0.0}
+
+    @classmethod
+    def around_line(cls, x1: int, y1: int, x2: int, y2: int, w: int, h: int, **kw) -> "MotionGate":
+        pad_frac = kw.pop("pad_frac", MOTION_PAD_FRAC)
+        return cls(line_roi(x1, y1, x2, y2, w, h, pad_frac), **kw)
+
+    def _prep(self, frame) -> np.ndarray:
+        x0, y0, x1, y1 = self.roi
+        crop = frame[y0:y1, x0:x1]
+        small = cv2.resize(crop, self.size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def needs_inference(self, frame) -> bool:
+        t0 = time.perf_counter()
+        small = self._prep(frame)
+        if self.ref is None:
+            motion = True
+        else:
+            diff = cv2.absdiff(small, self.ref)
+            changed = np.count_nonzero(diff > self.diff_thr) / float(diff.size)
+            motion = changed >= self.min_area
+        if motion:
+            self._hang = self.hangover
+        forced = not motion and self._hang <= 0 and self._skipped_run >= self.max_skip
+        run = motion or self._hang > 0 or forced
+        if not motion and self._hang > 0:
+            self._hang -= 1
+
+        self.stats["checked"] += 1
+        if run:
+            self.ref = small
+            self._skipped_run = 0
+            self.stats["inferred"] += 1
+            self.stats["forced"] += int(forced)
+        else:
+            self._skipped_run += 1
+            self.stats["skipped"] += 1
+        self.stats["check_s"] += time.perf_counter() - t0
+        return run
+
+    def summary(self) -> dict:
+        out = dict(self.stats)
+        out["check_s"] = round(out["check_s"], 4)
+        out["roi"] = list(self.roi)
+        return out
+
+def merge_stats(parts) -> dict:
+    out = {"checked": 0, "inferred": 0, "skipped": 0, "forced": 0, "check_s": 0.0}
+    for p in parts:
+        for k in out:
+            out[k] += p.get(k, 0)
+    out["check_s"] = round(out["check_s"], 4)
+    return out
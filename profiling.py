@@ -0,0 +1,218 @@
+# profiling.py
+# Instrumentação leve por estágio do processamento (decode, infer, track, draw, write,
+# csv) e métricas do processo no formato texto do Prometheus (/metrics no app.py).
+# Cada job acumula um StageProfile local (sem locks no laço quente); de tempos em tempos
+# os deltas vão para o REGISTRY global. Processos worker (trechos/pipeline) devolvem o
+# summary() do seu perfil e o processo principal faz merge() + flush().
+import os, time, threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+PROFILE_FLUSH_S = float(os.environ.get("PROFILE_FLUSH_S", "1.0"))  # período de publicação
+METRICS_PREFIX = "bussight"
+# limites (s) dos histogramas por estágio: de um frame decodificado a um lote de inferência
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# contadores de itens do perfil -> métrica exportada
+COUNTERS = {
+    "frames": ("frames_total", "Frames amostrados processados."),
+    "infer_calls": ("inference_calls_total", "Chamadas ao detector (um micro-lote cada)."),
+    "infer_frames": ("inference_frames_total", "Frames enviados ao detector."),
+    "skipped": ("frames_skipped_total", "Frames sem inferência (gate de movimento)."),
+}
+
+def _bucket(seconds: float) -> int:
+    for i, b in enumerate(STAGE_BUCKETS):
+        if seconds <= b:
+            return i
+    return len(STAGE_BUCKETS)
+
+class StageProfile:
+    """
+    Tempos por estágio (n, total, máx. e histograma) + contadores de um job.
+    'publish=False' em processos filhos: quem publica é o processo principal.
+    """
+    def __init__(self, publish: bool = True):
+        self.publish = publish
+        self.stages: Dict[str, dict] = {}
+        self.counts: Dict[str, int] = {}
+        self._pending: Dict[str, dict] = {}
+        self._pending_counts: Dict[str, int] = {}
+        self._last_flush = time.perf_counter()
+        self._t0 = time.perf_counter()
+
+    @staticmethod
+    def _new_stage() -> dict:
+        return {"n": 0, "total_s": 0.0, "max_s": 0.0, "buckets": [0] * (len(STAGE_BUCKETS) + 1)}
+
+    def add(self, stage: str, seconds: float, n: int = 1):
+        for acc in (self.stages, self._pending):
+            st = acc.get(stage)
+            if st is None:
+                st = acc[stage] = self._new_stage()
+            st["n"] += n
+            st["total_s"] += seconds
+            st["max_s"] = max(st["max_s"], seconds)
+            st["buckets"][_bucket(seconds)] += 1
+        if self.publish and time.perf_counter() - self._last_flush >= PROFILE_FLUSH_S:
+            self.flush()
+
+    def count(self, name: str, n: int = 1):
+        if n:
+            self.counts[name] = self.counts.get(name, 0) + n
+            self._pending_counts[name] = self._pending_counts.get(name, 0) + n
+
+    @contextmanager
+    def stage(self, name: str, n: int = 1):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0, n)
+
+    def timed_iter(self, name: str, iterable: Iterable) -> Iterator:
+        """Repassa os itens medindo o tempo de cada next() (ex.: decode de frames)."""
+        it = iter(iterable)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            self.add(name, time.perf_counter() - t0)
+            yield item
+
+    def merge(self, summary: Optional[dict]):
+        """Soma o summary() de outro processo (ex.: worker de trecho) a este perfil."""
+        if not summary:
+            return
+        for name, s in summary.get("stages", {}).items():
+            for acc in (self.stages, self._pending):
+                st = acc.get(name)
+                if st is None:
+                    st = acc[name] = self._new_stage()
+                st["n"] += s["n"]
+                st["total_s"] += s["total_s"]
+                st["max_s"] = max(st["max_s"], s["max_s"])
+                st["buckets"] = [a + b for a, b in zip(st["buckets"], s["buckets"])]
+        for name, n in summary.get("counts", {}).items():
+            self.count(name, n)
+
+    def flush(self):
+        """Publica no REGISTRY o que acumulou desde a última publicação."""
+        self._last_flush = time.perf_counter()
+        if not self.publish:
+            return
+        pending, counts = self._pending, self._pending_counts
+        self._pending, self._pending_counts = {}, {}
+        REGISTRY.add_profile(pending, counts)
+
+    def summary(self) -> dict:
+        wall = time.perf_counter() - self._t0
+        stages = {}
+        for name, st in self.stages.items():
+            stages[name] = {"n": st["n"], "total_s": round(st["total_s"], 4),
+                            "mean_ms": round(1000.0 * st["total_s"] / max(1, st["n"]), 3),
+                            "max_s": round(st["max_s"], 4), "buckets": list(st["buckets"])}
+        busy = sum(st["total_s"] for st in self.stages.values())
+        return {"wall_s": round(wall, 4), "stages": stages, "counts": dict(self.counts),
+                "share": {k: round(v["total_s"] / busy, 3) for k, v in self.stages.items()} if busy else {}}
+
+    def report(self) -> dict:
+        """summary() sem os histogramas brutos (para o payload 'done')."""
+        out = self.summary()
+        for st in out["stages"].values():
+            st.pop("buckets", None)
+        return out
+
+class Registry:
+    """Métricas do processo: contadores, histogramas por estágio e gauges (valor ou função)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._hist: Dict[str, dict] = {}
+        self._gauges: Dict[Tuple[str, Tuple], float] = {}
+        self._gauge_fns: Dict[str, Callable[[], Dict[Tuple, float]]] = {}
+
+    def describe(self, name: str, kind: str, text: str):
+        self._help[name] = (kind, text)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = float(value)
+
+    def gauge_fn(self, name: str, fn: Callable[[], Dict[Tuple, float]], text: str = ""):
+        """Gauge calculado na hora da coleta: fn() -> {tupla de labels: valor}."""
+        self._gauge_fns[name] = fn
+        self.describe(name, "gauge", text)
+
+    def add_profile(self, stages: Dict[str, dict], counts: Dict[str, int]):
+        with self._lock:
+            for name, st in stages.items():
+                h = self._hist.get(name)
+                if h is None:
+                    h = self._hist[name] = {"count": 0, "sum": 0.0, "buckets": [0] * (len(STAGE_BUCKETS) + 1)}
+                h["count"] += sum(st["buckets"])
+                h["sum"] += st["total_s"]
+                h["buckets"] = [a + b for a, b in zip(h["buckets"], st["buckets"])]
+            for name, n in counts.items():
+                metric = COUNTERS.get(name, (f"{name}_total", ""))[0]
+                key = (metric, ())
+                self._counters[key] = self._counters.get(key, 0.0) + n
+
+    @staticmethod
+    def _labels(labels: Tuple) -> str:
+        if not labels:
+            return ""
+        inner = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                         for k, v in labels)
+        return "{" + inner + "}"
+
+    def render(self) -> str:
+        """Formato de exposição texto do Prometheus (0.0.4)."""
+        p = METRICS_PREFIX
+        lines: List[str] = []
+        with self._lock:
+            hist = {k: dict(v, buckets=list(v["buckets"])) for k, v in self._hist.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        lines += [f"# HELP {p}_stage_seconds Tempo por chamada de cada estágio do processamento.",
+                  f"# TYPE {p}_stage_seconds histogram"]
+        for stage in sorted(hist):
+            h = hist[stage]
+            cum = 0
+            for le, n in zip(STAGE_BUCKETS + ("+Inf",), h["buckets"]):
+                cum += n
+                lines.append(f'{p}_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cum}')
+            lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {h["sum"]:.6f}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {h["count"]}')
+        names = sorted({n for n, _ in counters} | {m for m, _ in COUNTERS.values()})
+        for name in names:
+            text = next((t for m, t in COUNTERS.values() if m == name), self._help.get(name, ("", ""))[1])
+            lines += [f"# HELP {p}_{name} {text}", f"# TYPE {p}_{name} counter"]
+            series = {lb: v for (n, lb), v in counters.items() if n == name} or {(): 0.0}
+            for lb, v in sorted(series.items()):
+                lines.append(f"{p}_{name}{self._labels(lb)} {v:g}")
+        gauge_series: Dict[str, Dict[Tuple, float]] = {}
+        for (name, lb), v in gauges.items():
+            gauge_series.setdefault(name, {})[lb] = v
+        for name, fn in list(self._gauge_fns.items()):
+            try:
+                gauge_series[name] = dict(fn())
+            except Exception:
+                continue  # coleta nunca derruba o /metrics
+        for name in sorted(gauge_series):
+            lines += [f"# HELP {p}_{name} {self._help.get(name, ('', ''))[1]}", f"# TYPE {p}_{name} gauge"]
+            for lb, v in sorted(gauge_series[name].items()):
+                lines.append(f"{p}_{name}{self._labels(lb)} {v:g}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+REGISTRY.describe("pipeline_inflight", "gauge", "Slots do anel do pipeline ocupados (última leitura).")
+REGISTRY.describe("annotated_queue_depth", "gauge", "Frames na fila do encoder do vídeo anotado.")
@@ -0,0 +1,167 @@
+# result_cache.py
+# Cache de resultados finais endereçado por conteúdo: (hash do vídeo + linha/zonas +
+# modelo/backend + amostragem + chunk_seconds + ajustes que mudam a contagem) -> payload
+# do /process e seus artefatos (contagem.csv, events.npz, video.mp4).
+# A pasta de saída do job é movida para RESULT_CACHE_DIR/<chave>/ (dentro de outputs/,
+# então /download e /report/windows continuam valendo) e o payload passa a apontar para
+# lá. Tamanho limitado: sai primeiro o resultado acessado há mais tempo (LRU).
+import os, json, time, shutil, hashlib, threading
+from typing import Dict, Iterable, List, Optional
+
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", os.path.join("outputs", "results"))
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE", "1") != "0"
+RESULT_CACHE_MAX_MB = float(os.environ.get("RESULT_CACHE_MAX_MB", "2048"))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "500"))
+FORMAT_VERSION = 1
+
+ARTIFACT_KEYS = ("csv_path", "events_path", "annotated_path")
+# dependem da execução, não do resultado
+VOLATILE_KEYS = ("type", "job_id", "profile", "result_cache")
+
+def result_key(vhash: str, params: dict) -> str:
+    raw = json.dumps({"v": FORMAT_VERSION, "video": vhash, **params}, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+class ResultCache:
+    """Índice em memória (carregado do disco na 1ª consulta) + uma pasta por resultado."""
+    def __init__(self, root: str = RESULT_CACHE_DIR, max_mb: float = RESULT_CACHE_MAX_MB,
+                 max_entries: int = RESULT_CACHE_MAX_ENTRIES):
+        self.root = root
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_entries = int(max_entries)
+        self._lock = threading.Lock()
+        self._index: Optional[Dict[str, dict]] = None
+        self.hits = self.misses = self.evictions = 0
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.root, key, "meta.json")
+
+    def _load_index(self) -> Dict[str, dict]:
+        if self._index is None:
+            index: Dict[str, dict] = {}
+            if os.path.isdir(self.root):
+                for key in os.listdir(self.root):
+                    mp = self._meta_path(key)
+                    try:
+                        with open(mp, "r", encoding="utf-8") as f:
+                            meta = json.load(f)
+                        meta["last_access"] = os.path.getmtime(mp)  # utime a cada acerto
+                    except (OSError, ValueError):
+                        self._drop_orphan(os.path.join(self.root, key))
+                        continue
+                    index[key] = meta
+            self._index = index
+        return self._index
+
+    @staticmethod
+    def _drop_orphan(path: str, min_age_s: float = 3600.0):
+        """Pasta sem meta.json: sobra de escrita interrompida (ou outro processo gravando agora)."""
+        try:
+            if time.time() - os.path.getmtime(path) > min_age_s:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+    def get(self, key: str, need: Iterable[str] = ()) -> Optional[dict]:
+        """Payload em cache se tiver os artefatos pedidos (ex.: 'annotated_path')."""
+        with self._lock:
+            meta = self._load_index().get(key)
+            payload = meta and meta["payload"]
+            if not payload or any(not payload.get(k) or not os.path.exists(payload[k]) for k in need):
+                self.misses += 1
+                return None
+            meta["last_access"] = time.time()
+            try:
+                os.utime(self._meta_path(key))
+            except OSError:
+                pass
+            self.hits += 1
+            return {**payload, "result_cache": "hit"}
+
+    def entry(self, key: str) -> Optional[dict]:
+        """{key, params, created, payload} de uma chave (conta como acesso)."""
+        payload = self.get(key)
+        meta = (self._index or {}).get(key)
+        if payload is None or meta is None:
+            return None
+        return {"key": key, "params": meta["params"], "created": meta["created"], "payload": payload}
+
+    def latest(self, vhash: str) -> Optional[dict]:
+        """Resultado mais recente de um vídeo, com quaisquer parâmetros (mesmo formato de entry)."""
+        with self._lock:
+            metas = [m for m in self._load_index().values() if m.get("video") == vhash]
+        if not metas:
+            return None
+        return self.entry(max(metas, key=lambda m: m["created"])["key"])
+
+    def put(self, key: str, payload: dict, vhash: str, params: dict) -> dict:
+        """
+        Move a pasta de saída do job para o cache e devolve o payload com os caminhos
+        novos. Falhas de disco não derrubam o job: devolve o payload original.
+        """
+        paths = [payload[k] for k in ARTIFACT_KEYS if payload.get(k)]
+        src_dirs = {os.path.dirname(p) for p in paths}
+        if len(src_dirs) != 1:
+            return payload
+        src = src_dirs.pop()
+        dst = os.path.join(self.root, key)
+        clean = {k: v for k, v in payload.items() if k not in VOLATILE_KEYS}
+        for k in ARTIFACT_KEYS:
+            if clean.get(k):
+                clean[k] = os.path.join(dst, os.path.basename(clean[k])).replace("\\", "/")
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            with self._lock:
+                index = self._load_index()
+                if key in index or os.path.exists(dst):
+                    index.pop(key, None)
+                    shutil.rmtree(dst, ignore_errors=True)
+                os.replace(src, dst)
+                meta = {"key": key, "video": vhash, "params": params, "created": time.time(),
+                        "size": _dir_size(dst), "payload": clean}
+                tmp = self._meta_path(key) + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(meta, f, ensure_ascii=False)
+                os.replace(tmp, self._meta_path(key))
+                meta["last_access"] = time.time()
+                index[key] = meta
+                self._evict(keep=key)
+        except OSError:
+            return payload
+        out = {**payload, "result_cache": "miss"}
+        for k in ARTIFACT_KEYS:
+            if clean.get(k):
+                out[k] = clean[k]
+        return out
+
+    def _evict(self, keep: str):
+        """LRU até caber em max_bytes/max_entries (o resultado recém-gravado fica)."""
+        index = self._index or {}
+        total = sum(m.get("size", 0) for m in index.values())
+        victims: List[dict] = sorted((m for k, m in index.items() if k != keep),
+                                     key=lambda m: m["last_access"])
+        while victims and (total > self.max_bytes or len(index) > self.max_entries):
+            m = victims.pop(0)
+            index.pop(m["key"], None)
+            total -= m.get("size", 0)
+            shutil.rmtree(os.path.join(self.root, m["key"]), ignore_errors=True)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            index = self._load_index()
+            return {"entries": len(index), "bytes": sum(m.get("size", 0) for m in index.values()),
+                    "max_bytes": self.max_bytes, "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+RESULTS = ResultCache()
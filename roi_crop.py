@@ -0,0 +1,121 @@
+# roi_crop.py
+# Inferência só na região em torno da linha de contagem. O recorte é uma view NumPy (sem
+# cópia) do frame completo e o imgsz do modelo acompanha a altura típica das pessoas
+# nessa região: pessoas grandes -> imgsz menor, pessoas pequenas -> mais resolução.
+# As caixas voltam para coordenadas do frame completo antes do rastreador/contador
+# (truncadas na borda do recorte para quem só encosta na ROI). Opt-in: ROI_CROP=1.
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from motion_gate import line_roi
+
+ROI_CROP = os.environ.get("ROI_CROP", "0") == "1"
+ROI_PAD_FRAC = float(os.environ.get("ROI_PAD_FRAC", "0.2"))           # margem em torno da linha
+ROI_TARGET_PERSON_PX = int(os.environ.get("ROI_TARGET_PERSON_PX", "64"))  # altura na entrada do modelo
+ROI_IMGSZ_MIN = int(os.environ.get("ROI_IMGSZ_MIN", "320"))
+ROI_IMGSZ_MAX = int(os.environ.get("ROI_IMGSZ_MAX", "1280"))
+ROI_IMGSZ_DEFAULT = int(os.environ.get("ROI_IMGSZ_DEFAULT", "640"))   # antes da 1ª detecção
+
+def _round32(x: float) -> int:
+    return int(max(32, int(np.ceil(x / 32.0)) * 32))
+
+class LineRoi:
+    """
+    Região fixa (x0, y0, x1, y1) em torno da linha; fixa durante a execução para que o
+    rastreador veja coordenadas estáveis. 'person_h' é uma média móvel da mediana das
+    alturas detectadas (px do frame completo) e define o imgsz do próximo lote.
+    """
+    def __init__(self, roi: Tuple[int, int, int, int], frame_w: int, frame_h: int,
+                 target_px: int = ROI_TARGET_PERSON_PX, imgsz_min: int = ROI_IMGSZ_MIN,
+                 imgsz_max: int = ROI_IMGSZ_MAX, alpha: float = 0.2):
+        self.roi = tuple(int(v) for v in roi)
+        self.frame_w, self.frame_h = int(frame_w), int(frame_h)
+        self.target_px = max(8, int(target_px))
+        self.alpha = float(alpha)
+        rw, rh = self.roi[2] - self.roi[0], self.roi[3] - self.roi[1]
+        self.long_side = max(1, rw, rh)
+        # nunca acima da resolução nativa do recorte (arredondada p/ múltiplo de 32)
+        self.imgsz_max = max(32, min(_round32(imgsz_max), _round32(self.long_side)))
+        self.imgsz_min = min(_round32(imgsz_min), self.imgsz_max)
+        self.offset = np.array([self.roi[0], self.roi[1], self.roi[0], self.roi[1]], dtype=np.float32)
+        self.person_h: Optional[float] = None
+        self.stats = {"frames": 0, "pixels_full": 0, "pixels_roi": 0, "pixels_model": 0,
+                      "imgsz_sum": 0, "infer_s": 0.0}
+
+    @classmethod
+    def around_line(cls, x1: int, y1: int, x2: int, y2: int, w: int, h: int, **kw) -> "LineRoi":
+        pad_frac = kw.pop("pad_frac", ROI_PAD_FRAC)
+        return cls(line_roi(x1, y1, x2, y2, w, h, pad_frac), w, h, **kw)
+
+    @property
+    def area_frac(self) -> float:
+        rw, rh = self.roi[2] - self.roi[0], self.roi[3] - self.roi[1]
+        return (rw * rh) / float(max(1, self.frame_w * self.frame_h))
+
+    def imgsz(self) -> int:
+        if self.person_h is None:
+            size = min(ROI_IMGSZ_DEFAULT, self.imgsz_max)
+        else:
+            size = self.long_side * self.target_px / max(1.0, self.person_h)
+        return int(min(self.imgsz_max, max(self.imgsz_min, _round32(size))))
+
+    def crop(self, frame):
+        x0, y0, x1, y1 = self.roi
+        return frame[y0:y1, x0:x1]
+
+    def to_full(self, boxes: np.ndarray) -> np.ndarray:
+        if not len(boxes):
+            return boxes
+        return boxes + self.offset
+
+    def observe(self, boxes_list: List[np.ndarray], imgsz: int, elapsed_s: float):
+        """Atualiza a escala das pessoas e os contadores de pixels/latência de um lote."""
+        heights = [b[:, 3] - b[:, 1] for b in boxes_list if len(b)]
+        if heights:
+            med = float(np.median(np.concatenate(heights)))
+            self.person_h = med if self.person_h is None else \
+                (1 - self.alpha) * self.person_h + self.alpha * med
+        n = len(boxes_list)
+        rw, rh = self.roi[2] - self.roi[0], self.roi[3] - self.roi[1]
+        scale = imgsz / float(self.long_side)
+        self.stats["frames"] += n
+        self.stats["pixels_full"] += n * self.frame_w * self.frame_h
+        self.stats["pixels_roi"] += n * rw * rh
+        self.stats["pixels_model"] += n * int(rw * scale) * int(rh * scale)
+        self.stats["imgsz_sum"] += n * imgsz
+        self.stats["infer_s"] += elapsed_s
+
+    def summary(self) -> dict:
+        s = self.stats
+        n = max(1, s["frames"])
+        return {
+            "roi": list(self.roi),
+            "area_frac": round(self.area_frac, 4),
+            "frames": s["frames"],
+            "pixels_full": s["pixels_full"],
+            "pixels_roi": s["pixels_roi"],
+            "pixels_model": s["pixels_model"],
+            "imgsz_mean": round(s["imgsz_sum"] / n, 1),
+            "imgsz_last": self.imgsz(),
+            "person_h": round(self.person_h, 1) if self.person_h is not None else None,
+            "infer_s": round(s["infer_s"], 4),
+            "ms_per_frame": round(1000.0 * s["infer_s"] / n, 3),
+        }
+
+def merge_stats(parts) -> dict:
+    out = {"frames": 0, "pixels_full": 0, "pixels_roi": 0, "pixels_model": 0, "infer_s": 0.0}
+    imgsz_sum = 0.0
+    for p in parts:
+        for k in out:
+            out[k] += p.get(k, 0)
+        imgsz_sum += p.get("imgsz_mean", 0) * p.get("frames", 0)
+    n = max(1, out["frames"])
+    out["infer_s"] = round(out["infer_s"], 4)
+    out["imgsz_mean"] = round(imgsz_sum / n, 1)
+    out["ms_per_frame"] = round(1000.0 * out["infer_s"] / n, 3)
+    if parts:
+        out["roi"] = parts[0].get("roi")
+        out["area_frac"] = parts[0].get("area_frac")
+    return out
@@ -98,13 +98,60 @@
   loadParams();
 
   // ===== Upload + preview (auto-stream) =====
+  // Upload em partes com retomada: o id da sessão fica no localStorage por arquivo, então
+  // reenviar o mesmo arquivo depois de uma queda continua de onde parou.
+  const sleep = (ms) => new Promise(r => setTimeout(r, ms));
+  async function uploadChunked(file) {
+    const key = `bus_upload:${file.name}:${file.size}:${file.lastModified}`;
+    let id = null, offset = 0, chunk = 8 << 20;
+    try { id = localStorage.getItem(key); } catch(_){}
+    if (id) {
+      const st = await safeFetch(`/uploads/${id}`);
+      if (st.ok) { offset = st.offset; chunk = st.chunk_size || chunk; } else id = null;
+    }
+    if (!id) {
+      const init = await safeFetch('/uploads', {
+        method: 'POST', headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size })
+      });
+      if (!init.ok) throw new Error(init.error || 'Falha ao iniciar upload.');
+      id = init.upload_id; chunk = init.chunk_size || chunk;
+      try { localStorage.setItem(key, id); } catch(_){}
+    }
+    while (offset < file.size) {
+      const end = Math.min(file.size, offset + chunk);
+      let res = null;
+      for (let attempt = 0; ; attempt++) {
+        try {
+          res = await safeFetch(`/uploads/${id}?offset=${offset}`, {
+            method: 'PUT', headers: { 'Content-Type': 'application/octet-stream' },
+            body: file.slice(offset, end)
+          });
+        } catch (err) {
+          res = { ok: false, error: err.message };
+        }
+        if (res.ok || res.offset !== undefined) break;   // 409 informa o offset certo
+        if (attempt >= 5) throw new Error(res.error || 'Falha no upload.');
+        await sleep(500 * 2 ** attempt);
+      }
+      offset = res.offset;
+      const pct = Math.floor(offset / Math.max(1, file.size) * 100);
+      setStatus(`Enviando… ${pct}%`, pct);
+    }
+    const fin = await safeFetch(`/uploads/${id}/finalize`, { method: 'POST' });
+    if (!fin.ok) throw new Error(fin.error || 'Falha ao finalizar upload.');
+    try { localStorage.removeItem(key); } catch(_){}
+    return fin;
+  }
+
   async function uploadVideo(file) {
-    const form = new FormData();
-    form.append('video', file);
-    const res = await safeFetch('/upload', { method: 'POST', body: form });
-    if (!res.ok) throw new Error(res.error || 'Falha no upload.');
+    const res = await uploadChunked(file);
     currentVideoPath = res.video_path;
 
+    // prévia gerada no servidor (frame reduzido em cache): a linha pode ser ajustada
+    // antes de o navegador terminar de carregar o vídeo
+    video.poster = '/video/preview?video_path=' + encodeURIComponent(res.video_path) + '&t=0';
+
     const url = URL.createObjectURL(file);
     video.src = url;
     await video.play().catch(()=>{});
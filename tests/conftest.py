@@ -0,0 +1,4 @@
+# Módulos do projeto ficam na raiz do repositório (sem pacote).
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
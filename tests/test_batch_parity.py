@@ -0,0 +1,34 @@
+# Inferência em micro-lotes (YOLO_BATCH_SIZE) tem de contar igual ao frame a frame, com
+# o detector de sprites do bench sobre um clipe sintético de gabarito conhecido.
+import pytest
+
+import bench
+import yolo_counter
+
+
+@pytest.fixture
+def sprite_clip(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # outputs/ do process_video ficam no tmp
+    monkeypatch.setattr(yolo_counter, "YOLO", bench.SpriteModel)
+    monkeypatch.setattr(yolo_counter, "YOLO_AVAILABLE", True)
+    video = str(tmp_path / "clip.mp4")
+    gt = bench.make_video(video, 320, 180, 20, seed=3)
+    return video, gt
+
+
+def _run(video, **kw):
+    r = yolo_counter.process_video(video, line_norm=bench.LINE, sample_fps=5.0, use_cache=False,
+                                   workers=1, pipeline=False, motion_gate=False, roi_crop=False, **kw)
+    assert r["ok"], r.get("error")
+    return r
+
+
+def test_serial_and_batched_match_golden_counts(sprite_clip):
+    video, gt = sprite_clip
+    assert gt["in"] > 0 and gt["out"] > 0
+    serial = _run(video, batch_size=1)
+    for batch_size in (2, 4, 7):
+        batched = _run(video, batch_size=batch_size)
+        assert (batched["in_total"], batched["out_total"]) == (serial["in_total"], serial["out_total"])
+        assert batched["windows"] == serial["windows"]
+    assert (serial["in_total"], serial["out_total"]) == (gt["in"], gt["out"])
@@ -0,0 +1,42 @@
+# Pós-processamento do OnnxDetector (sem sessão do ONNX Runtime): mesmo teto de caixas
+# (max_det) do backend PyTorch depois do NMS.
+import numpy as np
+
+import detector
+
+
+def _post(out):
+    det = object.__new__(detector.OnnxDetector)  # _post não usa a sessão
+    return det._post(out, 1.0, (0.0, 0.0), (2000, 2000, 3))
+
+
+def _grid(n):
+    """n caixas 10x10 disjuntas (NMS não remove nenhuma), conf crescente."""
+    k = np.arange(n)
+    cx, cy = 20.0 * (k % 90) + 10, 20.0 * (k // 90) + 10
+    conf = np.linspace(0.3, 0.9, n, dtype=np.float32)
+    return cx, cy, conf
+
+
+def test_raw_output_is_capped_at_max_det_after_nms():
+    n = detector.MAX_DET + 100
+    cx, cy, conf = _grid(n)
+    raw = np.stack([cx, cy, np.full(n, 10.0), np.full(n, 10.0), conf]).astype(np.float32)  # (4+nc, A)
+    boxes, got = _post(raw)
+    assert len(boxes) == detector.MAX_DET
+    np.testing.assert_allclose(np.sort(got), np.sort(conf)[-detector.MAX_DET:])
+
+
+def test_fused_nms_output_is_capped_at_max_det():
+    n = detector.MAX_DET + 50
+    cx, cy, conf = _grid(n)
+    fused = np.stack([cx - 5, cy - 5, cx + 5, cy + 5, conf, np.zeros(n)], axis=1).astype(np.float32)
+    boxes, got = _post(fused)
+    assert len(boxes) == detector.MAX_DET
+    assert got.min() >= np.sort(conf)[-detector.MAX_DET]
+
+
+def test_below_max_det_keeps_everything():
+    cx, cy, conf = _grid(20)
+    raw = np.stack([cx, cy, np.full(20, 10.0), np.full(20, 10.0), conf]).astype(np.float32)
+    assert len(_post(raw)[0]) == 20
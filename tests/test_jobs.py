@@ -0,0 +1,54 @@
+# Pausa por prioridade: um job de lote só cede a quem algum worker livre pode executar.
+import time
+import threading
+
+import pytest
+
+from jobs import JobManager, PRIORITY_BATCH, PRIORITY_INTERACTIVE, parse_priority
+from yolo_counter import _checkpoint
+
+
+def _batches(n, started=None):
+    """Job que passa por 'n' pontos de controle, como o pipeline entre micro-lotes."""
+    def fn(job):
+        if started is not None:
+            started.set()
+        for _ in range(n):
+            time.sleep(0.01)
+            _checkpoint(job.cancel_event, job.should_yield)
+        job.publish({"type": "done"})
+    return fn
+
+
+def _submit_while_running(manager, priority):
+    started = threading.Event()
+    a, _ = manager.submit("a", {}, _batches(50, started), priority=PRIORITY_BATCH)
+    assert started.wait(5)
+    b, _ = manager.submit("b", {}, _batches(1), priority=priority)
+    return a, b
+
+
+@pytest.mark.parametrize("workers, priority", [
+    ((1, 1), parse_priority(5)),               # antes: prioridade 5 na fila pausava o lote
+    ((1, 0), PRIORITY_INTERACTIVE),            # sem worker interativo para o job da fila
+])
+def test_batch_job_does_not_yield_to_unrunnable_queued_job(workers, priority):
+    a, b = _submit_while_running(JobManager(*workers), priority)
+    assert a.wait(5) == {"type": "done"}
+    assert b.wait(5) == {"type": "done"}
+
+
+def test_batch_job_yields_to_interactive_job_on_free_worker():
+    a, b = _submit_while_running(JobManager(1, 1), PRIORITY_INTERACTIVE)
+    assert b.wait(5) == {"type": "done"}
+    assert a.wait(5) == {"type": "done"}
+    assert b.finished <= a.finished
+
+
+@pytest.mark.parametrize("val, expected", [
+    (None, PRIORITY_BATCH), ("interactive", PRIORITY_INTERACTIVE), ("batch", PRIORITY_BATCH),
+    (-3, PRIORITY_INTERACTIVE), (0, PRIORITY_INTERACTIVE), ("5", PRIORITY_BATCH),
+    (99, PRIORITY_BATCH), ("x", PRIORITY_BATCH),
+])
+def test_parse_priority_clamps_to_defined_levels(val, expected):
+    assert parse_priority(val) == expected
@@ -0,0 +1,118 @@
+# LineCounter vetorizado contra a implementação escalar original (um ponto por vez, dict
+# track_id -> lado), em trajetórias aleatórias que cruzam, param e encostam na linha.
+import numpy as np
+import pytest
+
+from yolo_counter import LineCounter, line_side
+
+W, H = 200, 100
+LINE = (0.0, 0.5, 1.0, 0.5)
+
+
+class ScalarCounter:
+    """LineCounter de antes da vetorização, como referência."""
+    def __init__(self, w, h, line_norm):
+        ref = LineCounter(w, h, line_norm)
+        self.x1, self.y1, self.x2, self.y2 = ref.x1, ref.y1, ref.x2, ref.y2
+        self.last_side = {}
+        self.in_count = self.out_count = 0
+        self.events = []
+
+    def update_point(self, track_id, cx, cy, frame_idx=-1):
+        side = line_side(cx, cy, self.x1, self.y1, self.x2, self.y2)
+        prev = self.last_side.get(track_id)
+        if prev is not None:
+            if prev == 0: prev = -1e-6
+            if side == 0: side = 1e-6
+            if prev * side < 0:
+                if prev < 0 < side:
+                    self.in_count += 1
+                    self.events.append((frame_idx, track_id, 1))
+                elif prev > 0 > side:
+                    self.out_count += 1
+                    self.events.append((frame_idx, track_id, -1))
+        self.last_side[track_id] = side
+
+    def forget(self, track_ids):
+        for tid in track_ids:
+            self.last_side.pop(tid, None)
+
+
+def _random_frames(seed, n_tracks=40, n_frames=300):
+    """[(frame_idx, ids, cx, cy)]: passeio aleatório em y inteiro (inclui y == linha)."""
+    rng = np.random.default_rng(seed)
+    y = rng.integers(30, 70, n_tracks).astype(np.float64)
+    x = rng.uniform(0, W, n_tracks)
+    ids = rng.permutation(np.arange(1, 10 * n_tracks))[:n_tracks]
+    frames = []
+    f = 0
+    for _ in range(n_frames):
+        f += int(rng.integers(1, 4))
+        y = np.clip(y + rng.integers(-3, 4, n_tracks), 0, H)
+        present = rng.random(n_tracks) < 0.7
+        order = rng.permutation(np.flatnonzero(present))
+        frames.append((f, ids[order], x[order].copy(), y[order].copy()))
+    return frames
+
+
+def _reference(frames):
+    ref = ScalarCounter(W, H, LINE)
+    for f, ids, cx, cy in frames:
+        for tid, px, py in zip(ids.tolist(), cx.tolist(), cy.tolist()):
+            ref.update_point(tid, px, py, f)
+    return ref
+
+
+def _assert_same(counter, ref):
+    assert counter.events == ref.events
+    assert (counter.in_count, counter.out_count) == (ref.in_count, ref.out_count)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_per_frame_update_matches_scalar(seed):
+    frames = _random_frames(seed)
+    ref = _reference(frames)
+    counter = LineCounter(W, H, LINE, stale_frames=0)
+    for f, ids, cx, cy in frames:
+        counter.update(ids, cx, cy, f)
+    assert ref.in_count + ref.out_count > 0
+    _assert_same(counter, ref)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("per_batch", (2, 7, 1000))
+def test_multi_frame_update_matches_scalar(seed, per_batch):
+    frames = _random_frames(seed)
+    ref = _reference(frames)
+    counter = LineCounter(W, H, LINE, stale_frames=0)
+    for k in range(0, len(frames), per_batch):
+        part = frames[k:k + per_batch]
+        counter.update(np.concatenate([p[1] for p in part]), np.concatenate([p[2] for p in part]),
+                       np.concatenate([p[3] for p in part]),
+                       np.concatenate([np.full(len(p[1]), p[0]) for p in part]))
+    _assert_same(counter, ref)
+
+
+def test_update_point_and_forget_match_scalar():
+    frames = _random_frames(11)
+    ref = ScalarCounter(W, H, LINE)
+    counter = LineCounter(W, H, LINE, stale_frames=0)
+    for n, (f, ids, cx, cy) in enumerate(frames):
+        for tid, px, py in zip(ids.tolist(), cx.tolist(), cy.tolist()):
+            ref.update_point(tid, px, py, f)
+            counter.update_point(tid, px, py, f)
+        if n % 25 == 24:
+            gone = ids[:5].tolist()
+            ref.forget(gone)
+            counter.forget(gone)
+    _assert_same(counter, ref)
+
+
+def test_stale_tracks_are_evicted():
+    counter = LineCounter(W, H, LINE, stale_frames=10)
+    for f in range(100):
+        counter.update(np.array([f + 1]), np.array([10.0]), np.array([20.0]), f)  # um track novo por frame
+    assert counter.tracked <= 10 + 10 // 4 + 1
+    counter.update(np.array([1000]), np.array([10.0]), np.array([20.0]), 100)
+    counter.update(np.array([1000]), np.array([10.0]), np.array([80.0]), 101)
+    assert counter.events == [(101, 1000, -1)]
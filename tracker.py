@@ -0,0 +1,108 @@
+# tracker.py
+# Rastreador IoU/centroide vetorizado (NumPy) sobre utils.Track.
+# Associa detecções entre frames amostrados para que o LineCounter compare a mesma
+# pessoa frame a frame (em vez do índice da detecção).
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from utils import Track, iou_matrix_xywh, xyxy_to_xywh
+
+
+def _greedy_match(score: np.ndarray, min_score: float) -> List[Tuple[int, int]]:
+    """
+    Associação gulosa por score decrescente (linha=track, coluna=detecção).
+    Só percorre pares acima do limiar, então o custo cresce com sobreposições reais,
+    não com N x M.
+    """
+    if score.size == 0:
+        return []
+    rows, cols = np.nonzero(score >= min_score)
+    if rows.size == 0:
+        return []
+    order = np.argsort(-score[rows, cols], kind="stable")
+    used_r = np.zeros(score.shape[0], dtype=bool)
+    used_c = np.zeros(score.shape[1], dtype=bool)
+    pairs = []
+    for k in order:
+        r, c = rows[k], cols[k]
+        if used_r[r] or used_c[c]:
+            continue
+        used_r[r] = used_c[c] = True
+        pairs.append((int(r), int(c)))
+    return pairs
+
+
+class IoUTracker:
+    """
+    1) IoU entre caixas previstas (velocidade constante) e detecções;
+    2) para o que sobrou, distância de centroides normalizada pela altura do track;
+    3) tracks sem par envelhecem (misses) e são aposentados após 'max_misses'.
+    """
+    def __init__(self, iou_thr: float = 0.3, max_dist: float = 1.0, max_misses: int = 5,
+                 max_hist: int = 8):
+        self.iou_thr = float(iou_thr)
+        self.max_dist = float(max_dist)
+        self.max_misses = int(max_misses)
+        self.max_hist = int(max_hist)
+        self.tracks: Dict[int, Track] = {}
+        self.next_id = 1
+        self.retired: List[int] = []  # ids aposentados no último update
+
+    def _predicted(self, tracks: List[Track]) -> np.ndarray:
+        boxes = np.array([t.bbox for t in tracks], dtype=np.float32).reshape(-1, 4)
+        if len(tracks):
+            vel = np.array([
+                (t.history[-1][0] - t.history[-2][0], t.history[-1][1] - t.history[-2][1])
+                if len(t.history) >= 2 else (0.0, 0.0)
+                for t in tracks
+            ], dtype=np.float32)
+            miss = np.array([t.misses + 1 for t in tracks], dtype=np.float32)[:, None]
+            boxes[:, :2] += vel * miss
+        return boxes
+
+    def update(self, boxes_xyxy) -> np.ndarray:
+        """Recebe caixas (N,4) xyxy e devolve os track ids (N,) na mesma ordem."""
+        dets = xyxy_to_xywh(boxes_xyxy)
+        n = len(dets)
+        ids = np.zeros(n, dtype=np.int64)
+        tracks = list(self.tracks.values())
+        self.retired = []
+
+        matched_t = np.zeros(len(tracks), dtype=bool)
+        matched_d = np.zeros(n, dtype=bool)
+        if tracks and n:
+            pred = self._predicted(tracks)
+            for r, c in _greedy_match(iou_matrix_xywh(pred, dets), self.iou_thr):
+                tracks[r].update(tuple(float(v) for v in dets[c]))
+                ids[c] = tracks[r].id
+                matched_t[r] = matched_d[c] = True
+
+            rt = np.flatnonzero(~matched_t)
+            cd = np.flatnonzero(~matched_d)
+            if rt.size and cd.size:
+                pc = pred[rt, :2] + pred[rt, 2:] / 2.0
+                dc = dets[cd, :2] + dets[cd, 2:] / 2.0
+                dist = np.linalg.norm(pc[:, None, :] - dc[None, :, :], axis=2)
+                scale = np.maximum(pred[rt, 3], 1.0)[:, None]
+                # score = 1 - dist/scale -> mesma associação gulosa (maior é melhor)
+                score = 1.0 - dist / scale
+                for r, c in _greedy_match(score, 1.0 - self.max_dist):
+                    t = tracks[rt[r]]
+                    t.update(tuple(float(v) for v in dets[cd[c]]))
+                    ids[cd[c]] = t.id
+                    matched_t[rt[r]] = matched_d[cd[c]] = True
+
+        for k in np.flatnonzero(~matched_t):
+            t = tracks[k]
+            t.misses += 1
+            if t.misses > self.max_misses:
+                del self.tracks[t.id]
+                self.retired.append(t.id)
+
+        for c in np.flatnonzero(~matched_d):
+            tid = self.next_id
+            self.next_id += 1
+            self.tracks[tid] = Track(tid, tuple(float(v) for v in dets[c]), None, self.max_hist)
+            ids[c] = tid
+        return ids
@@ -1,6 +1,7 @@
 # utils.py
 import cv2
 import math
+import numpy as np
 from collections import deque
 
 def iou_xywh(b1, b2):
@@ -15,6 +16,22 @@ def iou_xywh(b1, b2):
     union = w1 * h1 + w2 * h2 - inter
     return 0.0 if union <= 0 else inter / union
 
+def iou_matrix_xywh(a, b):
+    # versão vetorizada de iou_xywh: a (N,4), b (M,4) -> (N,M)
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    ax2, ay2 = a[:, 0] + a[:, 2], a[:, 1] + a[:, 3]
+    bx2, by2 = b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+    iw = np.minimum(ax2[:, None], bx2[None, :]) - np.maximum(a[:, 0][:, None], b[:, 0][None, :])
+    ih = np.minimum(ay2[:, None], by2[None, :]) - np.maximum(a[:, 1][:, None], b[:, 1][None, :])
+    inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0).astype(np.float32)
+
+def xyxy_to_xywh(boxes):
+    b = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    return np.stack([b[:, 0], b[:, 1], b[:, 2] - b[:, 0], b[:, 3] - b[:, 1]], axis=1)
+
 def point_side_of_line(px, py, x1, y1, x2, y2):
     # sinal do produto vetorial
     v = (x2 - x1) * (py - y1) - (y2 - y1) * (px - x1)
@@ -81,3 +98,9 @@ class Track:
         self.bbox = bbox
         cx = bbox[0] + bbox[2]/2.0
         cy = bbox[1] + bbox[3]/2.0
+        self.history.append((cx, cy))
+        self.misses = 0
+        self.alive_frames += 1
+
+    def centroid(self):
+        return self.history[-1]
@@ -0,0 +1,249 @@
+# video_meta.py
+# Metadados do contêiner (fps, frames, resolução, duração, índice de keyframes) + hash do
+# conteúdo, sondados uma vez por vídeo e gravados ao lado dele em '<vídeo>.meta.json'
+# (carimbado com tamanho/mtime). O upload em partes calcula o hash enquanto grava e
+# registra o vídeo no finalize; jobs, segmentação e a tela de configuração da linha leem
+# daqui em vez de reabrir o contêiner. Também serve frames de prévia reduzidos (JPEG)
+# em cache no disco.
+import os, re, json, shutil, hashlib, threading, subprocess
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+
+SIDECAR_SUFFIX = ".meta.json"
+FFPROBE_BIN = os.environ.get("FFPROBE_BIN", "ffprobe")
+FFMPEG_BIN = os.environ.get("FFMPEG_BIN", "ffmpeg")
+PREVIEW_CACHE_DIR = os.environ.get("PREVIEW_CACHE_DIR", os.path.join("cache", "previews"))
+PREVIEW_WIDTH = int(os.environ.get("PREVIEW_WIDTH", "640"))
+PREVIEW_MAX_WIDTH = int(os.environ.get("PREVIEW_MAX_WIDTH", "1920"))
+PREVIEW_JPEG_QUALITY = int(os.environ.get("PREVIEW_JPEG_QUALITY", "80"))
+PREVIEW_CACHE_MAX_FILES = int(os.environ.get("PREVIEW_CACHE_MAX_FILES", "5000"))
+
+_MEMO: Dict[Tuple[str, int, int], dict] = {}
+_LOCK = threading.Lock()
+_PREVIEW_WRITES = 0
+
+def sidecar_path(video_path: str) -> str:
+    return video_path + SIDECAR_SUFFIX
+
+def _stamp(video_path: str) -> dict:
+    st = os.stat(video_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def _memo_key(video_path: str, stamp: dict) -> Tuple[str, int, int]:
+    return os.path.abspath(video_path), stamp["size"], stamp["mtime_ns"]
+
+def probe(video_path: str) -> dict:
+    """Uma abertura do contêiner via OpenCV (sem decodificar frames)."""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise ValueError("Falha ao abrir vídeo.")
+        fps = float(cap.get(cv2.CAP_PROP_FPS) or 0.0)
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC) or 0)
+        return {
+            "fps": fps,
+            "frames": frames,
+            "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0),
+            "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0),
+            "duration_s": round(frames / fps, 3) if fps > 0 else 0.0,
+            "codec": "".join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4)).strip("\x00 ") or None,
+        }
+    finally:
+        cap.release()
+
+def probe_keyframes(video_path: str) -> Optional[List[float]]:
+    """
+    Instantes (s) dos keyframes do 1º stream de vídeo. ffprobe lê só os pacotes (flag K);
+    sem ffprobe, o ffmpeg decodifica apenas os keyframes (-skip_frame nokey). None se
+    nenhum dos dois estiver disponível ou falhar.
+    """
+    if shutil.which(FFPROBE_BIN):
+        cmd = [FFPROBE_BIN, "-v", "error", "-select_streams", "v:0",
+               "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_path]
+        try:
+            out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+            times = []
+            for row in out.decode("utf-8", "ignore").splitlines():
+                pts, _, flags = row.partition(",")
+                if "K" in flags and pts not in ("", "N/A"):
+                    times.append(round(float(pts), 3))
+            return sorted(set(times))
+        except (OSError, ValueError, subprocess.CalledProcessError):
+            pass
+    if shutil.which(FFMPEG_BIN):
+        cmd = [FFMPEG_BIN, "-hide_banner", "-nostdin", "-skip_frame", "nokey", "-i", video_path,
+               "-map", "0:v:0", "-vf", "showinfo", "-f", "null", "-"]
+        try:
+            proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            if proc.returncode == 0:
+                times = re.findall(r"pts_time:\s*(-?[0-9.]+)", proc.stderr.decode("utf-8", "ignore"))
+                return sorted({round(float(t), 3) for t in times})
+        except OSError:
+            pass
+    return None
+
+def save(video_path: str, meta: dict):
+    """Grava o sidecar (atômico) carimbado com tamanho/mtime do vídeo."""
+    data = {**meta, **_stamp(video_path)}
+    path = sidecar_path(video_path)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    with _LOCK:
+        _MEMO[_memo_key(video_path, data)] = data
+
+def load(video_path: str) -> Optional[dict]:
+    """Sidecar válido (mesmo tamanho/mtime do vídeo) ou None."""
+    try:
+        stamp = _stamp(video_path)
+    except OSError:
+        return None
+    with _LOCK:
+        hit = _MEMO.get(_memo_key(video_path, stamp))
+    if hit is not None:
+        return hit
+    try:
+        with open(sidecar_path(video_path), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if {k: data.get(k) for k in ("size", "mtime_ns")} != stamp:
+        return None
+    with _LOCK:
+        _MEMO[_memo_key(video_path, stamp)] = data
+    return data
+
+def get(video_path: str, keyframes: bool = False) -> dict:
+    """
+    Metadados do vídeo: memória -> sidecar -> sonda (e grava). Com 'keyframes', garante
+    o índice de keyframes (calculado uma vez e persistido). ValueError se ilegível.
+    """
+    data = load(video_path)
+    if data is None:
+        data = probe(video_path)
+        try:
+            save(video_path, data)
+        except OSError:
+            pass  # diretório só leitura: segue sem persistir
+        data = load(video_path) or data
+    if keyframes and "keyframes" not in data:
+        data = {k: v for k, v in data.items() if k not in ("size", "mtime_ns")}
+        data["keyframes"] = probe_keyframes(video_path)
+        try:
+            save(video_path, data)
+        except OSError:
+            pass
+        data = load(video_path) or data
+    return data
+
+def register(video_path: str, sha256: str, filename: Optional[str] = None) -> dict:
+    """Vídeo recém-enviado: sonda tudo (inclusive keyframes) uma vez, com o hash já conhecido."""
+    data = load(video_path)
+    if data is None or data.get("sha256") != sha256:
+        data = {"sha256": sha256, "filename": filename, **probe(video_path),
+                "keyframes": probe_keyframes(video_path)}
+        save(video_path, data)
+    return load(video_path) or data
+
+def cached_hash(video_path: str) -> Optional[str]:
+    data = load(video_path)
+    return data.get("sha256") if data else None
+
+def touch(video_path: str):
+    """Renova o mtime (limpeza por idade) mantendo o sidecar válido."""
+    data = load(video_path)
+    os.utime(video_path)
+    if data is not None:
+        save(video_path, {k: v for k, v in data.items() if k not in ("size", "mtime_ns")})
+
+def public(meta: dict, keyframes: bool = False) -> dict:
+    """Metadados para a API (sem carimbo interno; keyframes só se pedidos)."""
+    out = {k: v for k, v in meta.items() if k not in ("mtime_ns", "keyframes")}
+    if keyframes:
+        out["keyframes"] = meta.get("keyframes")
+    elif meta.get("keyframes") is not None:
+        out["keyframe_count"] = len(meta["keyframes"])
+    return out
+
+# ---------- prévias ----------
+def nearest_keyframe(meta: dict, t: float) -> Optional[float]:
+    """Último keyframe em ou antes de 't' (None sem índice)."""
+    kf = meta.get("keyframes")
+    if not kf:
+        return None
+    import bisect
+    i = bisect.bisect_right(kf, t) - 1
+    return kf[max(0, i)]
+
+def _preview_dir(video_path: str, meta: dict) -> str:
+    ident = meta.get("sha256") or hashlib.sha1(
+        f"{os.path.abspath(video_path)}|{meta.get('size')}|{meta.get('mtime_ns')}".encode("utf-8")).hexdigest()
+    return os.path.join(PREVIEW_CACHE_DIR, ident[:32])
+
+def preview(video_path: str, t: float = 0.0, width: int = PREVIEW_WIDTH, snap: bool = False) -> str:
+    """
+    Caminho de um JPEG reduzido do frame em 't' segundos (em cache). 'snap' usa o
+    keyframe anterior: não decodifica frames intermediários (arrastar a barra de tempo).
+    """
+    meta = get(video_path, keyframes=snap)
+    duration = float(meta.get("duration_s") or 0.0)
+    t = max(0.0, min(float(t), max(0.0, duration - 1.0 / max(1.0, meta.get("fps") or 25.0))))
+    if snap:
+        t = nearest_keyframe(meta, t) if meta.get("keyframes") else t
+    width = max(16, min(int(width), PREVIEW_MAX_WIDTH, int(meta.get("width") or PREVIEW_MAX_WIDTH)))
+    out_dir = _preview_dir(video_path, meta)
+    path = os.path.join(out_dir, f"{int(round(t * 1000))}_{width}.jpg")
+    if os.path.exists(path):
+        return path
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise ValueError("Falha ao abrir vídeo.")
+        fps = float(meta.get("fps") or 0.0)
+        if fps > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(round(t * fps)))
+        else:
+            cap.set(cv2.CAP_PROP_POS_MSEC, t * 1000.0)
+        ok, frame = cap.read()
+    finally:
+        cap.release()
+    if not ok or frame is None:
+        raise ValueError("Frame indisponível nesse instante.")
+    h, w = frame.shape[:2]
+    if w > width:
+        frame = cv2.resize(frame, (width, max(2, int(round(h * width / float(w))))), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_JPEG_QUALITY])
+    if not ok:
+        raise ValueError("Falha ao codificar a prévia.")
+    os.makedirs(out_dir, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(buf.tobytes())
+    os.replace(tmp, path)
+    _note_preview_write()
+    return path
+
+def _note_preview_write():
+    """A cada 100 prévias novas, apaga as mais antigas além de PREVIEW_CACHE_MAX_FILES."""
+    global _PREVIEW_WRITES
+    with _LOCK:
+        _PREVIEW_WRITES += 1
+        if _PREVIEW_WRITES % 100:
+            return
+    files = []
+    for root, _, names in os.walk(PREVIEW_CACHE_DIR):
+        for n in names:
+            p = os.path.join(root, n)
+            try:
+                files.append((os.path.getmtime(p), p))
+            except OSError:
+                pass
+    files.sort()
+    for _, p in files[:max(0, len(files) - PREVIEW_CACHE_MAX_FILES)]:
+        try:
+            os.remove(p)
+        except OSError:
+            pass
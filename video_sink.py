@@ -0,0 +1,161 @@
+# video_sink.py
+# Gravação do vídeo anotado fora do laço de contagem: write() só copia o frame para uma
+# fila limitada e uma thread dedicada codifica. Com ffmpeg disponível, codifica direto em
+# H.264 (yuv420p + faststart), já tocável no navegador; sem ele, cai no cv2.VideoWriter.
+import os, time, queue, threading, subprocess
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+import frame_source
+from profiling import REGISTRY
+
+ANNOTATED_ENCODER = os.environ.get("ANNOTATED_ENCODER", "auto")   # auto | ffmpeg | opencv
+ANNOTATED_PRESET = os.environ.get("ANNOTATED_PRESET", "veryfast")  # preset do x264
+ANNOTATED_CRF = int(os.environ.get("ANNOTATED_CRF", "23"))
+ANNOTATED_QUEUE = max(1, int(os.environ.get("ANNOTATED_QUEUE", "32") or 32))
+
+_STOP = object()
+
+class AsyncVideoWriter:
+    """
+    Interface de cv2.VideoWriter (write/release/isOpened). A fila é limitada: se o
+    encoder não acompanhar, write() espera (nada é descartado) e o tempo vai para
+    stats['stall_s'].
+    """
+    def __init__(self, path: str, fps: float, size: Tuple[int, int],
+                 encoder: str = ANNOTATED_ENCODER, preset: str = ANNOTATED_PRESET,
+                 crf: int = ANNOTATED_CRF, queue_size: int = ANNOTATED_QUEUE):
+        self.path = path
+        self.fps = float(fps or 25.0)
+        self.size = (int(size[0]), int(size[1]))
+        if encoder == "auto":
+            encoder = "ffmpeg" if frame_source.ffmpeg_available() else "opencv"
+        self.encoder = encoder
+        self.preset = preset
+        self.crf = int(crf)
+        self.error: Optional[str] = None
+        self.stats = {"encoder": encoder, "frames": 0, "stall_s": 0.0, "encode_s": 0.0}
+        self._q: "queue.Queue" = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._proc: Optional[subprocess.Popen] = None
+        self._cv: Optional[cv2.VideoWriter] = None
+        self._open()
+        self._thread = threading.Thread(target=self._loop, name="annotated-writer", daemon=True)
+        self._thread.start()
+
+    def command(self) -> list:
+        w, h = self.size
+        return [
+            frame_source.FFMPEG_BIN, "-y", "-hide_banner", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{w}x{h}", "-r", f"{self.fps:.6f}",
+            "-i", "pipe:0",
+            # yuv420p exige dimensões pares
+            "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2",
+            "-c:v", "libx264", "-preset", self.preset, "-crf", str(self.crf),
+            "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+            self.path,
+        ]
+
+    def _open(self):
+        if self.encoder == "ffmpeg":
+            self._proc = subprocess.Popen(self.command(), stdin=subprocess.PIPE,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        else:
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            self._cv = cv2.VideoWriter(self.path, fourcc, self.fps, self.size)
+
+    def isOpened(self) -> bool:
+        if self._proc is not None:
+            return self._proc.poll() is None and self.error is None
+        return self._cv is not None and self._cv.isOpened()
+
+    def write(self, frame: np.ndarray):
+        if self.error is not None:
+            return  # encoder falhou: contagem segue, erro vai no resumo
+        item = np.array(frame, copy=True)  # o buffer do chamador é reutilizado
+        t0 = time.perf_counter()
+        self._q.put(item)
+        self.stats["stall_s"] += time.perf_counter() - t0
+        REGISTRY.set_gauge("annotated_queue_depth", self._q.qsize())
+
+    def _loop(self):
+        while True:
+            item = self._q.get()
+            if item is _STOP:
+                return
+            if self.error is not None:
+                continue  # só esvazia a fila
+            t0 = time.perf_counter()
+            try:
+                if self._proc is not None:
+                    self._proc.stdin.write(np.ascontiguousarray(item).data)
+                else:
+                    self._cv.write(item)
+                self.stats["frames"] += 1
+            except (BrokenPipeError, OSError, ValueError) as e:
+                self.error = f"{type(e).__name__}: {e}"
+            self.stats["encode_s"] += time.perf_counter() - t0
+
+    def release(self) -> dict:
+        """Espera a fila esvaziar, fecha o encoder e devolve o resumo."""
+        if self._thread is not None:
+            self._q.put(_STOP)
+            self._thread.join()
+            self._thread = None
+            t0 = time.perf_counter()
+            if self._proc is not None:
+                try:
+                    self._proc.stdin.close()
+                except OSError:
+                    pass
+                err = self._proc.stderr.read().decode("utf-8", errors="ignore").strip()
+                if self._proc.wait() != 0 and self.error is None:
+                    self.error = err[:300] or f"ffmpeg saiu com código {self._proc.returncode}"
+                self._proc.stderr.close()
+            elif self._cv is not None:
+                self._cv.release()
+            self.stats["encode_s"] += time.perf_counter() - t0
+        return self.summary()
+
+    def abort(self):
+        """
+        Falha/cancelamento do job: derruba o encoder sem esperar a fila e apaga o arquivo
+        parcial (um MP4 sem moov não toca e ocuparia outputs/ até a limpeza).
+        """
+        self.error = self.error or "abortado"  # a thread passa a só esvaziar a fila
+        if self._proc is not None:
+            self._proc.kill()  # um write() bloqueado no pipe termina com BrokenPipeError
+        if self._thread is not None:
+            while True:  # libera espaço para o _STOP mesmo com a fila cheia
+                try:
+                    self._q.get_nowait()
+                except queue.Empty:
+                    break
+            self._q.put(_STOP)
+            self._thread.join()
+            self._thread = None
+        if self._proc is not None:
+            self._proc.wait()
+            for pipe in (self._proc.stdin, self._proc.stderr):
+                try:
+                    pipe.close()
+                except OSError:
+                    pass
+        elif self._cv is not None:
+            self._cv.release()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def summary(self) -> dict:
+        out = dict(self.stats)
+        out["stall_s"] = round(out["stall_s"], 4)
+        out["encode_s"] = round(out["encode_s"], 4)
+        if self.encoder == "ffmpeg":
+            out["preset"] = self.preset
+            out["crf"] = self.crf
+        if self.error:
+            out["error"] = self.error
+        return out
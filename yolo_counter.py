@@ -5,7 +5,10 @@
 # - process_video(video_path, line|line_norm, sample_fps, chunk_seconds, workers, save_annotated) -> dict com totais, windows, paths
 
 from __future__ import annotations
-import os, csv, time, math, pathlib, datetime as dt
+import os, csv, time, math, uuid, queue, atexit, pathlib, threading, datetime as dt
+import multiprocessing as mp
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
 from typing import Dict, Tuple, Generator, List, Optional
 
 try:
@@ -25,6 +28,140 @@ except Exception:
     YOLO_AVAILABLE = False
     YOLO = None
 
+from tracker import IoUTracker
+import detector
+import crossings
+import zones
+import detection_cache
+import video_meta
+from detection_cache import DetectionRecorder
+import motion_gate
+from motion_gate import MotionGate
+import roi_crop
+from roi_crop import LineRoi
+import frame_source
+from frame_source import FfmpegFrameSource
+import frame_ring
+from frame_ring import FrameRing, StageClock
+import video_sink
+from video_sink import AsyncVideoWriter
+import profiling
+from profiling import StageProfile
+
+# ---------- Pool de modelos (carrega/aquece uma vez por processo) ----------
+DEFAULT_WEIGHTS = os.environ.get("YOLO_WEIGHTS", "yolov8n.pt")  # leve para CPU
+MODEL_POOL_SIZE = max(1, int(os.environ.get("YOLO_POOL_SIZE", "2") or 2))
+
+class ModelPool:
+    """
+    Pool de detectores de uma mesma variante (pesos + backend, ver detector.py).
+    As instâncias são criadas sob demanda até 'size' e reaproveitadas entre jobs;
+    cada job usa uma instância exclusiva (predict do Ultralytics não é thread-safe).
+    """
+    def __init__(self, weights: str, size: int = MODEL_POOL_SIZE, backend: str = "torch"):
+        self.weights = weights
+        self.backend = backend
+        self.size = max(1, int(size))
+        self._free: "queue.LifoQueue" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self.load_s: List[float] = []
+        self.warmup_s: List[float] = []
+        self.acquires = 0
+        self.wait_s = 0.0
+
+    def _load(self):
+        t0 = time.perf_counter()
+        model = detector.load_detector(self.backend, self.weights, YOLO)
+        t1 = time.perf_counter()
+        # primeira inferência monta o grafo/fusões; fazemos aqui e não no 1º request
+        dummy = np.zeros((640, 640, 3), dtype=np.uint8)
+        model.detect([dummy])
+        t2 = time.perf_counter()
+        with self._lock:
+            self.load_s.append(round(t1 - t0, 4))
+            self.warmup_s.append(round(t2 - t1, 4))
+        return model
+
+    def acquire(self, timeout: Optional[float] = None):
+        """Retorna uma instância livre; cria nova se ainda couber no pool, senão espera."""
+        t0 = time.perf_counter()
+        try:
+            model = self._free.get_nowait()
+        except queue.Empty:
+            create = False
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+            if create:
+                try:
+                    model = self._load()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                model = self._free.get(timeout=timeout)
+        with self._lock:
+            self.acquires += 1
+            self.wait_s += time.perf_counter() - t0
+        return model
+
+    def release(self, model):
+        if model is not None:
+            self._free.put(model)
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None):
+        model = self.acquire(timeout=timeout)
+        try:
+            yield model
+        finally:
+            self.release(model)
+
+    def warmup(self, n: int = 1):
+        """Pré-carrega até n instâncias (ex.: no boot do servidor)."""
+        models = [self.acquire() for _ in range(max(1, min(int(n), self.size)))]
+        for m in models:
+            self.release(m)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "weights": self.weights,
+                "backend": self.backend,
+                "size": self.size,
+                "created": self._created,
+                "idle": self._free.qsize(),
+                "acquires": self.acquires,
+                "wait_s": round(self.wait_s, 4),
+                "load_s": list(self.load_s),
+                "warmup_s": list(self.warmup_s),
+            }
+
+_POOLS: Dict[Tuple[str, str], ModelPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+def get_model_pool(weights: Optional[str] = None, size: Optional[int] = None,
+                   backend: Optional[str] = None) -> ModelPool:
+    """Registro por processo: uma ModelPool por variante (pesos, backend)."""
+    if not YOLO_AVAILABLE:
+        raise RuntimeError("Ultralytics YOLO indisponível.")
+    weights = weights or DEFAULT_WEIGHTS
+    backend = detector.parse_backend(backend)
+    with _POOLS_LOCK:
+        pool = _POOLS.get((weights, backend))
+        if pool is None:
+            pool = ModelPool(weights, size if size is not None else MODEL_POOL_SIZE, backend)
+            _POOLS[(weights, backend)] = pool
+        return pool
+
+def model_pool_stats() -> List[dict]:
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    return [p.stats() for p in pools]
+
 # ---------- helpers de coerção ----------
 def _coerce_line(val) -> Optional[Tuple[float,float,float,float]]:
     """
@@ -79,41 +216,266 @@ def ensure_dirs(path: str):
     pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
 
 # ---------- Núcleo de contagem ----------
+# Tracks sem detecção há mais que isso (em frames do vídeo) saem da tabela do contador
+# mesmo sem aviso do tracker. Bem acima do maior intervalo em que um track continua vivo
+# (gate de movimento pulando frames + TRACK_MAX_MISSES), para não mudar contagens.
+COUNTER_STALE_FRAMES = int(os.environ.get("COUNTER_STALE_FRAMES", "18000"))
+
 class LineCounter:
     """
     Conta cruzamentos por track_id: quando o sinal do lado muda, incrementa IN/OUT.
     Direção: prev<0->side>0 => IN ; prev>0->side<0 => OUT (heurística estável).
+    Cada cruzamento também vai para 'events' como (frame_idx, track_id, +1 IN / -1 OUT).
+    Estado em arrays compactos ordenados por track_id (busca por searchsorted); tracks
+    aposentados (forget) ou parados há COUNTER_STALE_FRAMES são removidos.
     """
-    def __init__(self, w:int, h:int, line_norm:Tuple[float,float,float,float]):
+    def __init__(self, w:int, h:int, line_norm:Tuple[float,float,float,float],
+                 stale_frames: int = COUNTER_STALE_FRAMES):
         self.w, self.h = w, h
         self.x1, self.y1, self.x2, self.y2 = normalize_line_to_pixels(line_norm, w, h)
-        self.last_side: Dict[int, float] = {}  # track_id -> side
         self.in_count = 0
         self.out_count = 0
+        self.events: List[Tuple[int,int,int]] = []
+        self.stale_frames = int(stale_frames)
+        self._ids = np.zeros(0, dtype=np.int64)    # track ids ativos (ordenados)
+        self._side = np.zeros(0, dtype=np.float64)  # último lado de cada um
+        self._seen = np.zeros(0, dtype=np.int64)    # último frame em que apareceu
+        self._next_evict = self.stale_frames
+
+    @property
+    def tracked(self) -> int:
+        """Tracks com estado guardado (limitado por forget/COUNTER_STALE_FRAMES)."""
+        return len(self._ids)
+
+    def _lookup(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        pos = np.searchsorted(self._ids, ids)
+        found = pos < len(self._ids)
+        found[found] = self._ids[pos[found]] == ids[found]
+        return pos, found
 
-    def update_point(self, track_id:int, cx:float, cy:float):
-        side = line_side(cx, cy, self.x1, self.y1, self.x2, self.y2)
-        prev = self.last_side.get(track_id)
-        if prev is not None:
-            if prev == 0: prev = -1e-6
-            if side == 0: side = 1e-6
-            if prev * side < 0:
-                if prev < 0 < side:
-                    self.in_count += 1
-                elif prev > 0 > side:
-                    self.out_count += 1
-        self.last_side[track_id] = side
+    def update_point(self, track_id:int, cx:float, cy:float, frame_idx:int = -1):
+        self.update(np.array([track_id]), np.array([cx]), np.array([cy]), frame_idx)
+
+    def update(self, ids: np.ndarray, cx: np.ndarray, cy: np.ndarray, frame_idx=-1):
+        """
+        Centroides de um frame ou de um lote de frames ('frame_idx' escalar ou um por
+        ponto, em ordem não decrescente). Mesmo resultado de chamar update_point um a um.
+        """
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        n = len(ids)
+        if not n:
+            return
+        cx = np.asarray(cx, dtype=np.float64).reshape(-1)
+        cy = np.asarray(cy, dtype=np.float64).reshape(-1)
+        side = (cx - self.x1) * (self.y2 - self.y1) - (cy - self.y1) * (self.x2 - self.x1)
+        if np.ndim(frame_idx) == 0:
+            # um frame: ids não se repetem, cada ponto só depende do estado guardado
+            order, sid, sside, frames = None, ids, side, None
+            first = last = np.ones(n, dtype=bool)
+        else:
+            # vários frames: agrupa por track mantendo a ordem temporal dentro do grupo
+            frames = np.asarray(frame_idx, dtype=np.int64).reshape(-1)
+            order = np.lexsort((np.arange(n), ids))
+            sid, sside = ids[order], side[order]
+            first = np.ones(n, dtype=bool)
+            first[1:] = sid[1:] != sid[:-1]
+            last = np.ones(n, dtype=bool)
+            last[:-1] = first[1:]
+        pos, known = self._lookup(sid)
+        has_prev = ~first | known
+        # sem lado anterior o valor cru é guardado; com anterior, 0 vira +1e-6
+        eff = np.where(has_prev & (sside == 0), 1e-6, sside)
+        prev = np.full(n, np.nan)
+        prev[1:][~first[1:]] = eff[:-1][~first[1:]]
+        stored = first & known
+        prev[stored] = self._side[pos[stored]]
+        prev[prev == 0] = -1e-6
+        cross = has_prev & (prev * eff < 0)
+        if cross.any():
+            src = np.flatnonzero(cross) if order is None else np.sort(order[cross])
+            dirs = np.where(side[src] > 0, 1, -1)  # side == 0 com anterior conta como > 0
+            dirs[side[src] == 0] = 1
+            at = [int(frame_idx)] * len(src) if frames is None else frames[src].tolist()
+            self.events.extend(zip(at, ids[src].tolist(), dirs.tolist()))
+            n_in = int(np.count_nonzero(dirs > 0))
+            self.in_count += n_in
+            self.out_count += len(dirs) - n_in
+        # último estado de cada track
+        lframe = np.full(n, int(frame_idx), dtype=np.int64) if frames is None else frames[order]
+        lpos, lknown, lside, lframe = pos[last], known[last], eff[last], lframe[last]
+        self._side[lpos[lknown]] = lside[lknown]
+        self._seen[lpos[lknown]] = lframe[lknown]
+        if not lknown.all():
+            new = np.flatnonzero(~lknown)
+            nid = sid[last][new]
+            k = np.argsort(nid, kind="stable")
+            new, nid = new[k], nid[k]
+            at = np.searchsorted(self._ids, nid)
+            self._ids = np.insert(self._ids, at, nid)
+            self._side = np.insert(self._side, at, lside[new])
+            self._seen = np.insert(self._seen, at, lframe[new])
+        newest = int(frame_idx) if frames is None else int(frames[-1])
+        if self.stale_frames > 0 and newest >= self._next_evict:
+            self._evict(self._seen >= newest - self.stale_frames)
+            self._next_evict = newest + self.stale_frames // 4 + 1
+
+    def _evict(self, keep: np.ndarray):
+        if not keep.all():
+            self._ids, self._side, self._seen = self._ids[keep], self._side[keep], self._seen[keep]
+
+    def forget(self, track_ids):
+        """Descarta o estado de tracks aposentados pelo tracker."""
+        if len(track_ids) and len(self._ids):
+            self._evict(~np.isin(self._ids, np.asarray(track_ids, dtype=np.int64)))
+
+    def extent(self) -> Tuple[int, int, int, int]:
+        """Caixa (x0, y0, x1, y1) do que é contado (gate/recorte ficam em volta dela)."""
+        return min(self.x1, self.x2), min(self.y1, self.y2), max(self.x1, self.x2), max(self.y1, self.y2)
+
+def _make_counter(w: int, h: int, line, spec: Optional[dict] = None):
+    """LineCounter simples ou, com linhas extras/zonas, um zones.CounterSet."""
+    return zones.CounterSet(w, h, line, spec) if spec else LineCounter(w, h, line)
 
 # ---------- Pipeline principal ----------
-def _iterate_frames(cap, every_n_frames:int):
-    idx = 0
-    ok, frame = cap.read()
-    while ok:
-        if idx % every_n_frames == 0:
+# Estratégias de amostragem:
+#  - read: decodifica e converte todos os frames (baseline, usado quando step == 1)
+#  - grab: grab() nos frames pulados (sem retrieve/conversão BGR), read só nos amostrados
+#  - seek: posiciona direto no próximo frame amostrado (vale para strides longos, > GOP)
+SAMPLING_STRATEGIES = ("auto", "read", "grab", "seek", "ffmpeg")
+SEEK_MIN_STEP = int(os.environ.get("SAMPLER_SEEK_MIN_STEP", "90"))
+
+def _choose_sampling_strategy(step: int, total_frames: int, requested: str = "auto") -> str:
+    requested = (requested or "auto").lower()
+    if requested not in SAMPLING_STRATEGIES:
+        requested = "auto"
+    if requested == "auto" and frame_source.FRAME_SOURCE == "ffmpeg":
+        requested = "ffmpeg"
+    if requested == "ffmpeg" and not frame_source.ffmpeg_available():
+        requested = "auto"  # sem binário do ffmpeg -> VideoCapture
+    if requested == "seek" and total_frames <= 0:
+        return "grab"  # sem contagem de frames não dá para calcular os alvos
+    if requested != "auto":
+        return requested
+    if step <= 1:
+        return "read"
+    if step >= SEEK_MIN_STEP and total_frames > 0:
+        return "seek"
+    return "grab"
+
+def _new_sampling_stats(strategy: str, step: int) -> dict:
+    return {"strategy": strategy, "step": int(step), "decoded": 0, "grabbed": 0, "seeks": 0,
+            "frames_covered": 0, "decode_s": 0.0, "skip_s": 0.0, "saved_s_est": 0.0}
+
+def _finish_sampling_stats(stats: dict) -> dict:
+    """
+    Estima o tempo economizado contra o baseline (read em todos os frames):
+    custo médio de um frame completo (grab+retrieve) x frames percorridos - custo real.
+    """
+    dec = stats["decoded"]
+    if dec > 0 and stats["strategy"] not in ("read", "ffmpeg"):
+        per_frame = stats["decode_s"] / dec
+        baseline = per_frame * stats["frames_covered"]
+        stats["saved_s_est"] = max(0.0, baseline - (stats["decode_s"] + stats["skip_s"]))
+    for k in ("decode_s", "skip_s", "saved_s_est"):
+        stats[k] = round(stats[k], 4)
+    return stats
+
+def _decode_one(cap, stats: dict):
+    t0 = time.perf_counter()
+    ok = cap.grab()
+    frame = None
+    if ok:
+        ok, frame = cap.retrieve()
+    stats["decode_s"] += time.perf_counter() - t0
+    if ok:
+        stats["decoded"] += 1
+    return ok, frame
+
+def _iterate_frames(cap, every_n_frames:int, strategy:str = "read", stats:Optional[dict] = None,
+                    start_frame:int = 0, end_frame:Optional[int] = None):
+    """
+    Gera (idx, frame) dos frames amostrados. 'start_frame'/'end_frame' limitam a um trecho
+    (idx continua global; start_frame deve estar alinhado à grade de 'every_n_frames').
+    Sem 'end_frame' vai até o grab()/read() falhar: CAP_PROP_FRAME_COUNT erra em VFR e
+    MP4 remuxado, então só serve de estimativa de progresso.
+    """
+    step = max(1, int(every_n_frames))
+    if stats is None:
+        stats = _new_sampling_stats(strategy, step)
+    start_frame = max(0, int(start_frame))
+    stop = end_frame
+    if start_frame > 0:
+        t0 = time.perf_counter()
+        moved = cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        stats["skip_s"] += time.perf_counter() - t0
+        stats["seeks"] += 1
+        if not moved:
+            return
+
+    if strategy == "seek":
+        idx = start_frame
+        while stop is None or idx < stop:
+            if idx > start_frame:
+                t0 = time.perf_counter()
+                moved = cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+                stats["skip_s"] += time.perf_counter() - t0
+                stats["seeks"] += 1
+                if not moved:
+                    break
+            ok, frame = _decode_one(cap, stats)
+            if not ok:
+                break  # posicionou além do fim real
+            stats["frames_covered"] += step if stop is None else min(step, stop - idx)
             yield idx, frame
-        ok, frame = cap.read()
+            idx += step
+        return
+
+    idx = start_frame
+    while stop is None or idx < stop:
+        if idx % step == 0 or strategy == "read":
+            ok, frame = _decode_one(cap, stats)
+            if not ok:
+                break
+            stats["frames_covered"] += 1
+            if idx % step == 0:
+                yield idx, frame
+        else:
+            t0 = time.perf_counter()
+            ok = cap.grab()
+            stats["skip_s"] += time.perf_counter() - t0
+            if not ok:
+                break
+            stats["grabbed"] += 1
+            stats["frames_covered"] += 1
         idx += 1
 
+def _open_frames(video_path: str, cap, strategy: str, step: int, stats: Optional[dict],
+                 fps: float, size: Tuple[int,int], start_frame: int = 0,
+                 end_frame: Optional[int] = None, hold: int = 8):
+    """
+    Fonte de frames conforme a estratégia: 'ffmpeg' lê do subprocesso (frames já
+    amostrados e no tamanho 'size'); as demais usam o VideoCapture 'cap'. Sem
+    'end_frame', ambas vão até o fim real do vídeo.
+    'hold' = quantos frames entregues o consumidor ainda pode estar segurando.
+    """
+    if strategy == "ffmpeg":
+        return FfmpegFrameSource(video_path, fps, step, size, start_frame, end_frame,
+                                 hold=hold, stats=stats)
+    return _iterate_frames(cap, step, strategy, stats, start_frame, end_frame)
+
+def _frame_geometry(strategy: str, line, w: int, h: int):
+    """
+    Com 'ffmpeg' os frames chegam reduzidos: devolve (linha normalizada, w, h) no tamanho
+    de saída, para contador/writer/cache trabalharem nas coordenadas dos frames recebidos.
+    """
+    if strategy != "ffmpeg" or w <= 0 or h <= 0:
+        return line, w, h
+    x1, y1, x2, y2 = line
+    if max(abs(x1), abs(y1), abs(x2), abs(y2)) > 1.0001:  # linha em pixels do original
+        line = (x1 / w, y1 / h, x2 / w, y2 / h)
+    fw, fh = frame_source.scaled_size(w, h)
+    return line, fw, fh
+
 def _estimate_every_n_frames(fps: float, sample_fps: float) -> int:
     if fps <= 0: fps = 25.0
     if sample_fps <= 0: sample_fps = 5.0
@@ -123,43 +485,842 @@ def _estimate_every_n_frames(fps: float, sample_fps: float) -> int:
 def _draw_overlays(frame, counter: LineCounter, in_partial:int, out_partial:int):
     # linha
     cv2.line(frame, (counter.x1, counter.y1), (counter.x2, counter.y2), (184,95,31), 2)  # BGR
+    if isinstance(counter, zones.CounterSet):
+        counter.draw(frame)  # linhas extras e zonas
     # contadores
     txt = f"IN: {in_partial}  OUT: {out_partial}  NET: {in_partial - out_partial}"
     cv2.rectangle(frame, (10,10), (10+320, 45), (0,0,0), -1)
     cv2.putText(frame, txt, (18,38), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255,255,255), 2, cv2.LINE_AA)
     return frame
 
-def _run_yolo_on_frame(model, frame):
-    # Pessoas (classe 0)
-    res = model.predict(source=frame, classes=[0], conf=0.25, verbose=False)
-    if not res: return []
-    r = res[0]
-    dets = []
-    if getattr(r, "boxes", None) is None: return dets
-    boxes = r.boxes.xyxy.cpu().numpy()
-    for i, (x1,y1,x2,y2) in enumerate(boxes):
-        cx = float((x1+x2)/2.0)
-        cy = float((y1+y2)/2.0)
-        dets.append({"id": i, "cx": cx, "cy": cy})
-    return dets
-
-def _run_yolo_track_frames(model, frames_iter, counter: LineCounter, writer=None):
-    for idx, frame in frames_iter:
-        dets = _run_yolo_on_frame(model, frame)
-        for d in dets:
-            counter.update_point(d["id"], d["cx"], d["cy"])
-        if writer is not None:
-            _draw_overlays(frame, counter, counter.in_count, counter.out_count)
-            writer.write(frame)
-        yield idx
+YOLO_BATCH_SIZE = max(1, int(os.environ.get("YOLO_BATCH_SIZE", "4") or 4))
+
+TRACK_IOU_THR = float(os.environ.get("TRACK_IOU_THR", "0.3"))
+TRACK_MAX_MISSES = int(os.environ.get("TRACK_MAX_MISSES", "5"))  # em frames amostrados
+
+def _run_yolo_on_batch(model, frames: List, roi: Optional[LineRoi] = None,
+                       prof: Optional[StageProfile] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Uma única inferência para o micro-lote (model = detector de detector.py); devolve
+    detecções na mesma ordem dos frames. Com 'roi', infere só no recorte em torno da
+    linha (imgsz adaptativo) e devolve as caixas já em coordenadas do frame completo.
+    """
+    imgsz = None
+    if roi is not None:
+        frames = [roi.crop(f) for f in frames]
+        imgsz = roi.imgsz()
+    t0 = time.perf_counter()
+    out = model.detect(frames, imgsz=imgsz)
+    elapsed = time.perf_counter() - t0
+    if prof is not None:
+        prof.add("infer", elapsed)
+        prof.count("infer_calls")
+        prof.count("infer_frames", len(frames))
+    if roi is not None:
+        out = [(roi.to_full(b), c) for b, c in out]
+        roi.observe([b for b, _ in out], imgsz, elapsed)
+    return out
+
+def _count_points(counter: LineCounter, ids: np.ndarray, boxes: np.ndarray, frame_idx):
+    cx = (boxes[:, 0] + boxes[:, 2]) / 2.0
+    cy = (boxes[:, 1] + boxes[:, 3]) / 2.0
+    counter.update(ids, cx, cy, frame_idx)
 
-def _fallback_dummy(frames_iter, counter: LineCounter, writer=None):
-    for idx, frame in frames_iter:
+def _track_and_count(tracker: IoUTracker, boxes: np.ndarray, counter: LineCounter,
+                     frame_idx: int) -> np.ndarray:
+    """Associa caixas a tracks persistentes e alimenta o contador pelo centroide."""
+    ids = tracker.update(boxes)
+    _count_points(counter, ids, boxes, frame_idx)
+    if tracker.retired:
+        counter.forget(tracker.retired)
+    return ids
+
+def _track_and_count_many(tracker: IoUTracker, dets: List[Tuple[int, np.ndarray]],
+                          counter: LineCounter) -> List[np.ndarray]:
+    """
+    Rastreia frame a frame e conta o micro-lote inteiro numa chamada vetorizada do
+    LineCounter. Mesmo resultado de _track_and_count em sequência: ids aposentados
+    nunca reaparecem, então esquecê-los só no fim do lote não muda nada.
+    """
+    ids_per_frame: List[np.ndarray] = []
+    retired: List[int] = []
+    for idx, boxes in dets:
+        ids_per_frame.append(tracker.update(boxes))
+        retired += tracker.retired
+    if dets:
+        boxes = np.concatenate([b.reshape(-1, 4) for _, b in dets])
+        frames = np.repeat(np.array([i for i, _ in dets], dtype=np.int64), [len(b) for _, b in dets])
+        _count_points(counter, np.concatenate(ids_per_frame), boxes, frames)
+        if retired:
+            counter.forget(retired)
+    return ids_per_frame
+
+def _make_gate(counter: LineCounter, enabled: bool) -> Optional[MotionGate]:
+    """Gate de movimento numa ROI em torno da(s) linha(s)/zonas (None = infere todo frame amostrado)."""
+    if not enabled or counter.w <= 0 or counter.h <= 0:
+        return None
+    return MotionGate.around_line(*counter.extent(), counter.w, counter.h)
+
+def _make_roi(counter: LineCounter, enabled: bool) -> Optional[LineRoi]:
+    """Recorte em torno da linha para a inferência (None = frame completo)."""
+    if not enabled or counter.w <= 0 or counter.h <= 0:
+        return None
+    roi = LineRoi.around_line(*counter.extent(), counter.w, counter.h)
+    return None if roi.area_frac >= 0.95 else roi  # linha cobre o frame: recortar não ganha nada
+
+class Cancelled(Exception):
+    """Execução interrompida cooperativamente (cliente saiu ou job cancelado)."""
+
+def _checkpoint(cancel=None, should_yield=None):
+    """
+    Ponto de controle por lote: 'cancel' (objeto com is_set()) aborta com Cancelled;
+    'should_yield' (callable -> bool) pausa enquanto houver trabalho mais prioritário.
+    """
+    if should_yield is not None:
+        while should_yield() and not (cancel is not None and cancel.is_set()):
+            time.sleep(0.05)
+    if cancel is not None and cancel.is_set():
+        raise Cancelled()
+
+def _run_yolo_track_frames(model, frames_iter, counter: LineCounter, writer=None,
+                           batch_size: int = YOLO_BATCH_SIZE, tracker: Optional[IoUTracker] = None,
+                           recorder: Optional[DetectionRecorder] = None,
+                           cancel=None, should_yield=None, gate: Optional[MotionGate] = None,
+                           roi: Optional[LineRoi] = None, prof: Optional[StageProfile] = None):
+    """
+    Acumula frames amostrados em micro-lotes de 'batch_size', roda um predict por lote
+    e aplica as detecções no LineCounter em ordem de frame (contagem idêntica ao 1 a 1;
+    sem 'writer' a contagem do lote inteiro é uma só chamada vetorizada).
+    Com 'recorder', guarda as detecções rastreadas para o cache em disco.
+    Antes de cada lote passa por _checkpoint (cancelamento/preempção).
+    Com 'gate', frames sem movimento perto da linha pulam a inferência: o rastreador não
+    é atualizado (estado congelado) mas o frame segue em ordem para o writer/progresso.
+    Com 'roi', o modelo só vê o recorte em torno da linha (ver _run_yolo_on_batch).
+    'prof' recebe os tempos de decode/gate/infer/track/draw/write (ver profiling.py).
+    """
+    batch_size = max(1, int(batch_size))
+    prof = prof if prof is not None else StageProfile(publish=False)
+    if tracker is None:
+        tracker = IoUTracker(iou_thr=TRACK_IOU_THR, max_misses=TRACK_MAX_MISSES)
+    pending: List[Tuple[int, object, bool]] = []
+    n_infer = 0
+    batched = writer is None and isinstance(counter, LineCounter)
+
+    def _flush():
+        nonlocal n_infer
+        _checkpoint(cancel, should_yield)
+        todo = [f for _, f, run in pending if run]
+        dets = _run_yolo_on_batch(model, todo, roi, prof) if todo else []
+        if batched:
+            # sem desenho por frame: a contagem do lote sai numa única chamada vetorizada
+            ran = [idx for idx, _, run in pending if run]
+            with prof.stage("track", len(ran)):
+                ids_iter = iter(_track_and_count_many(tracker, [(i, b) for i, (b, _) in zip(ran, dets)], counter))
+            if recorder is not None:
+                for idx, (boxes, conf) in zip(ran, dets):
+                    recorder.add(idx, boxes, conf, next(ids_iter))
+            for idx, _, _ in pending:
+                prof.count("frames")
+                yield idx
+            pending.clear()
+            n_infer = 0
+            return
+        dets_iter = iter(dets)
+        for idx, frame, run in pending:
+            if run:
+                boxes, conf = next(dets_iter)
+                with prof.stage("track"):
+                    ids = _track_and_count(tracker, boxes, counter, idx)
+                if recorder is not None:
+                    recorder.add(idx, boxes, conf, ids)
+            if writer is not None:
+                _write_annotated(writer, frame, counter, counter.in_count, counter.out_count, prof)
+            prof.count("frames")
+            yield idx
+        pending.clear()
+        n_infer = 0
+
+    for idx, frame in prof.timed_iter("decode", frames_iter):
+        if gate is None:
+            run = True
+        else:
+            with prof.stage("gate"):
+                run = gate.needs_inference(frame)
+            prof.count("skipped", int(not run))
+        pending.append((idx, frame, run))
+        n_infer += int(run)
+        if n_infer >= batch_size or len(pending) >= 2 * batch_size:
+            yield from _flush()
+    if pending:
+        yield from _flush()
+
+def _fallback_dummy(frames_iter, counter: LineCounter, writer=None, cancel=None, should_yield=None,
+                    prof: Optional[StageProfile] = None):
+    prof = prof if prof is not None else StageProfile(publish=False)
+    for n, (idx, frame) in enumerate(prof.timed_iter("decode", frames_iter)):
+        if n % YOLO_BATCH_SIZE == 0:
+            _checkpoint(cancel, should_yield)
         if writer is not None:
-            _draw_overlays(frame, counter, counter.in_count, counter.out_count)
-            writer.write(frame)
+            _write_annotated(writer, frame, counter, counter.in_count, counter.out_count, prof)
+        prof.count("frames")
         yield idx
 
+def _write_annotated(writer, frame, counter: LineCounter, in_partial: int, out_partial: int,
+                     prof: StageProfile):
+    with prof.stage("draw"):
+        _draw_overlays(frame, counter, in_partial, out_partial)
+    with prof.stage("write"):
+        writer.write(frame)
+
+@contextmanager
+def _model_lease(weights: Optional[str] = None, backend: Optional[str] = None):
+    """Empresta um modelo do pool (ou None se YOLO indisponível -> fallback)."""
+    if not YOLO_AVAILABLE:
+        yield None
+        return
+    with get_model_pool(weights, backend=backend).lease() as model:
+        yield model
+
+# ---------- Cache de detecções (replay do contador sem inferir) ----------
+def _detection_cache_key(video_path: str, weights: Optional[str], step: int,
+                         gate: bool = False, crop: bool = False,
+                         line_px: Optional[Tuple[int,int,int,int]] = None,
+                         size: Optional[Tuple[int,int]] = None,
+                         backend: str = "torch") -> Optional[str]:
+    if not (detection_cache.CACHE_ENABLED and YOLO_AVAILABLE):
+        return None
+    try:
+        vhash = detection_cache.video_hash(video_path)
+    except OSError:
+        return None
+    # gate/recorte dependem da região da linha: as detecções só valem para a mesma linha
+    region = None
+    if gate or crop:
+        region = {"line": list(line_px or ()),
+                  "gate": [motion_gate.MOTION_DIFF_THR, motion_gate.MOTION_MIN_AREA,
+                           motion_gate.MOTION_PAD_FRAC] if gate else None,
+                  "crop": [roi_crop.ROI_PAD_FRAC, roi_crop.ROI_TARGET_PERSON_PX,
+                           roi_crop.ROI_IMGSZ_MIN, roi_crop.ROI_IMGSZ_MAX] if crop else None}
+    # o backend entra na chave: INT8/ONNX não geram caixas idênticas às do PyTorch
+    return detection_cache.cache_key(vhash, f"{weights or DEFAULT_WEIGHTS}@{backend}", step, conf=0.25,
+                                     iou_thr=TRACK_IOU_THR, max_misses=TRACK_MAX_MISSES,
+                                     region=region, size=list(size) if size else None)
+
+def counting_settings(weights: Optional[str] = None) -> dict:
+    """Ajustes do processo que mudam o resultado (entram na chave do result_cache)."""
+    return {"weights": weights or DEFAULT_WEIGHTS, "yolo": YOLO_AVAILABLE,
+            "tracker": [TRACK_IOU_THR, TRACK_MAX_MISSES],
+            "gate": [motion_gate.MOTION_GATE, motion_gate.MOTION_DIFF_THR, motion_gate.MOTION_MIN_AREA,
+                     motion_gate.MOTION_PAD_FRAC, motion_gate.MOTION_HANGOVER, motion_gate.MOTION_MAX_SKIP],
+            "crop": [roi_crop.ROI_CROP, roi_crop.ROI_PAD_FRAC, roi_crop.ROI_TARGET_PERSON_PX,
+                     roi_crop.ROI_IMGSZ_MIN, roi_crop.ROI_IMGSZ_MAX],
+            "source": frame_source.FRAME_SOURCE,
+            "chunks": [CHUNK_OVERLAP_SECONDS, CHUNK_MIN_SECONDS]}
+
+def _global_track_id(segment: int, track_id: int) -> int:
+    # ids de track são locais a cada trecho; o índice do trecho vai nos bits altos
+    return (int(segment) << 32) | int(track_id)
+
+def _replay_detections(data: dict, w: int, h: int, line, spec: Optional[dict] = None) -> dict:
+    """
+    Re-executa o contador sobre detecções em cache, respeitando os trechos gravados
+    (aquecimento sem contar + faixa própria), como no processamento original. A
+    aposentadoria de tracks do IoUTracker é reproduzida pelas falhas consecutivas.
+    """
+    events: List[Tuple[int,int,int]] = []
+    multi = []
+    last_idx = -1
+    if not spec:
+        # só a linha principal: um update vetorizado por trecho (ids não se repetem depois
+        # de aposentados, então não é preciso reproduzir o tracker)
+        for seg, (warm, start, end, frames, det_frame, boxes, ids) in \
+                enumerate(detection_cache.segment_arrays(data)):
+            counter = LineCounter(w, h, line)
+            _count_points(counter, ids, boxes, det_frame)
+            events += [(i, _global_track_id(seg, t), d) for i, t, d in counter.events if i >= start]
+            if len(frames) and frames.max() >= start:
+                last_idx = max(last_idx, int(frames.max()))
+        events.sort(key=lambda e: e[0])
+        return {"events": events, "last_idx": last_idx, "multi": None}
+    for seg, (warm, start, end, frames) in enumerate(detection_cache.iter_segments(data)):
+        counter = _make_counter(w, h, line, spec)
+        misses: Dict[int, int] = {}
+        for idx, boxes, ids in frames:
+            _count_points(counter, ids, boxes, idx)
+            seen = set(ids.tolist())
+            retired = []
+            for tid in list(misses):
+                if tid not in seen:
+                    misses[tid] += 1
+                    if misses[tid] > TRACK_MAX_MISSES:
+                        del misses[tid]
+                        retired.append(tid)
+            for tid in seen:
+                misses[tid] = 0
+            if retired:
+                counter.forget(retired)
+            if idx >= start:
+                last_idx = max(last_idx, idx)
+        events += [(i, _global_track_id(seg, t), d) for i, t, d in counter.events if i >= start]
+        multi.append(_counter_export(counter, start, seg))
+    events.sort(key=lambda e: e[0])
+    return {"events": events, "last_idx": last_idx, "multi": zones.merge_exports(multi)}
+
+def _counter_export(counter, own_start: int, seg: int) -> Optional[dict]:
+    """Eventos de linhas extras/zonas da faixa própria (None para LineCounter simples)."""
+    if not isinstance(counter, zones.CounterSet):
+        return None
+    return counter.export(own_start, lambda t: _global_track_id(seg, t))
+
+def _save_detections(key: Optional[str], segments, meta: dict):
+    if key is None or not segments:
+        return
+    try:
+        detection_cache.save(key, segments, meta)
+    except OSError:
+        pass  # cache é best-effort
+
+# ---------- Processamento paralelo por trechos (workers > 1) ----------
+# O vídeo é dividido em faixas de frames alinhadas à grade de amostragem global. Cada faixa
+# começa 'CHUNK_OVERLAP_SECONDS' antes (aquecimento): nessa sobreposição o estado de
+# rastreamento/lado é reconstruído sem contar, e só os cruzamentos dentro da própria
+# faixa são emitidos. Assim quem cruza perto da fronteira é contado uma única vez.
+CHUNK_OVERLAP_SECONDS = float(os.environ.get("CHUNK_OVERLAP_SECONDS", "2.0"))
+CHUNK_MIN_SECONDS = float(os.environ.get("CHUNK_MIN_SECONDS", "30"))
+CHUNK_MP_START = os.environ.get("CHUNK_MP_START", "spawn")
+
+# Um único pool de trechos (com modelos carregados nos workers): um pedido com outro
+# número de workers recria o pool e encerra o anterior, em vez de acumular um conjunto de
+# processos residentes por valor distinto.
+_EXECUTOR: Optional[ProcessPoolExecutor] = None
+_EXECUTOR_SIZE = 0
+_EXECUTORS_LOCK = threading.Lock()
+
+def clamp_workers(workers) -> int:
+    """workers do request -> 1..núcleos da máquina (1 = serial)."""
+    try:
+        workers = int(workers)
+    except (TypeError, ValueError):
+        workers = 1
+    return max(1, min(workers, os.cpu_count() or 1))
+
+def chunk_threads(workers: int) -> int:
+    """Threads de inferência de cada worker de trechos (núcleos divididos entre eles)."""
+    return max(1, (os.cpu_count() or 1) // clamp_workers(workers))
+
+def _chunk_worker_init(threads: int):
+    # limita threads por processo para não sobrescrever núcleos entre workers
+    for k in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS"):
+        os.environ[k] = str(threads)
+    cv2.setNumThreads(1)  # também sem torch (cpu_tunning importa torch)
+    try:
+        from cpu_tunning import tune_cpu_threads
+        tune_cpu_threads(num_infer_threads=threads, num_interop_threads=1, opencv_threads=1)
+    except Exception:
+        pass
+
+def _get_chunk_executor(workers: int) -> ProcessPoolExecutor:
+    """
+    Pool de processos persistente (reaproveita modelos já carregados nos workers). Mudou o
+    tamanho: o pool antigo termina as faixas já enviadas e sai; o novo assume.
+    """
+    global _EXECUTOR, _EXECUTOR_SIZE
+    workers = clamp_workers(workers)
+    with _EXECUTORS_LOCK:
+        if _EXECUTOR is None or _EXECUTOR_SIZE != workers:
+            old = _EXECUTOR
+            threads = chunk_threads(workers)
+            _EXECUTOR = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=mp.get_context(CHUNK_MP_START),
+                                            initializer=_chunk_worker_init,
+                                            initargs=(threads,))
+            _EXECUTOR_SIZE = workers
+            if old is not None:
+                old.shutdown(wait=False)
+        return _EXECUTOR
+
+def shutdown_chunk_executor(block: bool = True):
+    """Encerra o pool de trechos (saída do processo, fim de uma medição do autotune)."""
+    global _EXECUTOR, _EXECUTOR_SIZE
+    with _EXECUTORS_LOCK:
+        ex, _EXECUTOR, _EXECUTOR_SIZE = _EXECUTOR, None, 0
+    if ex is not None:
+        ex.shutdown(wait=block, cancel_futures=True)
+
+atexit.register(shutdown_chunk_executor)
+
+_MP_MANAGER = None
+
+def _get_mp_manager():
+    global _MP_MANAGER
+    with _EXECUTORS_LOCK:
+        if _MP_MANAGER is None:
+            _MP_MANAGER = mp.get_context(CHUNK_MP_START).Manager()
+        return _MP_MANAGER
+
+def _plan_ranges(total_frames: int, fps: float, step: int, workers: int) -> List[Tuple[int,int,int]]:
+    """Retorna [(warm_start, start, end)] com start/warm_start múltiplos de 'step'."""
+    if workers <= 1 or total_frames <= 0:
+        return [(0, 0, total_frames)]
+    min_frames = max(step, int(CHUNK_MIN_SECONDS * (fps or 25.0)))
+    n = max(1, min(workers * 2, total_frames // min_frames))  # 2 faixas/worker p/ balancear
+    size = int(math.ceil(total_frames / n / step)) * step
+    overlap = int(math.ceil(CHUNK_OVERLAP_SECONDS * (fps or 25.0) / step)) * step
+    return [(max(0, start - overlap), start, min(total_frames, start + size))
+            for start in range(0, total_frames, size)]
+
+def _process_range(job: dict) -> dict:
+    """Executa detecção+contagem em uma faixa (roda no processo worker)."""
+    cap = None
+    if job["strategy"] != "ffmpeg":
+        cap = cv2.VideoCapture(job["video_path"])
+        if not cap.isOpened():
+            raise RuntimeError("Falha ao abrir vídeo.")
+    step, own_start = job["step"], job["start"]
+    counter = _make_counter(job["w"], job["h"], job["line"], job.get("spec"))
+    sampling = _new_sampling_stats(job["strategy"], step)
+    # a última faixa vai até o fim real do vídeo (a contagem de frames é só estimativa)
+    end = None if job.get("last") else job["end"]
+    frames_iter = _open_frames(job["video_path"], cap, job["strategy"], step, sampling,
+                               job["fps"], (job["w"], job["h"]),
+                               job["warm_start"], end, hold=2 * job["batch_size"] + 2)
+    last_idx = -1
+    recorder = DetectionRecorder() if job.get("record") else None
+    cancel, pause = job.get("cancel_ev"), job.get("pause_ev")
+    should_yield = pause.is_set if pause is not None else None
+    gate = _make_gate(counter, job.get("motion_gate", False))
+    roi = _make_roi(counter, job.get("roi_crop", False))
+    prof = StageProfile(publish=False)  # publicado pelo processo principal
+    try:
+        with _model_lease(job.get("weights"), job.get("backend")) as model:
+            if model is not None:
+                runner = _run_yolo_track_frames(model, frames_iter, counter, writer=None,
+                                                batch_size=job["batch_size"], recorder=recorder,
+                                                cancel=cancel, should_yield=should_yield,
+                                                gate=gate, roi=roi, prof=prof)
+            else:
+                runner = _fallback_dummy(frames_iter, counter, writer=None,
+                                         cancel=cancel, should_yield=should_yield, prof=prof)
+            for idx in runner:
+                if idx >= own_start:
+                    last_idx = idx
+    finally:
+        frames_iter.close()
+        if cap is not None:
+            cap.release()
+    # cruzamentos do aquecimento pertencem ao trecho anterior
+    events = [(i, _global_track_id(job["seg"], t), d) for i, t, d in counter.events if i >= own_start]
+    return {"warm_start": job["warm_start"], "start": own_start, "end": job["end"],
+            "events": events, "last_idx": last_idx, "sampling": _finish_sampling_stats(sampling),
+            "multi": _counter_export(counter, own_start, job["seg"]),
+            "motion": gate.summary() if gate is not None else None,
+            "roi": roi.summary() if roi is not None else None,
+            "profile": prof.summary(),
+            "detections": recorder.to_arrays() if recorder is not None else None}
+
+def _merge_sampling(parts: List[dict], strategy: str, step: int) -> dict:
+    out = _new_sampling_stats(strategy, step)
+    for p in parts:
+        for k in ("decoded", "grabbed", "seeks", "frames_covered", "decode_s", "skip_s", "saved_s_est"):
+            out[k] += p[k]
+    for k in ("decode_s", "skip_s", "saved_s_est"):
+        out[k] = round(out[k], 4)
+    out["chunks"] = len(parts)
+    return out
+
+def _iter_chunked(video_path: str, line, step: int, strategy: str, total_frames: int,
+                  fps: float, w: int, h: int, ranges: List[Tuple[int,int,int]], workers: int, **opts):
+    """
+    Gera eventos de progresso enquanto as faixas terminam; o valor de retorno é o resultado
+    mesclado: {"events": [(idx, track_id, dir)] ordenados, "multi", "last_idx", "sampling", "segments"}.
+    """
+    ex = _get_chunk_executor(workers)
+    cancel, should_yield = opts.get("cancel"), opts.get("should_yield")
+    prof = opts.get("prof")
+    # eventos entre processos só quando há controle (cancelamento/preempção)
+    cancel_ev = pause_ev = None
+    if cancel is not None or should_yield is not None:
+        mgr = _get_mp_manager()
+        cancel_ev, pause_ev = mgr.Event(), mgr.Event()
+    futures = [ex.submit(_process_range, {
+        "video_path": video_path, "line": line, "step": step, "strategy": strategy,
+        "total_frames": total_frames, "fps": fps, "w": w, "h": h,
+        "warm_start": warm, "start": start, "end": end, "last": seg == len(ranges) - 1,
+        "weights": opts.get("weights"), "backend": opts.get("backend"), "batch_size": opts.get("batch_size", YOLO_BATCH_SIZE),
+        "record": bool(opts.get("record")), "seg": seg, "spec": opts.get("spec"),
+        "motion_gate": bool(opts.get("motion_gate")), "roi_crop": bool(opts.get("roi_crop")),
+        "cancel_ev": cancel_ev, "pause_ev": pause_ev,
+    }) for seg, (warm, start, end) in enumerate(ranges)]
+    parts: List[dict] = []
+    done_frames = in_p = out_p = 0
+    pending = set(futures)
+    try:
+        while pending:
+            if cancel is not None and cancel.is_set():
+                cancel_ev.set()
+                raise Cancelled()
+            if pause_ev is not None:
+                if should_yield is not None and should_yield():
+                    pause_ev.set()
+                else:
+                    pause_ev.clear()
+            done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            for fut in done:
+                part = fut.result()
+                parts.append(part)
+                if prof is not None:
+                    prof.merge(part["profile"])
+                    prof.flush()
+                done_frames += part["end"] - part["start"]
+                in_p += sum(1 for e in part["events"] if e[2] > 0)
+                out_p += sum(1 for e in part["events"] if e[2] < 0)
+                yield {
+                    "type": "progress",
+                    "pct": int(min(100, math.floor(done_frames / max(1, total_frames) * 100))),
+                    "in_partial": int(in_p),
+                    "out_partial": int(out_p),
+                }
+    finally:
+        for fut in futures:
+            fut.cancel()
+        if cancel_ev is not None and pending:
+            cancel_ev.set()  # gerador fechado/erro: faixas em execução param no próximo lote
+    parts.sort(key=lambda p: p["start"])
+    events = [e for p in parts for e in p["events"]]
+    return {
+        "events": events,
+        "multi": zones.merge_exports([p["multi"] for p in parts]),
+        "last_idx": max((p["last_idx"] for p in parts), default=-1),
+        "sampling": _merge_sampling([p["sampling"] for p in parts], strategy, step),
+        "motion": motion_gate.merge_stats([p["motion"] for p in parts if p["motion"]])
+                  if any(p["motion"] for p in parts) else None,
+        "roi": roi_crop.merge_stats([p["roi"] for p in parts if p["roi"]])
+               if any(p["roi"] for p in parts) else None,
+        "segments": [((p["warm_start"], p["start"], p["end"]), p["detections"])
+                     for p in parts if p["detections"] is not None],
+    }
+
+def _drain(gen, progress_cb=None):
+    """Consome um gerador de eventos (repassando ao callback) e devolve o valor de retorno."""
+    while True:
+        try:
+            ev = next(gen)
+        except StopIteration as stop:
+            return stop.value
+        if progress_cb is not None:
+            progress_cb(ev)
+
+def _render_annotated(video_path: str, writer, step: int, strategy: str, total_frames: int,
+                      fps: float, counter: LineCounter, events: List[Tuple[int,int,int]],
+                      prof: Optional[StageProfile] = None):
+    """Passo de desenho após o modo paralelo: só decodifica os frames amostrados."""
+    prof = prof if prof is not None else StageProfile(publish=False)
+    cap = None
+    if strategy != "ffmpeg":
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            return
+    cum_in = cum_out = 0
+    ei = 0
+    frames_iter = _open_frames(video_path, cap, strategy, step, None, fps,
+                               (counter.w, counter.h), hold=1)
+    try:
+        for idx, frame in prof.timed_iter("decode", frames_iter):
+            while ei < len(events) and events[ei][0] <= idx:
+                if events[ei][2] > 0:
+                    cum_in += 1
+                else:
+                    cum_out += 1
+                ei += 1
+            _write_annotated(writer, frame, counter, cum_in, cum_out, prof)
+    finally:
+        frames_iter.close()
+        if cap is not None:
+            cap.release()
+
+# ---------- Execução local: serial ou em pipeline (decoder -> inferência -> contagem) ----------
+# No modo pipeline um processo decodifica para um anel em memória compartilhada, N processos
+# de inferência consomem slots por índice e este processo reordena os resultados por frame
+# para rastrear/contar/desenhar. Só índices e caixas passam pelas filas.
+PIPELINE_MODE = os.environ.get("PIPELINE_MODE", "0") != "0"
+PIPELINE_INFER_WORKERS = max(1, int(os.environ.get("PIPELINE_INFER_WORKERS", "1") or 1))
+PIPELINE_SLOTS = int(os.environ.get("PIPELINE_SLOTS", "0") or 0)  # 0 = automático
+
+def _run_serial(video_path: str, strategy: str, step: int, total_frames: int, fps: float,
+                counter: LineCounter, writer=None, batch_size: int = YOLO_BATCH_SIZE,
+                recorder: Optional[DetectionRecorder] = None, use_gate: bool = False,
+                use_roi: bool = False, weights: Optional[str] = None, backend: Optional[str] = None,
+                cancel=None, should_yield=None, report: Optional[dict] = None,
+                prof: Optional[StageProfile] = None):
+    """Decode + inferência + contagem no mesmo laço; preenche 'report' ao terminar."""
+    report = report if report is not None else {}
+    cap = None
+    if strategy != "ffmpeg":
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise RuntimeError("Falha ao abrir vídeo.")
+    sampling = _new_sampling_stats(strategy, step)
+    gate = _make_gate(counter, use_gate)
+    roi = _make_roi(counter, use_roi)
+    frames_iter = _open_frames(video_path, cap, strategy, step, sampling,
+                               fps, (counter.w, counter.h), hold=2 * batch_size + 2)
+    try:
+        with _model_lease(weights, backend) as model:
+            if model is not None:
+                runner = _run_yolo_track_frames(model, frames_iter, counter, writer=writer,
+                                                batch_size=batch_size, recorder=recorder,
+                                                cancel=cancel, should_yield=should_yield,
+                                                gate=gate, roi=roi, prof=prof)
+            else:
+                runner = _fallback_dummy(frames_iter, counter, writer=writer,
+                                         cancel=cancel, should_yield=should_yield, prof=prof)
+            yield from runner
+    finally:
+        frames_iter.close()
+        if cap is not None:
+            cap.release()
+        report["sampling"] = _finish_sampling_stats(sampling)
+        report["motion"] = gate.summary() if gate is not None else None
+        report["roi"] = roi.summary() if roi is not None else None
+
+def _pipeline_decoder(job: dict):
+    """Processo decodificador: frames amostrados -> slots livres do anel (+ gate de movimento)."""
+    ring = FrameRing.attach(job["ring"])
+    free_q, ready_q, result_q = job["free_q"], job["ready_q"], job["result_q"]
+    stop, inflight = job["stop"], job["inflight"]
+    clock = StageClock("decode")
+    prof = StageProfile(publish=False)
+    sampling = _new_sampling_stats(job["strategy"], job["step"])
+    counter = _make_counter(job["w"], job["h"], job["line"], job["spec"])
+    gate = _make_gate(counter, job["motion_gate"])
+    cap = None
+    if job["strategy"] != "ffmpeg":
+        cap = cv2.VideoCapture(job["video_path"])
+    frames_iter = _open_frames(job["video_path"], cap, job["strategy"], job["step"], sampling,
+                               job["fps"], (job["w"], job["h"]), hold=1)
+    seq = 0
+    error = None
+    try:
+        for idx, frame in prof.timed_iter("decode", frames_iter):
+            if gate is None:
+                run = True
+            else:
+                with prof.stage("gate"):
+                    run = gate.needs_inference(frame)
+                prof.count("skipped", int(not run))
+            slot = None
+            with clock.stall():
+                while slot is None and not stop.is_set():
+                    try:
+                        slot = free_q.get(timeout=0.2)
+                    except queue.Empty:
+                        pass
+            if slot is None:
+                break
+            ring.put(slot, frame)
+            with inflight.get_lock():
+                inflight.value += 1
+            ready_q.put((seq, idx, slot, run))
+            seq += 1
+            clock.items += 1
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        if stop.is_set():  # abortado: não esperar o consumidor esvaziar as filas ao sair
+            ready_q.cancel_join_thread()
+        frames_iter.close()
+        if cap is not None:
+            cap.release()
+        for _ in range(job["n_workers"]):
+            ready_q.put(None)
+        result_q.put(("decoder", {"frames": seq, "error": error, "clock": clock.summary(),
+                                  "profile": prof.summary(),
+                                  "sampling": _finish_sampling_stats(sampling),
+                                  "motion": gate.summary() if gate is not None else None}))
+        ring.close()
+
+def _pipeline_infer(job: dict):
+    """Processo de inferência: micro-lotes de slots prontos -> caixas (em ordem de chegada)."""
+    ring = FrameRing.attach(job["ring"])
+    free_q, ready_q, result_q = job["free_q"], job["ready_q"], job["result_q"]
+    stop, inflight = job["stop"], job["inflight"]
+    clock = StageClock("infer")
+    prof = StageProfile(publish=False)
+    counter = _make_counter(job["w"], job["h"], job["line"], job["spec"])
+    roi = _make_roi(counter, job["roi_crop"])
+    ended = False
+    error = None
+    try:
+        with _model_lease(job["weights"], job["backend"]) as model:
+            while not ended and not stop.is_set():
+                with clock.stall():
+                    try:
+                        item = ready_q.get(timeout=0.2)
+                    except queue.Empty:
+                        continue
+                if item is None:
+                    break
+                batch = [item]
+                while len(batch) < job["batch_size"]:
+                    try:
+                        nxt = ready_q.get_nowait()
+                    except queue.Empty:
+                        break
+                    if nxt is None:
+                        ended = True
+                        break
+                    batch.append(nxt)
+                todo = [it for it in batch if it[3]]
+                dets = iter(_run_yolo_on_batch(model, [ring.frames[it[2]] for it in todo], roi, prof)
+                            if todo else [])
+                for seq, idx, slot, run in batch:
+                    boxes, conf = next(dets) if run else (None, None)
+                    result_q.put(("frame", seq, idx, slot, boxes, conf))
+                    if not job["keep_frames"]:
+                        free_q.put(slot)
+                        with inflight.get_lock():
+                            inflight.value -= 1
+                clock.items += len(todo)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        stop.set()
+    finally:
+        if stop.is_set():
+            result_q.cancel_join_thread()
+            free_q.cancel_join_thread()
+        result_q.put(("worker", {"error": error, "clock": clock.summary(), "profile": prof.summary(),
+                                 "roi": roi.summary() if roi is not None else None}))
+        ring.close()
+
+def _run_pipelined(video_path: str, strategy: str, step: int, total_frames: int, fps: float,
+                   counter: LineCounter, line, writer=None, batch_size: int = YOLO_BATCH_SIZE,
+                   recorder: Optional[DetectionRecorder] = None, use_gate: bool = False,
+                   use_roi: bool = False, weights: Optional[str] = None,
+                   backend: Optional[str] = None, cancel=None,
+                   should_yield=None, n_workers: int = PIPELINE_INFER_WORKERS,
+                   n_slots: int = PIPELINE_SLOTS, report: Optional[dict] = None,
+                   prof: Optional[StageProfile] = None):
+    """
+    Mesmo contrato de _run_yolo_track_frames (gera idx em ordem, alimenta o contador),
+    mas com decode e inferência em processos separados sobre um FrameRing. Com 'writer',
+    o slot só volta ao anel depois de desenhado/gravado aqui.
+    """
+    report = report if report is not None else {}
+    prof = prof if prof is not None else StageProfile(publish=False)
+    n_workers = max(1, int(n_workers))
+    n_slots = int(n_slots) or (n_workers + 2) * batch_size + 2
+    ctx = mp.get_context(CHUNK_MP_START)
+    ring = FrameRing(n_slots, (counter.h, counter.w, 3))
+    free_q, ready_q, result_q = ctx.Queue(), ctx.Queue(), ctx.Queue()
+    for k in range(n_slots):
+        free_q.put(k)
+    stop, inflight = ctx.Event(), ctx.Value("i", 0)
+    base = {"ring": ring.spec(), "free_q": free_q, "ready_q": ready_q, "result_q": result_q,
+            "stop": stop, "inflight": inflight, "w": counter.w, "h": counter.h, "line": line,
+            "spec": getattr(counter, "spec", None)}
+    procs = [ctx.Process(target=_pipeline_decoder, daemon=True, name="pipe-decode", args=({
+        **base, "video_path": video_path, "strategy": strategy, "step": step, "fps": fps,
+        "total_frames": total_frames, "motion_gate": use_gate, "n_workers": n_workers},))]
+    procs += [ctx.Process(target=_pipeline_infer, daemon=True, name=f"pipe-infer-{i}", args=({
+        **base, "weights": weights, "backend": backend, "batch_size": batch_size, "roi_crop": use_roi,
+        "keep_frames": writer is not None},)) for i in range(n_workers)]
+    for p in procs:
+        p.start()
+
+    tracker = IoUTracker(iou_thr=TRACK_IOU_THR, max_misses=TRACK_MAX_MISSES)
+    clock = StageClock("count")
+    reorder: Dict[int, tuple] = {}
+    next_seq = 0
+    decoder, workers = None, []
+    occ_sum = occ_max = 0
+    try:
+        while True:
+            while next_seq in reorder:
+                idx, slot, boxes, conf = reorder.pop(next_seq)
+                next_seq += 1
+                occ = inflight.value
+                occ_sum += occ
+                occ_max = max(occ_max, occ)
+                profiling.REGISTRY.set_gauge("pipeline_inflight", occ)
+                if boxes is not None:
+                    with prof.stage("track"):
+                        ids = _track_and_count(tracker, boxes, counter, idx)
+                    if recorder is not None:
+                        recorder.add(idx, boxes, conf, ids)
+                if writer is not None:
+                    _write_annotated(writer, ring.frames[slot], counter,
+                                     counter.in_count, counter.out_count, prof)
+                    free_q.put(slot)
+                    with inflight.get_lock():
+                        inflight.value -= 1
+                clock.items += 1
+                prof.count("frames")
+                yield idx
+            if decoder is not None and len(workers) == n_workers:
+                break
+            _checkpoint(cancel, should_yield)
+            with clock.stall():
+                try:
+                    msg = result_q.get(timeout=0.2)
+                except queue.Empty:
+                    msg = None
+            if msg is None:
+                dead = [p for p in procs if p.exitcode not in (None, 0)]
+                if dead:
+                    raise RuntimeError(f"Processo {dead[0].name} terminou (código {dead[0].exitcode}).")
+                continue
+            if msg[0] == "frame":
+                _, seq, idx, slot, boxes, conf = msg
+                reorder[seq] = (idx, slot, boxes, conf)
+            elif msg[0] == "decoder":
+                decoder = msg[1]
+            else:
+                workers.append(msg[1])
+        errors = [s["error"] for s in [decoder] + workers if s and s.get("error")]
+        if errors:
+            raise RuntimeError(errors[0])
+    finally:
+        stop.set()
+        for p in procs:
+            p.join(timeout=2)
+            if p.is_alive():
+                p.terminate()
+                p.join()
+        ring.close()
+        profiling.REGISTRY.set_gauge("pipeline_inflight", 0)
+        for part in [decoder] + workers:
+            prof.merge((part or {}).get("profile"))
+        n = max(1, clock.items)
+        report["sampling"] = decoder["sampling"] if decoder else _new_sampling_stats(strategy, step)
+        report["motion"] = decoder["motion"] if decoder else None
+        rois = [w["roi"] for w in workers if w.get("roi")]
+        report["roi"] = roi_crop.merge_stats(rois) if rois else None
+        report["pipeline"] = {
+            "slots": n_slots,
+            "infer_workers": n_workers,
+            "occupancy_mean": round(occ_sum / n / n_slots, 3),
+            "occupancy_max": round(occ_max / n_slots, 3),
+            "stages": [decoder["clock"] if decoder else None,
+                       frame_ring.merge_stages([w["clock"] for w in workers], "infer"),
+                       clock.summary()],
+        }
+
+def _run_local(video_path: str, strategy: str, step: int, total_frames: int, fps: float,
+               counter: LineCounter, line, use_pipeline: bool = False, **opts):
+    """Despacha entre o laço serial e o pipeline multiprocesso (mesma sequência de idx)."""
+    if use_pipeline:
+        return _run_pipelined(video_path, strategy, step, total_frames, fps, counter, line, **opts)
+    return _run_serial(video_path, strategy, step, total_frames, fps, counter, **opts)
+
+def _video_info(video_path: str) -> Tuple[int, float, int, int]:
+    """
+    (frames, fps, w, h) do cache de metadados (sidecar do upload): o job não reabre o
+    contêiner só para ler o cabeçalho. ValueError se o vídeo for ilegível.
+    """
+    meta = video_meta.get(video_path)
+    return (int(meta.get("frames") or 0), float(meta.get("fps") or 25.0),
+            int(meta.get("width") or 0), int(meta.get("height") or 0))
+
 # ---------- API esperada pelo app ----------
 def process_stream(
     video_path: str,
@@ -181,66 +1342,120 @@ def process_stream(
             yield {"type":"error","message":"Vídeo não encontrado."}
             return
 
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
+        try:
+            total_frames, fps, w, h = _video_info(video_path)
+        except ValueError:
             yield {"type":"error","message":"Falha ao abrir vídeo."}
             return
 
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
-        fps = float(cap.get(cv2.CAP_PROP_FPS) or 25.0)
-        w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
-        h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
-
         # coersões de tipos (querystring chega como str)
         sample_fps = _coerce_float(sample_fps, 5.0)
         chunk_seconds = _coerce_int(chunk_seconds, 60)
         workers = _coerce_int(workers, 0)
+        batch_size = _coerce_int(kwargs.get("batch_size", YOLO_BATCH_SIZE), YOLO_BATCH_SIZE)
+        # controle cooperativo (fila de jobs): cancel.is_set() aborta, should_yield() pausa
+        cancel, should_yield = kwargs.get("cancel"), kwargs.get("should_yield")
 
         # aceita line OU line_norm; ambos podem vir como string "x1,y1,x2,y2"
         line = _coerce_line(line if line is not None else line_norm)
         if line is None:
             yield {"type":"error","message":"Linha inválida (esperado x1,y1,x2,y2 normalizados)."}
             return
+        try:
+            backend = detector.parse_backend(kwargs.get("backend"))
+            spec = zones.normalize_spec(zones.parse_spec(kwargs.get("lines"), kwargs.get("zones")), w, h)
+        except ValueError as e:
+            yield {"type":"error","message": str(e)}
+            return
 
         step = _estimate_every_n_frames(fps, sample_fps)
-        counter = LineCounter(w, h, line)
-        frames_iter = _iterate_frames(cap, step)
+        strategy = _choose_sampling_strategy(step, total_frames, kwargs.get("sampling", "auto"))
+        line, w, h = _frame_geometry(strategy, line, w, h)
+        counter = _make_counter(w, h, line, spec)
+        ranges = _plan_ranges(total_frames, fps, step, workers)
+        # gate só faz sentido com YOLO (o fallback não infere nada)
+        use_gate = bool(kwargs.get("motion_gate", motion_gate.MOTION_GATE)) and YOLO_AVAILABLE
+        use_roi = bool(kwargs.get("roi_crop", roi_crop.ROI_CROP)) and YOLO_AVAILABLE
+        cache_key = _detection_cache_key(video_path, kwargs.get("weights"), step, use_gate, use_roi,
+                                         counter.extent(), (w, h), backend) \
+            if kwargs.get("use_cache", True) else None
+        use_pipeline = bool(kwargs.get("pipeline", PIPELINE_MODE)) and YOLO_AVAILABLE
+        motion = roi_stats = pipeline = None
+        cached = detection_cache.load(cache_key) if cache_key else None
+        cache_meta = {"fps": fps, "total_frames": total_frames, "w": w, "h": h, "step": step,
+                      "weights": kwargs.get("weights") or DEFAULT_WEIGHTS, "backend": backend}
+        prof = StageProfile()
 
-        if YOLO_AVAILABLE:
-            model = YOLO("yolov8n.pt")  # leve para CPU
-            runner = _run_yolo_track_frames(model, frames_iter, counter, writer=None)
+        if cached is not None:
+            merged = _replay_detections(cached, w, h, line, spec)
+            events, multi = merged["events"], merged["multi"]
+            sampling = _new_sampling_stats("cache", step)
+        elif len(ranges) > 1:
+            merged = yield from _iter_chunked(video_path, line, step, strategy, total_frames, fps, w, h,
+                                              ranges, workers, weights=kwargs.get("weights"), backend=backend,
+                                              batch_size=batch_size, record=cache_key is not None,
+                                              motion_gate=use_gate, roi_crop=use_roi, spec=spec,
+                                              cancel=cancel, should_yield=should_yield, prof=prof)
+            events, multi = merged["events"], merged["multi"]
+            sampling = merged["sampling"]
+            motion, roi_stats = merged["motion"], merged["roi"]
+            _save_detections(cache_key, merged["segments"], cache_meta)
         else:
-            runner = _fallback_dummy(frames_iter, counter, writer=None)
+            recorder = DetectionRecorder() if cache_key else None
+            report: dict = {}
+            runner = _run_local(video_path, strategy, step, total_frames, fps, counter, line,
+                                use_pipeline=use_pipeline, writer=None, batch_size=batch_size,
+                                recorder=recorder, use_gate=use_gate, use_roi=use_roi,
+                                weights=kwargs.get("weights"), backend=backend, cancel=cancel,
+                                should_yield=should_yield, report=report, prof=prof)
+            last_emit = 0.0
+            for idx in runner:
+                pct = int(min(100, math.floor((idx+1)/max(1,total_frames)*100)))
+                now = time.time()
+                if now - last_emit > 0.08:  # ~10 Hz
+                    yield {
+                        "type":"progress",
+                        "pct": pct,
+                        "in_partial": int(counter.in_count),
+                        "out_partial": int(counter.out_count)
+                    }
+                    last_emit = now
+            sampling, motion, roi_stats = report["sampling"], report["motion"], report["roi"]
+            pipeline = report.get("pipeline")
+            if recorder is not None:
+                _save_detections(cache_key, [((0, 0, total_frames), recorder.to_arrays())], cache_meta)
+            events = counter.events
+            multi = _counter_export(counter, 0, 0)
 
-        last_emit = 0.0
-        for idx in runner:
-            pct = int(min(100, math.floor((idx+1)/max(1,total_frames)*100)))
-            now = time.time()
-            if now - last_emit > 0.08:  # ~10 Hz
-                yield {
-                    "type":"progress",
-                    "pct": pct,
-                    "in_partial": int(counter.in_count),
-                    "out_partial": int(counter.out_count)
-                }
-                last_emit = now
-
-        net_total = int(counter.in_count - counter.out_count)
-        dur_s = int(total_frames / (fps or 1))
-        windows = [{
-            "start": "00:00:00",
-            "end": _fmt_s(dur_s),
-            "in": int(counter.in_count),
-            "out": int(counter.out_count),
-        }]
+        ev = crossings.to_event_array(events, fps)
+        in_total, out_total = crossings.totals(ev)
+        duration_s = total_frames / (fps or 1.0)
+        windows = crossings.aggregate_windows(ev, chunk_seconds, duration_s)
+        regions = zones.summarize(multi, counter, fps, duration_s, chunk_seconds) if spec else {}
+        events_path = os.path.join(_new_output_dir(), "events.npz")
+        ensure_dirs(events_path)
+        with prof.stage("csv"):
+            crossings.save_events(events_path, ev, duration_s, fps)
+        prof.flush()
         yield {
             "type":"done",
-            "in_total": int(counter.in_count),
-            "out_total": int(counter.out_count),
-            "net_total": net_total,
-            "windows": windows
+            "in_total": in_total,
+            "out_total": out_total,
+            "net_total": in_total - out_total,
+            "windows": windows,
+            "events_path": events_path,
+            "sampling": sampling,
+            "motion": motion,
+            "roi": roi_stats,
+            "pipeline": pipeline,
+            "backend": backend,
+            "detection_cache": "off" if cache_key is None else ("hit" if cached is not None else "miss"),
+            **regions,
+            **({"profile": prof.report()} if kwargs.get("profile") else {}),
         }
 
+    except Cancelled:
+        yield {"type":"cancelled"}
     except Exception as e:
         yield {"type":"error","message": f"{type(e).__name__}: {e}"}
 
@@ -261,104 +1476,169 @@ def process_video(
     if not os.path.exists(video_path):
         return {"ok": False, "error": "Vídeo não encontrado."}
 
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
+    try:
+        total_frames, fps, w, h = _video_info(video_path)
+    except ValueError:
         return {"ok": False, "error": "Falha ao abrir vídeo."}
 
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
-    fps = float(cap.get(cv2.CAP_PROP_FPS) or 25.0)
-    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
-    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
-
     # coersões
     sample_fps = _coerce_float(sample_fps, 5.0)
     chunk_seconds = _coerce_int(chunk_seconds, 60)
     workers = _coerce_int(workers, 0)
+    batch_size = _coerce_int(kwargs.get("batch_size", YOLO_BATCH_SIZE), YOLO_BATCH_SIZE)
     save_annotated = bool(save_annotated)
+    progress_cb = kwargs.get("progress_cb")  # opcional: recebe dicts 'progress' (fila de jobs)
+    cancel, should_yield = kwargs.get("cancel"), kwargs.get("should_yield")
 
     line = _coerce_line(line if line is not None else line_norm)
     if line is None:
         return {"ok": False, "error": "Linha inválida (esperado x1,y1,x2,y2 normalizados)."}
+    try:
+        backend = detector.parse_backend(kwargs.get("backend"))
+        spec = zones.normalize_spec(zones.parse_spec(kwargs.get("lines"), kwargs.get("zones")), w, h)
+    except ValueError as e:
+        return {"ok": False, "error": str(e)}
 
     step = _estimate_every_n_frames(fps, sample_fps)
+    strategy = _choose_sampling_strategy(step, total_frames, kwargs.get("sampling", "auto"))
+    line, w, h = _frame_geometry(strategy, line, w, h)
 
     # Saídas
-    stamp = dt.datetime.now().strftime("%Y%m%d-%H%M%S")
-    base_out = os.path.join("outputs", stamp)
+    base_out = _new_output_dir()
     csv_path = os.path.join(base_out, "contagem.csv")
     annotated_path = None
 
     writer = None
+    annotated = None
     if save_annotated:
-        ensure_dirs(os.path.join(base_out, "video.mp4"))
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        writer = cv2.VideoWriter(os.path.join(base_out, "video.mp4"),
-                                 fourcc,
-                                 max(5.0, min(30.0, fps/step)),
-                                 (w, h))
         annotated_path = os.path.join(base_out, "video.mp4")
+        ensure_dirs(annotated_path)
+
+    def _open_writer():
+        # codificação em thread própria (H.264 via ffmpeg quando disponível). Aberto só na
+        # hora do uso: processos do pool criados antes não herdam o pipe do encoder.
+        if not save_annotated:
+            return None
+        return AsyncVideoWriter(annotated_path, max(5.0, min(30.0, fps/step)), (w, h),
+                                preset=kwargs.get("annotated_preset") or video_sink.ANNOTATED_PRESET)
+
+    counter = _make_counter(w, h, line, spec)
+    ranges = _plan_ranges(total_frames, fps, step, workers)
+    # gate só faz sentido com YOLO (o fallback não infere nada)
+    use_gate = bool(kwargs.get("motion_gate", motion_gate.MOTION_GATE)) and YOLO_AVAILABLE
+    use_roi = bool(kwargs.get("roi_crop", roi_crop.ROI_CROP)) and YOLO_AVAILABLE
+    cache_key = _detection_cache_key(video_path, kwargs.get("weights"), step, use_gate, use_roi,
+                                     counter.extent(), (w, h), backend) \
+        if kwargs.get("use_cache", True) else None
+    use_pipeline = bool(kwargs.get("pipeline", PIPELINE_MODE)) and YOLO_AVAILABLE
+    motion = roi_stats = pipeline = None
+    cached = detection_cache.load(cache_key) if cache_key else None
+    cache_meta = {"fps": fps, "total_frames": total_frames, "w": w, "h": h, "step": step,
+                  "weights": kwargs.get("weights") or DEFAULT_WEIGHTS, "backend": backend}
+    prof = StageProfile()
+
+    # o encoder (thread + ffmpeg) vive do 1º frame até o release(); qualquer saída antes
+    # disso (cancelamento, erro de decode/detector/IPC) o derruba e apaga o arquivo parcial
+    finished = False
+    try:
+        try:
+            if cached is not None or len(ranges) > 1:
+                if cached is not None:
+                    merged = _replay_detections(cached, w, h, line, spec)
+                    sampling = _new_sampling_stats("cache", step)
+                else:
+                    merged = _drain(_iter_chunked(video_path, line, step, strategy, total_frames, fps, w, h,
+                                                  ranges, workers, weights=kwargs.get("weights"), backend=backend,
+                                                  batch_size=batch_size, record=cache_key is not None,
+                                                  motion_gate=use_gate, roi_crop=use_roi, spec=spec,
+                                                  cancel=cancel, should_yield=should_yield, prof=prof),
+                                    progress_cb)
+                    sampling = merged["sampling"]
+                    motion, roi_stats = merged["motion"], merged["roi"]
+                    _save_detections(cache_key, merged["segments"], cache_meta)
+                events, multi = merged["events"], merged["multi"]
+                writer = _open_writer()
+                if writer is not None:
+                    _render_annotated(video_path, writer, step, strategy, total_frames, fps, counter, events, prof)
+            else:
+                recorder = DetectionRecorder() if cache_key else None
+                report: dict = {}
+                writer = _open_writer()
+                runner = _run_local(video_path, strategy, step, total_frames, fps, counter, line,
+                                    use_pipeline=use_pipeline, writer=writer, batch_size=batch_size,
+                                    recorder=recorder, use_gate=use_gate, use_roi=use_roi,
+                                    weights=kwargs.get("weights"), backend=backend, cancel=cancel,
+                                    should_yield=should_yield, report=report, prof=prof)
+                last_emit = 0.0
+                for idx in runner:
+                    now = time.time()
+                    if progress_cb is not None and now - last_emit > 0.25:
+                        progress_cb({
+                            "type": "progress",
+                            "pct": int(min(100, math.floor((idx+1)/max(1,total_frames)*100))),
+                            "in_partial": int(counter.in_count),
+                            "out_partial": int(counter.out_count),
+                        })
+                        last_emit = now
+                sampling, motion, roi_stats = report["sampling"], report["motion"], report["roi"]
+                pipeline = report.get("pipeline")
+                if recorder is not None:
+                    _save_detections(cache_key, [((0, 0, total_frames), recorder.to_arrays())], cache_meta)
+                events = counter.events
+                multi = _counter_export(counter, 0, 0)
+        except Cancelled:
+            prof.flush()
+            return {"ok": False, "cancelled": True, "error": "Processamento cancelado."}
 
-    counter = LineCounter(w, h, line)
-    frames_iter = _iterate_frames(cap, step)
-
-    if YOLO_AVAILABLE:
-        model = YOLO("yolov8n.pt")
-        runner = _run_yolo_track_frames(model, frames_iter, counter, writer=writer)
-    else:
-        runner = _fallback_dummy(frames_iter, counter, writer=writer)
-
-    # janelas simples por chunk_seconds
-    win_list: List[dict] = []
-    cur_start = 0.0
-    last_in = 0
-    last_out = 0
-
-    for idx in runner:
-        t = (idx / (fps or 1.0))
-        if (t - cur_start) >= max(1, int(chunk_seconds)):
-            win_list.append({
-                "start": _fmt_s(int(cur_start)),
-                "end": _fmt_s(int(t)),
-                "in": int(counter.in_count - last_in),
-                "out": int(counter.out_count - last_out),
-            })
-            cur_start = t
-            last_in = counter.in_count
-            last_out = counter.out_count
-
-    total_secs = int(total_frames / (fps or 1.0))
-    if (counter.in_count - last_in) != 0 or (counter.out_count - last_out) != 0 or not win_list:
-        win_list.append({
-            "start": _fmt_s(int(cur_start)),
-            "end": _fmt_s(int(total_secs)),
-            "in": int(counter.in_count - last_in),
-            "out": int(counter.out_count - last_out),
-        })
-
-    if writer is not None:
-        writer.release()
+        # log de cruzamentos -> janelas por chunk_seconds (outras granularidades via /report/windows)
+        ev = crossings.to_event_array(events, fps)
+        in_total, out_total = crossings.totals(ev)
+        duration_s = total_frames / (fps or 1.0)
+        win_list = crossings.aggregate_windows(ev, chunk_seconds, duration_s)
+        regions = zones.summarize(multi, counter, fps, duration_s, chunk_seconds) if spec else {}
+        events_path = os.path.join(base_out, "events.npz")
+        ensure_dirs(events_path)
+        with prof.stage("csv"):
+            crossings.save_events(events_path, ev, duration_s, fps)
+
+        if writer is not None:
+            with prof.stage("encode_drain"):  # espera o encoder esvaziar a fila
+                annotated = writer.release()
+        finished = True
+    finally:
+        if writer is not None and not finished:
+            writer.abort()
 
     ensure_dirs(csv_path)
-    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+    with prof.stage("csv"), open(csv_path, "w", newline="", encoding="utf-8") as f:
         wcsv = csv.writer(f, delimiter=';')
         wcsv.writerow(["start","end","in","out"])
         for wrow in win_list:
             wcsv.writerow([wrow["start"], wrow["end"], wrow["in"], wrow["out"]])
+    prof.flush()
 
     return {
         "ok": True,
-        "in_total": int(counter.in_count),
-        "out_total": int(counter.out_count),
-        "net_total": int(counter.in_count - counter.out_count),
+        "in_total": in_total,
+        "out_total": out_total,
+        "net_total": in_total - out_total,
         "windows": win_list,
         "csv_path": csv_path,
-        "annotated_path": annotated_path
+        "events_path": events_path,
+        "annotated_path": annotated_path,
+        "annotated": annotated,
+        "sampling": sampling,
+        "motion": motion,
+        "roi": roi_stats,
+        "pipeline": pipeline,
+        "backend": backend,
+        "detection_cache": "off" if cache_key is None else ("hit" if cached is not None else "miss"),
+        **regions,
+        **({"profile": prof.report()} if kwargs.get("profile") else {}),
     }
 
 # ---------- helpers ----------
-def _fmt_s(s: int) -> str:
-    s = int(max(0, s))
-    h = s // 3600
-    m = (s % 3600) // 60
-    sec = s % 60
-    return f"{h:02d}:{m:02d}:{sec:02d}"
+def _new_output_dir() -> str:
+    # sufixo aleatório evita colisão entre jobs iniciados no mesmo segundo
+    stamp = dt.datetime.now().strftime("%Y%m%d-%H%M%S")
+    return os.path.join("outputs", f"{stamp}-{uuid.uuid4().hex[:6]}")
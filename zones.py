@@ -0,0 +1,373 @@
+# zones.py
+# Várias linhas de contagem e zonas poligonais avaliadas sobre as mesmas detecções, numa
+# única passada de decode/inferência (o custo do YOLO não cresce com o nº de linhas).
+# Lados e pertinência aos polígonos são calculados com NumPy para todas as linhas/zonas
+# x todos os tracks do frame de uma vez; o estado por track fica em arrays compactos.
+#   linha: cruzamentos IN/OUT (mesma convenção do LineCounter: lado - -> + = IN);
+#          'bounded' só conta quem cruza dentro do segmento (portas lado a lado);
+#   zona : entradas/saídas, ocupação (tracks dentro) e permanência (saída - entrada).
+import json, math
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import crossings
+
+MAX_LINES = 16
+MAX_ZONES = 16
+MAX_POLY_POINTS = 64
+BOUNDED_MARGIN = 0.05  # folga (fração do comprimento) nas pontas de linhas 'bounded'
+PRIMARY_NAME = "principal"
+
+# ---------- especificação (request) ----------
+def _is_norm(vals) -> bool:
+    return max(abs(float(v)) for v in vals) <= 1.0001
+
+def _load(val):
+    if isinstance(val, str):
+        val = val.strip()
+        return json.loads(val) if val else None
+    return val
+
+def parse_spec(lines=None, zones=None) -> Optional[dict]:
+    """
+    Valida linhas extras e zonas vindas do request (listas ou JSON em string):
+      lines: [[x1,y1,x2,y2] | {"name", "line": [x1,y1,x2,y2], "bounded": bool}]
+      zones: [{"name", "polygon": [[x,y], ...]}]
+    Coordenadas normalizadas (0..1) ou em pixels do vídeo original. None = só a linha principal.
+    """
+    try:
+        lines, zones = _load(lines) or [], _load(zones) or []
+    except ValueError:
+        raise ValueError("lines/zones: JSON inválido.")
+    if not isinstance(lines, list) or not isinstance(zones, list):
+        raise ValueError("lines/zones devem ser listas.")
+    if len(lines) > MAX_LINES or len(zones) > MAX_ZONES:
+        raise ValueError(f"Máximo de {MAX_LINES} linhas e {MAX_ZONES} zonas.")
+    out_lines, out_zones = [], []
+    for k, item in enumerate(lines):
+        item = item if isinstance(item, dict) else {"line": item}
+        coords = item.get("line")
+        try:
+            coords = [float(v) for v in coords]
+        except (TypeError, ValueError):
+            coords = None
+        if not coords or len(coords) != 4:
+            raise ValueError(f"Linha {k + 1} inválida (x1,y1,x2,y2).")
+        out_lines.append({"name": str(item.get("name") or f"linha{k + 1}"), "line": coords,
+                          "bounded": bool(item.get("bounded", False))})
+    for k, item in enumerate(zones):
+        poly = item.get("polygon") if isinstance(item, dict) else item
+        try:
+            pts = [[float(x), float(y)] for x, y in poly]
+        except (TypeError, ValueError):
+            pts = []
+        if not (3 <= len(pts) <= MAX_POLY_POINTS):
+            raise ValueError(f"Zona {k + 1} inválida (polígono com 3 a {MAX_POLY_POINTS} pontos [x,y]).")
+        name = item.get("name") if isinstance(item, dict) else None
+        out_zones.append({"name": str(name or f"zona{k + 1}"), "polygon": pts})
+    if not out_lines and not out_zones:
+        return None
+    names = [PRIMARY_NAME] + [d["name"] for d in out_lines]
+    if len(set(names)) != len(names) or len({z["name"] for z in out_zones}) != len(out_zones):
+        raise ValueError("Nomes de linhas/zonas repetidos.")
+    return {"lines": out_lines, "zones": out_zones}
+
+def normalize_spec(spec: Optional[dict], w: int, h: int) -> Optional[dict]:
+    """Converte coordenadas em pixels (do vídeo original) para 0..1."""
+    if not spec or w <= 0 or h <= 0:
+        return spec
+    lines = []
+    for d in spec["lines"]:
+        x1, y1, x2, y2 = d["line"]
+        if not _is_norm(d["line"]):
+            x1, y1, x2, y2 = x1 / w, y1 / h, x2 / w, y2 / h
+        lines.append({**d, "line": [x1, y1, x2, y2]})
+    zones = []
+    for z in spec["zones"]:
+        flat = [v for p in z["polygon"] for v in p]
+        pts = z["polygon"] if _is_norm(flat) else [[x / w, y / h] for x, y in z["polygon"]]
+        zones.append({**z, "polygon": pts})
+    return {"lines": lines, "zones": zones}
+
+def _line_px(coords, w: int, h: int) -> Tuple[int, int, int, int]:
+    # mesma regra de normalize_line_to_pixels (yolo_counter)
+    x1, y1, x2, y2 = coords
+    if not _is_norm(coords):
+        return int(x1), int(y1), int(x2), int(y2)
+    return int(x1 * w), int(y1 * h), int(x2 * w), int(y2 * h)
+
+def points_in_polygon(px: np.ndarray, py: np.ndarray, poly: np.ndarray) -> np.ndarray:
+    """Ray casting vetorizado: (N,) pontos x (E,) arestas de uma vez."""
+    x0, y0 = poly[:, 0][:, None], poly[:, 1][:, None]
+    x1, y1 = np.roll(poly[:, 0], -1)[:, None], np.roll(poly[:, 1], -1)[:, None]
+    straddle = (y0 > py[None, :]) != (y1 > py[None, :])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xint = x0 + (py[None, :] - y0) * (x1 - x0) / (y1 - y0)
+    hits = straddle & (px[None, :] < xint)
+    return (np.count_nonzero(hits, axis=0) % 2) == 1
+
+# ---------- contador ----------
+class CounterSet:
+    """
+    Linha principal + linhas extras + zonas. Compatível com o LineCounter onde o pipeline
+    o usa (x1..y2/in_count/out_count/events referem-se à linha principal, update/forget/
+    extent); o resultado por linha/zona sai de export() + summarize().
+    """
+    def __init__(self, w: int, h: int, line_norm, spec: Optional[dict] = None):
+        self.spec = spec  # repassado aos processos do pipeline (gate/recorte)
+        spec = spec or {"lines": [], "zones": []}
+        self.w, self.h = w, h
+        self._live = False  # só há totais para desenhar depois de update()
+        lines = [{"name": PRIMARY_NAME, "line": list(line_norm), "bounded": False}] + spec["lines"]
+        self.line_names = [d["name"] for d in lines]
+        px = np.array([_line_px(d["line"], w, h) for d in lines], dtype=np.float64).reshape(-1, 4)
+        self.x1, self.y1, self.x2, self.y2 = (int(v) for v in px[0])
+        self._lx1, self._ly1 = px[:, 0][:, None], px[:, 1][:, None]
+        self._ldx, self._ldy = (px[:, 2] - px[:, 0])[:, None], (px[:, 3] - px[:, 1])[:, None]
+        self._len2 = np.maximum(self._ldx ** 2 + self._ldy ** 2, 1e-9)
+        self._bounded = np.array([bool(d.get("bounded")) for d in lines])[:, None]
+        self.lines_px = px.astype(int).tolist()
+        self.zone_names = [z["name"] for z in spec["zones"]]
+        self.polys = [np.array([[x * w, y * h] for x, y in z["polygon"]], dtype=np.float64)
+                      for z in spec["zones"]]
+        n_lines, n_zones = len(lines), len(self.polys)
+        # estado por track em linhas de arrays; linhas de tracks aposentados são reaproveitadas
+        self._row: Dict[int, int] = {}
+        self._free: List[int] = []
+        cap = 64
+        self._side = np.full((cap, n_lines), np.nan)
+        self._inside = np.zeros((cap, n_zones), dtype=bool)
+        self._entered = np.zeros((cap, n_zones), dtype=np.int64)
+        self._last_seen = np.zeros(cap, dtype=np.int64)
+        self._frame = -1  # frame do último update (instante das saídas por aposentadoria)
+        self.line_events: List[List[Tuple[int, int, int]]] = [[] for _ in range(n_lines)]
+        self.line_counts = np.zeros((n_lines, 2), dtype=np.int64)  # [in, out]
+        self.zone_events: List[List[Tuple[int, int, int]]] = [[] for _ in range(n_zones)]
+        self.dwell: List[List[Tuple[int, int, int]]] = [[] for _ in range(n_zones)]
+        self.occ = np.zeros(n_zones, dtype=np.int64)
+        self.occupancy: List[List[Tuple[int, int]]] = [[] for _ in range(n_zones)]
+
+    # compatibilidade com LineCounter (linha principal)
+    @property
+    def in_count(self) -> int:
+        return int(self.line_counts[0, 0])
+
+    @property
+    def out_count(self) -> int:
+        return int(self.line_counts[0, 1])
+
+    @property
+    def events(self) -> List[Tuple[int, int, int]]:
+        return self.line_events[0]
+
+    def extent(self) -> Tuple[int, int, int, int]:
+        """Caixa que envolve todas as linhas e zonas (região do gate/recorte)."""
+        pts = [np.array(self.lines_px, dtype=np.float64).reshape(-1, 2)] + self.polys
+        allp = np.concatenate(pts)
+        x0, y0 = np.floor(allp.min(axis=0)).astype(int)
+        x1, y1 = np.ceil(allp.max(axis=0)).astype(int)
+        return int(max(0, x0)), int(max(0, y0)), int(min(self.w, x1)), int(min(self.h, y1))
+
+    def _rows(self, ids: np.ndarray) -> np.ndarray:
+        rows = np.empty(len(ids), dtype=np.int64)
+        for k, tid in enumerate(ids.tolist()):
+            r = self._row.get(tid)
+            if r is None:
+                r = self._free.pop() if self._free else len(self._row)
+                if r >= len(self._last_seen):
+                    self._grow()
+                self._row[tid] = r
+            rows[k] = r
+        return rows
+
+    def _grow(self):
+        cap = 2 * len(self._last_seen)
+        self._side = np.vstack([self._side, np.full_like(self._side, np.nan)])[:cap]
+        self._inside = np.vstack([self._inside, np.zeros_like(self._inside)])[:cap]
+        self._entered = np.vstack([self._entered, np.zeros_like(self._entered)])[:cap]
+        self._last_seen = np.concatenate([self._last_seen, np.zeros_like(self._last_seen)])[:cap]
+
+    def update(self, ids: np.ndarray, cx: np.ndarray, cy: np.ndarray, frame_idx: int = -1):
+        """Todos os pontos (centroides dos tracks) de um frame contra todas as linhas/zonas."""
+        ids = np.asarray(ids, dtype=np.int64)
+        self._frame = int(frame_idx)
+        if not len(ids):
+            return
+        cx, cy = np.asarray(cx, dtype=np.float64), np.asarray(cy, dtype=np.float64)
+        self._live = True
+        rows = self._rows(ids)
+        self._last_seen[rows] = frame_idx
+        # (L, N): sinal do produto vetorial de cada linha para cada ponto
+        side = (cx[None, :] - self._lx1) * self._ldy - (cy[None, :] - self._ly1) * self._ldx
+        prev = self._side[rows].T
+        known = ~np.isnan(prev)
+        p = np.where(prev == 0, -1e-6, prev)
+        s = np.where(side == 0, 1e-6, side)
+        cross = known & (p * s < 0)
+        if self._bounded.any():
+            t = ((cx[None, :] - self._lx1) * self._ldx + (cy[None, :] - self._ly1) * self._ldy) / self._len2
+            inside_seg = (t >= -BOUNDED_MARGIN) & (t <= 1 + BOUNDED_MARGIN)
+            cross &= ~self._bounded | inside_seg
+        if cross.any():
+            for li, di in zip(*np.nonzero(cross)):
+                d = 1 if s[li, di] > 0 else -1
+                self.line_events[li].append((frame_idx, int(ids[di]), d))
+                self.line_counts[li, 0 if d > 0 else 1] += 1
+        self._side[rows] = np.where(known, s, side).T
+
+        for z, poly in enumerate(self.polys):
+            now_in = points_in_polygon(cx, cy, poly)
+            was_in = self._inside[rows, z]
+            enter, leave = now_in & ~was_in, was_in & ~now_in
+            if enter.any() or leave.any():
+                for di in np.flatnonzero(enter):
+                    self._entered[rows[di], z] = frame_idx
+                    self.zone_events[z].append((frame_idx, int(ids[di]), 1))
+                for di in np.flatnonzero(leave):
+                    self._exit(z, rows[di], int(ids[di]), frame_idx)
+                self._inside[rows, z] = now_in
+                self.occ[z] += int(enter.sum()) - int(leave.sum())
+                self.occupancy[z].append((frame_idx, int(self.occ[z])))
+
+    def _exit(self, z: int, row: int, tid: int, frame_idx: int, last_idx: Optional[int] = None):
+        last_idx = frame_idx if last_idx is None else last_idx
+        self.zone_events[z].append((frame_idx, tid, -1))
+        self.dwell[z].append((frame_idx, tid, int(last_idx - self._entered[row, z])))
+
+    def forget(self, track_ids):
+        """
+        Tracks aposentados: quem estava numa zona sai agora (o evento fica no frame do
+        último update, o da aposentadoria, como no modo por trechos) com permanência até
+        a última detecção.
+        """
+        frame_idx = self._frame
+        for tid in track_ids:
+            r = self._row.pop(int(tid), None)
+            if r is None:
+                continue
+            for z in np.flatnonzero(self._inside[r]):
+                self._exit(int(z), r, int(tid), frame_idx, int(self._last_seen[r]))
+                self.occ[z] -= 1
+                self.occupancy[z].append((frame_idx, int(self.occ[z])))
+            self._side[r] = np.nan
+            self._inside[r] = False
+            self._free.append(r)
+
+    def export(self, own_start: int = 0, gid: Optional[Callable[[int], int]] = None) -> dict:
+        """Eventos a partir de 'own_start' (fim do aquecimento), com ids globais opcionais."""
+        gid = gid or (lambda t: t)
+        zones = []
+        for z in range(len(self.polys)):
+            occ = [(i, n) for i, n in self.occupancy[z] if i >= own_start]
+            before = [n for i, n in self.occupancy[z] if i < own_start]
+            if before:  # ocupação herdada do aquecimento vale desde o início da faixa
+                occ.insert(0, (own_start, before[-1]))
+            zones.append({
+                "events": [(i, gid(t), d) for i, t, d in self.zone_events[z] if i >= own_start],
+                "dwell": [(i, gid(t), n) for i, t, n in self.dwell[z] if i >= own_start],
+                "occupancy": occ,
+            })
+        return {"lines": [[(i, gid(t), d) for i, t, d in ev if i >= own_start] for ev in self.line_events],
+                "zones": zones}
+
+    def draw(self, frame):
+        """Linhas extras e zonas com os totais correntes (a principal fica com _draw_overlays)."""
+        for k in range(1, len(self.lines_px)):
+            x1, y1, x2, y2 = self.lines_px[k]
+            cv2.line(frame, (x1, y1), (x2, y2), (31, 160, 230), 2)
+            if self._live:
+                cv2.putText(frame, f"{self.line_names[k]} {self.line_counts[k, 0]}/{self.line_counts[k, 1]}",
+                            (x1 + 4, max(14, y1 - 6)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (31, 160, 230), 1, cv2.LINE_AA)
+        for z, poly in enumerate(self.polys):
+            pts = poly.astype(np.int32).reshape(-1, 1, 2)
+            cv2.polylines(frame, [pts], True, (80, 200, 80), 2)
+            x, y = pts[0, 0]
+            if self._live:
+                cv2.putText(frame, f"{self.zone_names[z]}: {self.occ[z]}", (int(x) + 4, int(y) + 16),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (80, 200, 80), 1, cv2.LINE_AA)
+        return frame
+
+# ---------- agregação ----------
+def merge_exports(parts: List[dict]) -> Optional[dict]:
+    """Junta export() de trechos consecutivos (em ordem de início)."""
+    parts = [p for p in parts if p]
+    if not parts:
+        return None
+    out = {"lines": [[] for _ in parts[0]["lines"]],
+           "zones": [{"events": [], "dwell": [], "occupancy": []} for _ in parts[0]["zones"]]}
+    for p in parts:
+        for k, ev in enumerate(p["lines"]):
+            out["lines"][k] += ev
+        for z, zd in enumerate(p["zones"]):
+            for key in ("events", "dwell", "occupancy"):
+                out["zones"][z][key] += zd[key]
+    for ev in out["lines"]:
+        ev.sort(key=lambda e: e[0])
+    for zd in out["zones"]:
+        for key in ("events", "dwell"):
+            zd[key].sort(key=lambda e: e[0])
+    return out
+
+def _occupancy_windows(occ: List[Tuple[int, int]], fps: float, seconds: int, n: int,
+                       duration_s: float) -> Tuple[List[int], List[float]]:
+    """Máximo e média ponderada no tempo da ocupação (função degrau) por janela."""
+    fps = fps or 1.0
+    pts = sorted(occ)
+    t = np.array([i / fps for i, _ in pts], dtype=np.float64)
+    v = np.array([c for _, c in pts], dtype=np.float64)
+    mx, mean = [], []
+    for k in range(n):
+        a, b = k * seconds, min((k + 1) * seconds, max(duration_s, k * seconds + 1e-9))
+        j = np.searchsorted(t, a, side="right") - 1
+        cur = v[j] if j >= 0 else 0.0
+        inner = (t > a) & (t < b)
+        edges = np.concatenate([[a], t[inner], [b]])
+        vals = np.concatenate([[cur], v[inner]])
+        mx.append(int(vals.max()))
+        span = b - a
+        mean.append(round(float(np.sum(np.diff(edges) * vals) / span), 3) if span > 0 else float(cur))
+    return mx, mean
+
+def summarize(exported: Optional[dict], counter: CounterSet, fps: float, duration_s: float,
+              chunk_seconds: int) -> dict:
+    """Totais e janelas por linha e por zona (mesmas janelas de chunk_seconds do payload)."""
+    if not exported:
+        return {}
+    fps = fps or 1.0
+    lines = []
+    for k, rows in enumerate(exported["lines"]):
+        ev = crossings.to_event_array(rows, fps)
+        n_in, n_out = crossings.totals(ev)
+        lines.append({"name": counter.line_names[k], "line": counter.lines_px[k],
+                      "in_total": n_in, "out_total": n_out, "net_total": n_in - n_out,
+                      "windows": crossings.aggregate_windows(ev, chunk_seconds, duration_s)})
+    zones = []
+    for z, zd in enumerate(exported["zones"]):
+        ev = crossings.to_event_array(zd["events"], fps)
+        entries, exits = crossings.totals(ev)
+        windows = crossings.aggregate_windows(ev, chunk_seconds, duration_s)
+        seconds = max(1, int(chunk_seconds))
+        occ_max, occ_mean = _occupancy_windows(zd["occupancy"], fps, seconds, len(windows), duration_s)
+        dw = np.array([n for _, _, n in zd["dwell"]], dtype=np.float64) / fps
+        dw_t = np.array([i for i, _, _ in zd["dwell"]], dtype=np.float64) / fps
+        for k, win in enumerate(windows):
+            win["entries"], win["exits"] = win.pop("in"), win.pop("out")
+            win["occupancy_max"], win["occupancy_mean"] = occ_max[k], occ_mean[k]
+            sel = dw[(dw_t // seconds).astype(np.int64) == k] if len(dw) else dw
+            win["dwell_mean_s"] = round(float(sel.mean()), 2) if len(sel) else None
+        occ_vals = [c for _, c in zd["occupancy"]]
+        zones.append({
+            "name": counter.zone_names[z],
+            "polygon": counter.polys[z].round(1).tolist(),
+            "entries": entries,
+            "exits": exits,
+            "occupancy_max": max(occ_vals) if occ_vals else 0,
+            "occupancy_end": occ_vals[-1] if occ_vals else 0,
+            "dwell_mean_s": round(float(dw.mean()), 2) if len(dw) else None,
+            "dwell_median_s": round(float(np.median(dw)), 2) if len(dw) else None,
+            "dwell_max_s": round(float(dw.max()), 2) if len(dw) else None,
+            "windows": windows,
+        })
+    return {"lines": lines, "zones": zones}